@@ -115,6 +115,7 @@ setup(name=name,
         'bin/trytond-cron',
         'bin/trytond-worker',
         'bin/trytond-stat',
+        'bin/trytond-bench',
         ],
     classifiers=[
         'Development Status :: 5 - Production/Stable',
@@ -181,6 +182,8 @@ setup(name=name,
         'weasyprint': ['weasyprint'],
         'coroutine': ['gevent>=1.1'],
         'image': ['pillow'],
+        'orjson': ['orjson'],
+        'zstd': ['zstandard'],
         },
     dependency_links=dependency_links,
     zip_safe=False,
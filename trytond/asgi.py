@@ -0,0 +1,178 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import asyncio
+import logging
+import re
+import sys
+from io import BytesIO
+from urllib.parse import unquote
+
+try:
+    from http import HTTPStatus
+except ImportError:
+    from http import client as HTTPStatus
+
+from werkzeug.exceptions import (
+    HTTPException, MethodNotAllowed, NotFound, RequestEntityTooLarge,
+    Unauthorized)
+from werkzeug.exceptions import NotImplemented as NotImplementedException
+
+from trytond import bus
+from trytond.config import config
+from trytond.pool import Pool
+from trytond.protocols.jsonrpc import JSONRequest, dumps
+
+__all__ = ['application']
+
+logger = logging.getLogger(__name__)
+
+_bus_path = re.compile(r'^/(?P<database_name>[^/]+)/bus$')
+
+
+def _environ(scope, body):
+    "Return a WSGI environ from the ASGI scope and the body"
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/%s' % scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(len(body)),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        value = value.decode('latin1')
+        if name == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif name != 'CONTENT_LENGTH':
+            key = 'HTTP_%s' % name
+            if key in environ:
+                value = '%s,%s' % (environ[key], value)
+            environ[key] = value
+    return environ
+
+
+async def _read_body(receive, max_size):
+    body = b''
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        body += message.get('body', b'')
+        if max_size and len(body) > max_size:
+            raise RequestEntityTooLarge
+        if not message.get('more_body'):
+            return body
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def _send(send, status, body=b'', headers=None):
+    await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(k.encode('latin1'), v.encode('latin1'))
+                for k, v in (headers or [])],
+            })
+    await send({
+            'type': 'http.response.body',
+            'body': body,
+            })
+
+
+async def _subscribe(scope, receive, database_name):
+    if not bus._allow_subscribe:
+        raise NotImplementedException
+    if scope['method'] != 'POST':
+        raise MethodNotAllowed(valid_methods=['POST'])
+    max_size = config.getint('request', 'max_size_authenticated')
+    body = await _read_body(receive, max_size)
+    if body is None:
+        return
+    request = JSONRequest(_environ(scope, body))
+    request.view_args = {'database_name': database_name}
+    request.max_size = max_size
+
+    loop = asyncio.get_running_loop()
+    # The authentication queries the database
+    if not await loop.run_in_executor(None, lambda: request.user_id):
+        raise Unauthorized
+    user = request.authorization.get('userid')
+    channels = bus.user_channels(
+        user, request.parsed_data.get('channels', []))
+    last_message = request.parsed_data.get('last_message')
+
+    logger.debug(
+        "getting bus messages from %s@%s%s for %s since %s",
+        request.authorization.username, request.remote_addr, request.path,
+        channels, last_message)
+    subscribe = asyncio.ensure_future(bus.AsyncLongPollingBus.subscribe(
+            database_name, channels, last_message))
+    # Stop waiting for the messages when the client disconnects
+    disconnect = asyncio.ensure_future(_wait_disconnect(receive))
+    await asyncio.wait(
+        [subscribe, disconnect], return_when=asyncio.FIRST_COMPLETED)
+    if not subscribe.done():
+        subscribe.cancel()
+        return
+    disconnect.cancel()
+    return subscribe.result()
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            Pool.start()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    "ASGI application serving the bus"
+    if scope['type'] == 'lifespan':
+        await _lifespan(receive, send)
+        return
+    elif scope['type'] != 'http':
+        return
+    try:
+        match = _bus_path.match(scope['path'])
+        if not match:
+            raise NotFound
+        database_name = unquote(match.group('database_name'))
+        response = await _subscribe(scope, receive, database_name)
+    except HTTPException as exception:
+        code = exception.code
+        headers = [('Content-Type', 'text/plain')]
+        if code == HTTPStatus.UNAUTHORIZED:
+            headers.append(('WWW-Authenticate', 'Basic realm="Tryton"'))
+        await _send(send, code, HTTPStatus(code).phrase.encode(), headers)
+        return
+    except Exception:
+        logger.error("bus request on %s failed", scope['path'], exc_info=True)
+        await _send(send, HTTPStatus.INTERNAL_SERVER_ERROR)
+        return
+    if response is None:
+        # The client disconnected
+        return
+    await _send(send, HTTPStatus.OK, dumps(response),
+        [('Content-Type', 'application/json')])
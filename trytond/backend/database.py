@@ -33,13 +33,16 @@ class DatabaseInterface(object):
         raise NotImplementedError
 
     def get_connection(
-            self, autocommit, readonly=False, statement_timeout=None):
+            self, autocommit, readonly=False, statement_timeout=None,
+            min_lsn=None):
         '''Retrieve a connection on the database
 
         :param autocommit: a boolean to activate autocommit
         :param readonly: a boolean to specify if the transaction is readonly
         :param statement_timeout: an integer to specify in seconds the timeout
                                   applied on each statement
+        :param min_lsn: the minimal log sequence number that a replica must
+                        have replayed to be used
         '''
         raise NotImplementedError
 
@@ -50,6 +53,12 @@ class DatabaseInterface(object):
         '''
         raise NotImplementedError
 
+    def current_lsn(self, connection):
+        '''Return the log sequence number of the last write on the connection
+        or None if it is not used to route to replicas
+        '''
+        return None
+
     def reset_connection(self, connection, commit):
         '''Reset the connection session
 
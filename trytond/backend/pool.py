@@ -0,0 +1,240 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+
+__all__ = ['ConnectionPool', 'PoolError', 'PoolTimeoutError']
+
+logger = logging.getLogger(__name__)
+
+# The upper bounds in seconds of the histogram buckets
+BUCKETS = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, float('inf')]
+
+
+class PoolError(Exception):
+    pass
+
+
+class PoolTimeoutError(PoolError):
+    pass
+
+
+class _Waiter:
+    __slots__ = ('event', 'connection', 'created')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.connection = None
+        # If the waiter may create a new connection
+        self.created = False
+
+
+def histogram():
+    return {
+        'buckets': dict.fromkeys(map(str, BUCKETS), 0),
+        'count': 0,
+        'sum': 0,
+        }
+
+
+def observe(histogram, value):
+    "Add the value in seconds to the histogram"
+    bucket = BUCKETS[bisect.bisect_left(BUCKETS, value)]
+    histogram['buckets'][str(bucket)] += 1
+    histogram['count'] += 1
+    histogram['sum'] += value
+
+
+class ConnectionPool:
+    '''A thread-safe pool of connections
+
+    The threads waiting for a connection are served in arrival order.
+
+    connect: The function returning a new connection
+    reset: The function to reset a connection put back in the pool
+    check: The function to check the health of an idle connection
+    minconn: The number of connections to keep in the pool
+    maxconn: The maximum number of connections
+    timeout: The maximum number of seconds to wait for a connection
+    lifetime: The number of seconds after which a connection is replaced
+    check_interval: The number of seconds a connection may stay idle before
+        being checked
+    '''
+
+    def __init__(self, connect, reset=None, check=None, minconn=0,
+            maxconn=64, timeout=None, lifetime=None, check_interval=None):
+        self._connect = connect
+        self._reset = reset
+        self._check = check
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.lifetime = lifetime
+        self.check_interval = check_interval
+        self.closed = False
+        self._lock = threading.Lock()
+        # The connections with the time of their creation and their return
+        self._idle = deque()
+        # The connections checked out with the time of their creation and
+        # their checkout
+        self._used = {}
+        self._waiters = deque()
+        # The number of connections opened or being opened
+        self._size = 0
+        self.metrics = {
+            'size': 0,
+            'used': 0,
+            'waiting': 0,
+            'wait': histogram(),
+            'checkout': histogram(),
+            }
+        for _ in range(minconn):
+            self._size += 1
+            self._idle.append(self._new())
+        self._update_metrics()
+
+    def _update_metrics(self):
+        self.metrics['size'] = self._size
+        self.metrics['used'] = len(self._used)
+        self.metrics['waiting'] = len(self._waiters)
+
+    def _new(self):
+        "Return a new connection with its creation time"
+        try:
+            return self._connect(), time.monotonic(), time.monotonic()
+        except Exception:
+            with self._lock:
+                self._size -= 1
+                self._wake()
+            raise
+
+    def _expired(self, created_at):
+        return (self.lifetime is not None
+            and time.monotonic() - created_at > self.lifetime)
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def _wake(self):
+        "Let the first waiter create a connection if there is room"
+        if self.closed:
+            return
+        if self._waiters and self._size < self.maxconn:
+            self._size += 1
+            waiter = self._waiters.popleft()
+            waiter.created = True
+            waiter.event.set()
+
+    def getconn(self):
+        start = time.monotonic()
+        waiter = None
+        with self._lock:
+            if self.closed:
+                raise PoolError("connection pool is closed")
+            if self._waiters:
+                item = None
+            elif self._idle:
+                item = self._idle.pop()
+            elif self._size < self.maxconn:
+                self._size += 1
+                item = True
+            else:
+                item = None
+            if item is None:
+                waiter = _Waiter()
+                self._waiters.append(waiter)
+                self._update_metrics()
+        if waiter:
+            if not waiter.event.wait(self.timeout):
+                with self._lock:
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        # The waiter has been served meanwhile
+                        pass
+                    else:
+                        self._update_metrics()
+                        raise PoolTimeoutError(
+                            "no connection available after %ss"
+                            % self.timeout)
+            if waiter.connection:
+                item = waiter.connection
+            elif waiter.created:
+                item = True
+            else:
+                # The waiter has been woken by closeall
+                raise PoolError("connection pool is closed")
+        while True:
+            if item is True:
+                # A new connection is neither expired nor unhealthy
+                connection, created_at, _ = self._new()
+                break
+            connection, created_at, returned_at = item
+            if self._expired(created_at):
+                self._discard(connection)
+                item = True
+                continue
+            if (self._check
+                    and self.check_interval is not None
+                    and time.monotonic() - returned_at > self.check_interval):
+                try:
+                    self._check(connection)
+                except Exception:
+                    logger.info("discard unhealthy connection", exc_info=True)
+                    self._discard(connection)
+                    item = True
+                    continue
+            break
+        with self._lock:
+            self._used[connection] = (created_at, time.monotonic())
+            observe(self.metrics['wait'], time.monotonic() - start)
+            self._update_metrics()
+        return connection
+
+    def putconn(self, connection, close=False):
+        with self._lock:
+            try:
+                created_at, checkout_at = self._used.pop(connection)
+            except KeyError:
+                raise PoolError("connection not from the pool")
+            observe(self.metrics['checkout'], time.monotonic() - checkout_at)
+        if not close and not self.closed and self._reset:
+            try:
+                self._reset(connection)
+            except Exception:
+                logger.info("discard connection failing reset", exc_info=True)
+                close = True
+        if (close or self.closed or self._expired(created_at)
+                or getattr(connection, 'closed', False)):
+            self._discard(connection)
+            connection = None
+        with self._lock:
+            if connection is None:
+                self._size -= 1
+                self._wake()
+            elif self._waiters:
+                waiter = self._waiters.popleft()
+                waiter.connection = (connection, created_at, time.monotonic())
+                waiter.event.set()
+            else:
+                self._idle.append(
+                    (connection, created_at, time.monotonic()))
+            self._update_metrics()
+
+    def closeall(self):
+        with self._lock:
+            self.closed = True
+            idle, self._idle = self._idle, deque()
+            self._size -= len(idle)
+            waiters, self._waiters = self._waiters, deque()
+            for waiter in waiters:
+                waiter.event.set()
+            self._update_metrics()
+        for connection, _, _ in idle:
+            self._discard(connection)
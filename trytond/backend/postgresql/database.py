@@ -9,7 +9,7 @@ import warnings
 from collections import defaultdict
 from datetime import datetime
 from decimal import Decimal
-from itertools import chain, repeat
+from itertools import chain, count, repeat
 from threading import RLock
 
 try:
@@ -20,9 +20,9 @@ except ImportError:
 
 from psycopg2 import Binary, connect
 from psycopg2.extensions import (
-    ISOLATION_LEVEL_REPEATABLE_READ, ISOLATION_LEVEL_AUTOCOMMIT, UNICODE, AsIs,
+    ISOLATION_LEVEL_REPEATABLE_READ, ISOLATION_LEVEL_AUTOCOMMIT,
+    TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN, UNICODE, AsIs,
     cursor, register_adapter, register_type)
-from psycopg2.pool import PoolError, ThreadedConnectionPool
 from psycopg2.sql import SQL, Identifier
 
 try:
@@ -44,7 +44,9 @@ from sql.conditionals import Coalesce
 from sql.functions import Function
 from sql.operators import BinaryOperator, Concat
 
+from trytond import status
 from trytond.backend.database import DatabaseInterface, SQLType
+from trytond.backend.pool import ConnectionPool, PoolError
 from trytond.config import config, parse_uri
 from trytond.tools.gevent import is_gevent_monkey_patched
 
@@ -59,10 +61,21 @@ os.environ['PGTZ'] = os.environ.get('TZ', '')
 _timeout = config.getint('database', 'timeout')
 _minconn = config.getint('database', 'minconn', default=1)
 _maxconn = config.getint('database', 'maxconn', default=64)
+_pool_timeout = config.getint('database', 'pool_timeout', default=30)
+_pool_lifetime = config.getint('database', 'pool_lifetime', default=0)
+_pool_check = config.getint('database', 'pool_check', default=60)
+_external_pooler = config.getboolean(
+    'database', 'external_pooler', default=False)
 _default_name = config.get('database', 'default_name', default='template1')
 _slow_threshold = config.getfloat('database', 'log_time_threshold', default=-1)
 _slow_logging_enabled = _slow_threshold > 0 and logger.isEnabledFor(
     logging.WARNING)
+_replica_uris = list(filter(
+        None, config.get('database', 'replica_uri', default='').splitlines()))
+_replica_lag = config.getfloat('database', 'replica_lag', default=10)
+_replica_retry = config.getint('database', 'replica_retry', default=30)
+# The minimal number of seconds between two checks of a replica status
+_replica_check = 1
 
 
 def unescape_quote(s):
@@ -195,6 +208,103 @@ class JSONContains(BinaryOperator):
     _operator = '@>'
 
 
+def _reset_connection(connection):
+    status = connection.get_transaction_status()
+    if status == TRANSACTION_STATUS_UNKNOWN:
+        raise PoolError("connection lost")
+    elif status != TRANSACTION_STATUS_IDLE:
+        connection.rollback()
+
+
+def _check_connection(connection):
+    cursor = connection.cursor()
+    cursor.execute('SELECT 1')
+    connection.rollback()
+
+
+def connection_pool(name, params, minconn):
+    "Return a pool of connections with its metrics in the status"
+    pool = ConnectionPool(
+        lambda: connect(**params, cursor_factory=LoggingCursor),
+        reset=_reset_connection, check=_check_connection,
+        minconn=minconn, maxconn=_maxconn, timeout=_pool_timeout,
+        lifetime=_pool_lifetime or None, check_interval=_pool_check)
+    status.metrics['pool %s' % name] = pool.metrics
+    return pool
+
+
+def parse_lsn(lsn):
+    "Return the integer value of the textual LSN"
+    high, low = lsn.split('/')
+    return (int(high, 16) << 32) + int(low, 16)
+
+
+class Replica:
+    "A streaming replica of a database"
+
+    def __init__(self, name, uri):
+        self.name = name
+        self.uri = uri
+        self.pool = None
+        self.lsn = 0
+        self.lag = 0
+        self.checked_at = None
+        self.down_until = 0
+
+    def __repr__(self):
+        return '<%s %s>' % (
+            self.__class__.__name__, parse_uri(self.uri).netloc)
+
+    @property
+    def available(self):
+        return self.down_until <= time.monotonic()
+
+    def getconn(self):
+        if self.pool is None:
+            self.pool = connection_pool(
+                '%s@%s' % (self.name, parse_uri(self.uri).hostname),
+                Database._connection_params(self.name, uri=self.uri), 0)
+        return self.pool.getconn()
+
+    def putconn(self, connection, close=False):
+        try:
+            self.pool.putconn(connection, close=close)
+        except PoolError:
+            # When cleaning up, the pool may already be closed
+            pass
+
+    def check(self, connection, min_lsn=None):
+        "Update the replayed LSN and the lag if they may be outdated"
+        if (self.checked_at is not None
+                and time.monotonic() - self.checked_at < _replica_check
+                and (not min_lsn or self.lsn >= min_lsn)):
+            return
+        cursor = connection.cursor()
+        # The lag is null when all the received WAL has been replayed
+        cursor.execute('SELECT pg_last_wal_replay_lsn(), '
+            'CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() '
+            'THEN 0 '
+            'ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) '
+            'END')
+        lsn, lag = cursor.fetchone()
+        connection.rollback()
+        self.lsn = parse_lsn(lsn) if lsn else 0
+        self.lag = float(lag or 0)
+        self.checked_at = time.monotonic()
+
+    def disable(self):
+        "Remove the replica from the rotation for some time"
+        self.down_until = time.monotonic() + _replica_retry
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.closeall()
+            status.metrics.pop(
+                'pool %s@%s' % (self.name, parse_uri(self.uri).hostname),
+                None)
+            self.pool = None
+
+
 class Database(DatabaseInterface):
 
     _lock = RLock()
@@ -228,7 +338,8 @@ class Database(DatabaseInterface):
             for database in list(databases.values()):
                 if ((now - database._last_use).total_seconds() > _timeout
                         and database.name != name
-                        and not database._connpool._used):
+                        and not database._connpool._used
+                        and not database._replica_connections):
                     database.close()
             if name in databases:
                 inst = databases[name]
@@ -239,15 +350,21 @@ class Database(DatabaseInterface):
                     minconn = _minconn
                 inst = DatabaseInterface.__new__(cls, name=name)
                 try:
-                    inst._connpool = ThreadedConnectionPool(
-                        minconn, _maxconn, **cls._connection_params(name),
-                        cursor_factory=LoggingCursor)
+                    inst._connpool = connection_pool(
+                        name, cls._connection_params(name), minconn)
                 except Exception:
                     logger.error(
                         'connection to "%s" failed', name, exc_info=True)
                     raise
                 else:
                     logger.info('connection to "%s" succeeded', name)
+                if name == _default_name:
+                    inst._replicas = []
+                else:
+                    inst._replicas = [
+                        Replica(name, uri) for uri in _replica_uris]
+                inst._replica_connections = {}
+                inst._replica_counter = count()
                 databases[name] = inst
             inst._last_use = datetime.now()
             return inst
@@ -256,9 +373,9 @@ class Database(DatabaseInterface):
         super(Database, self).__init__(name)
 
     @classmethod
-    def _connection_params(cls, name):
+    def _connection_params(cls, name, uri=None):
         # JCA: psycopg2cff does not support mixing dsn and other parameters
-        uri = parse_uri(config.get('database', 'uri'))
+        uri = parse_uri(uri or config.get('database', 'uri'))
         qs = urllib.parse.parse_qs(uri.query)
         qs['fallback_application_name'] = os.environ.get(
             'TRYTOND_APPNAME', 'trytond')
@@ -274,16 +391,18 @@ class Database(DatabaseInterface):
         return self
 
     def get_connection(
-            self, autocommit=False, readonly=False, statement_timeout=None):
-        for count in range(config.getint('database', 'retry'), -1, -1):
+            self, autocommit=False, readonly=False, statement_timeout=None,
+            min_lsn=None):
+        conn = None
+        if readonly and not autocommit and self._replicas:
+            conn = self._get_replica_connection(min_lsn)
+        if conn is None:
             try:
                 conn = self._connpool.getconn()
-                break
             except PoolError:
-                if count and not self._connpool.closed:
-                    logger.info('waiting a connection')
-                    time.sleep(1)
-                    continue
+                logger.warning(
+                    'no connection available to "%s"', self.name,
+                    exc_info=True)
                 raise
             except Exception:
                 logger.error(
@@ -298,7 +417,8 @@ class Database(DatabaseInterface):
             conn.set_isolation_level(ISOLATION_LEVEL_REPEATABLE_READ)
         statements = []
         # psycopg2cffi does not have the readonly property
-        if hasattr(conn, 'readonly'):
+        # and it is a session state in autocommit
+        if hasattr(conn, 'readonly') and not _external_pooler:
             conn.readonly = readonly
         elif not autocommit and readonly:
             statements.append('SET TRANSACTION READ ONLY')
@@ -310,17 +430,70 @@ class Database(DatabaseInterface):
             cursor.execute(';'.join(statements))
         return conn
 
+    def _get_replica_connection(self, min_lsn=None):
+        "Return a connection to a replica which replayed min_lsn or None"
+        replicas = [r for r in self._replicas if r.available]
+        if not replicas:
+            return
+        start = next(self._replica_counter)
+        for i in range(len(replicas)):
+            replica = replicas[(start + i) % len(replicas)]
+            try:
+                conn = replica.getconn()
+            except Exception:
+                logger.warning(
+                    'connection to replica %s of "%s" failed',
+                    replica, self.name, exc_info=True)
+                replica.disable()
+                continue
+            try:
+                replica.check(conn, min_lsn)
+            except Exception:
+                logger.warning(
+                    'check of replica %s of "%s" failed',
+                    replica, self.name, exc_info=True)
+                replica.putconn(conn, close=True)
+                replica.disable()
+                continue
+            if replica.lag > _replica_lag:
+                logger.warning(
+                    'replica %s of "%s" lags by %ss',
+                    replica, self.name, replica.lag)
+                replica.putconn(conn)
+                replica.disable()
+                continue
+            if min_lsn and replica.lsn < min_lsn:
+                replica.putconn(conn)
+                continue
+            self._replica_connections[conn] = replica
+            return conn
+
     def put_connection(self, connection, close=False):
+        replica = self._replica_connections.pop(connection, None)
+        if replica:
+            replica.putconn(connection, close=close)
+            return
         try:
             self._connpool.putconn(connection, close=close)
         except PoolError:
             # When cleaning up, the pool may already be closed
             pass
 
+    def current_lsn(self, connection):
+        if not self._replicas:
+            return
+        cursor = connection.cursor()
+        cursor.execute('SELECT pg_current_wal_lsn()')
+        lsn, = cursor.fetchone()
+        return parse_lsn(lsn)
+
     def close(self):
         with self._lock:
             logger.info('disconnection from "%s"', self.name)
             self._connpool.closeall()
+            status.metrics.pop('pool %s' % self.name, None)
+            for replica in self._replicas:
+                replica.close()
             self._databases[os.getpid()].pop(self.name)
 
     @classmethod
@@ -753,7 +926,8 @@ class Database(DatabaseInterface):
         return cursor.fetchone()[0]
 
     def has_channel(self):
-        return True
+        # LISTEN is a session state lost by transaction-level poolers
+        return not _external_pooler
 
     def json_get(self, column, key=None):
         column = Cast(column, 'jsonb')
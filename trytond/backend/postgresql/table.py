@@ -457,6 +457,75 @@ class TableHandler(TableHandlerInterface):
             else:
                 raise Exception('Index action not supported!')
 
+    def history_trigger_action(self, columns, update_columns, action='add'):
+        history = self.table_name + '__history'
+        function = self.convert_name(history + '_trigger')
+        triggers = {
+            'INSERT': self.convert_name(history + '_insert'),
+            'UPDATE': self.convert_name(history + '_update'),
+            }
+        with Transaction().connection.cursor() as cursor:
+            cursor.execute("SELECT t.tgname "
+                "FROM pg_trigger t "
+                    "JOIN pg_class cl ON (cl.oid = t.tgrelid) "
+                    "JOIN pg_namespace n ON (cl.relnamespace = n.oid) "
+                "WHERE cl.relname = %s AND n.nspname = %s",
+                (self.table_name, self.table_schema))
+            existing = {t for t, in cursor}
+            for trigger in triggers.values():
+                if trigger in existing:
+                    cursor.execute(SQL('DROP TRIGGER {} ON {}').format(
+                            Identifier(trigger),
+                            Identifier(self.table_name)))
+            if action == 'add':
+                # The setters update the row written by the same write, so
+                # its history row is updated instead of adding another one
+                cursor.execute(SQL(
+                        'CREATE OR REPLACE FUNCTION {function}() '
+                        'RETURNS trigger AS $$ '
+                        'BEGIN '
+                        'IF TG_OP = \'UPDATE\' THEN '
+                        'UPDATE {history} SET ({columns}) = ROW({values}) '
+                        'WHERE "id" = NEW."id" '
+                        'AND "write_date" IS NOT DISTINCT FROM '
+                        'NEW."write_date"; '
+                        'IF FOUND THEN RETURN NULL; END IF; '
+                        'END IF; '
+                        'INSERT INTO {history} ({columns}) '
+                        'VALUES ({values}); '
+                        'RETURN NULL; '
+                        'END; '
+                        '$$ LANGUAGE plpgsql').format(
+                        function=Identifier(function),
+                        history=Identifier(history),
+                        columns=SQL(',').join(map(Identifier, columns)),
+                        values=SQL(',').join(
+                            SQL('NEW.{}').format(Identifier(c))
+                            for c in columns)))
+                cursor.execute(SQL(
+                        'CREATE TRIGGER {trigger} AFTER INSERT ON {table} '
+                        'FOR EACH ROW EXECUTE PROCEDURE {function}()').format(
+                        trigger=Identifier(triggers['INSERT']),
+                        table=Identifier(self.table_name),
+                        function=Identifier(function)))
+                cursor.execute(SQL(
+                        'CREATE TRIGGER {trigger} '
+                        'AFTER UPDATE OF {columns} ON {table} '
+                        'FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*) '
+                        'EXECUTE PROCEDURE {function}()').format(
+                        trigger=Identifier(triggers['UPDATE']),
+                        columns=SQL(',').join(
+                            map(Identifier, update_columns)),
+                        table=Identifier(self.table_name),
+                        function=Identifier(function)))
+            elif action == 'remove':
+                if existing & set(triggers.values()):
+                    cursor.execute(
+                        SQL('DROP FUNCTION IF EXISTS {}()').format(
+                            Identifier(function)))
+            else:
+                raise Exception('History trigger action not supported!')
+
     def not_null_action(self, column_name, action='add'):
         if not self.column_exist(column_name):
             return
@@ -19,8 +19,8 @@ from weakref import WeakKeyDictionary
 from sql import Expression, Flavor, Literal, Null, Query, Table
 from sql.conditionals import NullIf
 from sql.functions import (
-    CharLength, CurrentTimestamp, Extract, Function, Overlay, Position,
-    Substring, Trim)
+    CharLength, CurrentTimestamp, Extract, Function, OctetLength, Overlay,
+    Position, Substring, Trim)
 from werkzeug.security import safe_join
 
 from trytond.backend.database import DatabaseInterface, SQLType
@@ -217,6 +217,11 @@ class SQLiteCharLength(Function):
     _function = 'LENGTH'
 
 
+class SQLiteOctetLength(Function):
+    __slots__ = ()
+    _function = 'LENGTH'
+
+
 class SQLiteCurrentTimestamp(Function):
     __slots__ = ()
     _function = 'NOW'  # More precise
@@ -303,6 +308,7 @@ MAPPING = {
     Substring: SQLiteSubstring,
     Overlay: SQLiteOverlay,
     CharLength: SQLiteCharLength,
+    OctetLength: SQLiteOctetLength,
     CurrentTimestamp: SQLiteCurrentTimestamp,
     Trim: SQLiteTrim,
     }
@@ -449,7 +455,8 @@ class Database(DatabaseInterface):
         return db_uri.replace('sqlite', 'file', 1)
 
     def get_connection(
-            self, autocommit=False, readonly=False, statement_timeout=None):
+            self, autocommit=False, readonly=False, statement_timeout=None,
+            min_lsn=None):
         if self._conn is None:
             self.connect()
         if autocommit:
@@ -331,6 +331,58 @@ class TableHandler(TableHandlerInterface):
         else:
             raise Exception('Index action not supported!')
 
+    def history_trigger_action(self, columns, update_columns, action='add'):
+        history = self.table_name + '__history'
+        triggers = {
+            'INSERT': history + '_insert',
+            'UPDATE OF %s' % ','.join(
+                _escape_identifier(c) for c in update_columns): (
+                history + '_update'),
+            }
+        cursor = Transaction().connection.cursor()
+        for trigger in triggers.values():
+            cursor.execute(
+                'DROP TRIGGER IF EXISTS %s' % _escape_identifier(trigger))
+        if action == 'add':
+            history = _escape_identifier(history)
+            names = ','.join(_escape_identifier(c) for c in columns)
+            values = ','.join('NEW.' + _escape_identifier(c) for c in columns)
+            insert = 'INSERT INTO %s (%s) VALUES (%s);' % (
+                history, names, values)
+            for event, trigger in triggers.items():
+                if event == 'INSERT':
+                    when, body = '', insert
+                else:
+                    when = 'WHEN %s ' % ' OR '.join(
+                        'OLD.%s IS NOT NEW.%s' % (c, c)
+                        for c in map(_escape_identifier, columns))
+                    # The setters update the row written by the same write,
+                    # so its history row is updated instead of adding another
+                    # one
+                    match = (
+                        '"id" = NEW."id" AND "write_date" IS NEW."write_date"')
+                    body = (
+                        'UPDATE %(history)s SET (%(names)s) = (%(values)s) '
+                        'WHERE %(match)s; '
+                        'INSERT INTO %(history)s (%(names)s) '
+                        'SELECT %(values)s WHERE NOT EXISTS ('
+                        'SELECT 1 FROM %(history)s WHERE %(match)s);' % {
+                            'history': history,
+                            'names': names,
+                            'values': values,
+                            'match': match,
+                            })
+                cursor.execute(
+                    'CREATE TRIGGER %s AFTER %s ON %s FOR EACH ROW %s'
+                    'BEGIN %s END' % (
+                        _escape_identifier(trigger),
+                        event,
+                        _escape_identifier(self.table_name),
+                        when,
+                        body))
+        elif action != 'remove':
+            raise Exception('History trigger action not supported!')
+
     def not_null_action(self, column_name, action='add'):
         if not self.column_exist(column_name):
             return
@@ -159,6 +159,17 @@ class TableHandlerInterface(object):
         '''
         raise NotImplementedError
 
+    def history_trigger_action(self, columns, update_columns, action='add'):
+        '''
+        Add/remove the triggers filling the history table
+
+        :param columns: the list of column names copied into the history
+        :param update_columns: the list of column names of which the update
+            fills the history
+        :param action: 'add' or 'remove'
+        '''
+        raise NotImplementedError
+
     def not_null_action(self, column_name, action='add'):
         '''
         Add/remove a "not null"
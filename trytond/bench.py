@@ -0,0 +1,247 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import argparse
+import datetime as dt
+import json
+import math
+import multiprocessing
+import os
+import signal
+import time
+from decimal import Decimal
+
+from sql import Null
+from sql.aggregate import Count
+
+from trytond import worker
+from trytond.bus import _MessageQueue
+from trytond.config import config
+from trytond.pool import Pool
+from trytond.protocols import jsonrpc as jsonrpc_
+from trytond.transaction import Transaction
+
+QUEUE_NAME = 'bench'
+
+
+def percentiles(values, ps=(50, 90, 99, 100)):
+    "Return the nearest-rank percentiles of the values"
+    values = sorted(values)
+    if not values:
+        return [0 for _ in ps]
+    return [values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+        for p in ps]
+
+
+def format_latencies(values, unit='ms'):
+    "Format the percentiles of the seconds in the unit"
+    scale = {'ms': 1e3, 'us': 1e6}[unit]
+    return ' '.join(
+        '%s %.1f%s' % (n, v * scale, unit) for n, v in zip(
+            ['p50', 'p90', 'p99', 'max'], percentiles(values)))
+
+
+def _reset(database_name):
+    "Remove the benchmark tasks"
+    pool = Pool(database_name)
+    Queue = pool.get('ir.queue')
+    queue = Queue.__table__()
+    with Transaction().start(database_name, 0) as transaction:
+        transaction.connection.cursor().execute(
+            *queue.delete(where=queue.name == QUEUE_NAME))
+
+
+def _enqueue(database_name, tasks, size):
+    "Push the tasks and return the elapsed seconds"
+    pool = Pool(database_name)
+    Lang = pool.get('ir.lang')
+    start = time.perf_counter()
+    with Transaction().start(database_name, 0,
+            context={'queue_name': QUEUE_NAME}):
+        langs = Lang.search([])
+        for i in range(tasks):
+            instances = [langs[(i + j) % len(langs)] for j in range(size)]
+            Lang.__queue__.read(instances, ['code'])
+    return time.perf_counter() - start
+
+
+def _pull(database_name):
+    "Pull the tasks one by one, requeue them and return the latencies"
+    pool = Pool(database_name)
+    Queue = pool.get('ir.queue')
+    queue = Queue.__table__()
+    latencies = []
+    with Transaction().start(database_name, 0) as transaction:
+        database = transaction.database
+        connection = database.get_connection(autocommit=True)
+        try:
+            while True:
+                start = time.perf_counter()
+                task_ids, _ = Queue.pull(
+                    database, connection, name=QUEUE_NAME)
+                if not task_ids:
+                    break
+                latencies.append(time.perf_counter() - start)
+        finally:
+            database.put_connection(connection)
+        transaction.connection.cursor().execute(*queue.update(
+                [queue.dequeued_at, queue.enqueued_at],
+                [Null, dt.datetime.now()],
+                where=queue.name == QUEUE_NAME))
+    return latencies
+
+
+def _count_done(database_name):
+    pool = Pool(database_name)
+    Queue = pool.get('ir.queue')
+    queue = Queue.__table__()
+    with Transaction().start(
+            database_name, 0, readonly=True) as transaction:
+        cursor = transaction.connection.cursor()
+        cursor.execute(*queue.select(Count(queue.id),
+                where=(queue.name == QUEUE_NAME)
+                & ((queue.finished_at != Null) | (queue.failed_at != Null))))
+        count, = cursor.fetchone()
+    return count
+
+
+def _latencies(database_name):
+    "Return the seconds between enqueue and finish of the tasks"
+    pool = Pool(database_name)
+    Queue = pool.get('ir.queue')
+    with Transaction().start(database_name, 0, readonly=True):
+        tasks = Queue.search([
+                ('name', '=', QUEUE_NAME),
+                ('finished_at', '!=', None),
+                ])
+        return [(t.finished_at - t.enqueued_at).total_seconds()
+            for t in tasks]
+
+
+def _work(database_name, processes, options):
+    "Run the tasks with the worker and return the elapsed seconds"
+    worker_options = argparse.Namespace(
+        database_names=[database_name],
+        name=QUEUE_NAME,
+        processes=processes,
+        maxtasksperchild=None,
+        timeout=1,
+        preload=options.preload)
+    process = multiprocessing.get_context('fork').Process(
+        target=worker.work, args=(worker_options,))
+    start = time.perf_counter()
+    process.start()
+    try:
+        while _count_done(database_name) < options.tasks:
+            if not process.is_alive():
+                raise RuntimeError("worker stopped")
+            if time.perf_counter() - start > options.timeout:
+                raise TimeoutError("tasks not finished in time")
+            time.sleep(0.05)
+        return time.perf_counter() - start
+    finally:
+        # The worker closes its pool on keyboard interrupt
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGINT)
+        process.join()
+
+
+def queue(options):
+    database_name = options.database_name
+    pool = Pool(database_name)
+    with Transaction().start(database_name, 0, readonly=True):
+        pool.init()
+
+    print("queue: %d tasks of %d instances" % (options.tasks, options.size))
+    for processes in options.processes:
+        _reset(database_name)
+        elapsed = _enqueue(database_name, options.tasks, options.size)
+        print("enqueue: %.2fs (%.1f tasks/s)" % (
+                elapsed, options.tasks / elapsed))
+        print("pull: %s" % format_latencies(_pull(database_name)))
+        elapsed = _work(database_name, processes, options)
+        print("%d processes: %.2fs (%.1f tasks/s) latency %s" % (
+                processes, elapsed, options.tasks / elapsed,
+                format_latencies(_latencies(database_name))))
+    _reset(database_name)
+
+
+def _rows(count):
+    "Return rows like the result of read"
+    now = dt.datetime.now()
+    return [{
+            'id': i,
+            'rec_name': 'Record %s' % i,
+            'code': 'R%06d' % i,
+            'active': bool(i % 2),
+            'date': now.date(),
+            'create_date': now,
+            'amount': Decimal('%s.%02d' % (i, i % 100)),
+            'quantity': i / 3,
+            'party': i % 100,
+            'party.': {'id': i % 100, 'rec_name': 'Party %s' % (i % 100)},
+            'lines': list(range(i % 10)),
+            'data': None,
+            } for i in range(count)]
+
+
+def _measure(func, repeat):
+    "Return the latencies of calling func"
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def jsonrpc(options):
+    response = {'id': 0, 'result': _rows(options.rows)}
+
+    def standard():
+        return json.dumps(
+            response, cls=jsonrpc_.JSONEncoder, separators=(',', ':'))
+
+    def chunks():
+        return b''.join(jsonrpc_.iterdumps(response))
+
+    print("jsonrpc: %d rows, orjson %s" % (
+            options.rows, 'enabled' if jsonrpc_.orjson else 'missing'))
+    print("json: %s" % format_latencies(_measure(standard, options.repeat)))
+    print("iterdumps: %s" % format_latencies(
+            _measure(chunks, options.repeat)))
+
+
+def _fill(messages, subscribers, count):
+    "Append count messages spread over the subscribers"
+    for i in range(count):
+        messages.append('user:%s' % (i % subscribers), {
+                'message_id': i,
+                'type': 'notification',
+                })
+
+
+def bus(options):
+    timeout = options.timeout or config.getint('bus', 'cache_timeout')
+    print("bus: %ds of messages, %d subscriptions" % (
+            timeout, options.repeat))
+    for subscribers in options.subscribers:
+        for rate in options.rate:
+            count = rate * timeout
+            messages = _MessageQueue(timeout)
+            start = time.perf_counter()
+            _fill(messages, subscribers, count)
+            elapsed = time.perf_counter() - start
+
+            latencies = []
+            for i in range(options.repeat):
+                subscriber = i % subscribers
+                channels = {'user:%s' % subscriber, 'client:%s' % subscriber}
+                # The message before the last one of the subscriber
+                last_message = count - 1 - (
+                    (count - 1 - subscriber) % subscribers) - subscribers
+                start = time.perf_counter()
+                messages.get_next(channels, last_message)
+                latencies.append(time.perf_counter() - start)
+            print("%d subscribers %d messages/s: append %.1fus get_next %s" % (
+                    subscribers, rate, elapsed / count * 1e6,
+                    format_latencies(latencies, 'us')))
@@ -1,6 +1,8 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
+import asyncio
+import bisect
 import collections
 import json
 import logging
@@ -40,7 +42,47 @@ _url_host = config.get('bus', 'url_host')
 _web_cache_timeout = config.getint('web', 'cache_timeout')
 
 
+class _ChannelBuffer:
+    "The messages of a channel in arrival order with their sequence"
+
+    __slots__ = ('sequences', 'messages', 'start')
+
+    def __init__(self):
+        self.sequences = []
+        self.messages = []
+        # The index of the oldest message
+        self.start = 0
+
+    def __len__(self):
+        return len(self.sequences) - self.start
+
+    def append(self, sequence, message):
+        self.sequences.append(sequence)
+        self.messages.append(message)
+
+    def popleft(self):
+        self.messages[self.start] = None
+        self.start += 1
+        # Compact only when it costs less than the pops done
+        if self.start * 2 > len(self.sequences):
+            del self.sequences[:self.start]
+            del self.messages[:self.start]
+            self.start = 0
+
+    def next(self, sequence):
+        "Return the first message after the sequence"
+        i = bisect.bisect_right(self.sequences, sequence, self.start)
+        if i < len(self.sequences):
+            return self.sequences[i], self.messages[i]
+        return None, None
+
+
 class _MessageQueue:
+    """The messages received for a database
+
+    The messages are buffered per channel and indexed by their id.
+    They expire in arrival order.
+    """
 
     Message = collections.namedtuple('Message', 'channel content timestamp')
 
@@ -48,37 +90,58 @@ class _MessageQueue:
         super().__init__()
         self._lock = collections.defaultdict(threading.Lock)
         self._timeout = timeout
-        self._messages = []
+        self._sequence = 0
+        # The timestamp, channel, sequence and id of the messages
+        self._order = collections.deque()
+        self._channels = {}
+        # The channel and sequence of the message ids
+        self._index = {}
 
     def append(self, channel, element):
-        self._messages.append(
-            self.Message(channel, element, time.time()))
+        timestamp = time.time()
+        message_id = element.get('message_id')
+        with self._lock[os.getpid()]:
+            self._sequence += 1
+            buffer = self._channels.get(channel)
+            if buffer is None:
+                buffer = self._channels[channel] = _ChannelBuffer()
+            buffer.append(
+                self._sequence, self.Message(channel, element, timestamp))
+            self._order.append(
+                (timestamp, channel, self._sequence, message_id))
+            if message_id is not None:
+                self._index[message_id] = (channel, self._sequence)
+
+    def _expire(self, oldest):
+        order = self._order
+        while order and order[0][0] < oldest:
+            _, channel, sequence, message_id = order.popleft()
+            buffer = self._channels[channel]
+            buffer.popleft()
+            if not buffer:
+                del self._channels[channel]
+            if self._index.get(message_id, (None, None))[1] == sequence:
+                del self._index[message_id]
 
     def get_next(self, channels, from_id=None):
         oldest = time.time() - self._timeout
-        to_delete_index = 0
-        found = False
-        first_message = None
         message = self.Message(None, None, None)
-        for idx, item in enumerate(self._messages):
-            if item.timestamp < oldest:
-                to_delete_index = idx
-                continue
-            if item.channel not in channels:
-                continue
-            if not first_message:
-                first_message = item
-            if from_id is None or found:
-                message = item
-                break
-            found = item.content['message_id'] == from_id
-        else:
-            if first_message and not found:
-                message = first_message
-
         with self._lock[os.getpid()]:
-            del self._messages[:to_delete_index]
-
+            self._expire(oldest)
+            after = 0
+            if from_id is not None:
+                channel, sequence = self._index.get(from_id, (None, None))
+                if channel in channels:
+                    after = sequence
+            next_sequence = None
+            for channel in channels:
+                buffer = self._channels.get(channel)
+                if not buffer:
+                    continue
+                sequence, item = buffer.next(after)
+                if sequence is not None and (
+                        next_sequence is None or sequence < next_sequence):
+                    next_sequence, message = sequence, item
         return message.channel, message.content
 
 
@@ -217,6 +280,137 @@ class LongPollingBus:
         cursor.execute('NOTIFY "%s", %%s' % cls._channel, (payload,))
 
 
+class _AsyncListener:
+    "Dispatch the notifications of a database to the waiting futures"
+
+    def __init__(self, database, loop):
+        self.database = database
+        self.loop = loop
+        self.messages = _MessageQueue(_cache_timeout)
+        self.waiters = collections.defaultdict(set)
+        self.last_use = time.time()
+        self.stopped = False
+        self._db = None
+        self._conn = None
+
+    def connect(self):
+        "Open the connection listening on the channel (blocking)"
+        db = backend.Database(self.database)
+        if not db.has_channel():
+            raise NotImplementedException
+        conn = db.get_connection(autocommit=True)
+        try:
+            cursor = conn.cursor()
+            cursor.execute('LISTEN "%s"' % LongPollingBus._channel)
+        except Exception:
+            db.put_connection(conn, close=True)
+            raise
+        logger.info("listening on channel '%s' of '%s'",
+            LongPollingBus._channel, self.database)
+        self._db, self._conn = db, conn
+
+    def start(self):
+        self.loop.add_reader(self._conn, self._read)
+        self.loop.call_later(_select_timeout, self._expire)
+
+    def stop(self, close=False):
+        if self.stopped:
+            return
+        self.stopped = True
+        self.loop.remove_reader(self._conn)
+        self._db.put_connection(self._conn, close=close)
+        for waiters in self.waiters.values():
+            for future in waiters:
+                if not future.done():
+                    future.set_result(None)
+        self.waiters.clear()
+
+    def _expire(self):
+        if self.stopped:
+            return
+        if (not any(self.waiters.values())
+                and time.time() - self.last_use > _db_timeout):
+            self.stop()
+        else:
+            self.loop.call_later(_select_timeout, self._expire)
+
+    def _read(self):
+        try:
+            self._conn.poll()
+            while self._conn.notifies:
+                notification = self._conn.notifies.pop(0)
+                payload = json.loads(
+                    notification.payload,
+                    object_hook=JSONDecoder())
+                self.dispatch(payload['channel'], payload['message'])
+        except Exception:
+            logger.error('bus listener on "%s" crashed', self.database,
+                exc_info=True)
+            self.stop(close=True)
+
+    def dispatch(self, channel, message):
+        self.messages.append(channel, message)
+        for future in self.waiters.pop(channel, ()):
+            if not future.done():
+                future.set_result(None)
+
+
+class AsyncLongPollingBus(LongPollingBus):
+    """Long polling bus on an asyncio event loop
+
+    The subscriptions are futures fed by a single connection listening per
+    database instead of a thread per client.
+    """
+
+    _listeners = {}
+
+    @classmethod
+    async def _get_listener(cls, database):
+        loop = asyncio.get_running_loop()
+        task = cls._listeners.get(database)
+        if (task is None
+                or task.get_loop() is not loop
+                or (task.done()
+                    and (task.cancelled() or task.exception()
+                        or task.result().stopped))):
+            task = cls._listeners[database] = loop.create_task(
+                cls._start_listener(database, loop))
+        return await asyncio.shield(task)
+
+    @classmethod
+    async def _start_listener(cls, database, loop):
+        listener = _AsyncListener(database, loop)
+        await loop.run_in_executor(None, listener.connect)
+        listener.start()
+        return listener
+
+    @classmethod
+    async def subscribe(cls, database, channels, last_message=None):
+        listener = await cls._get_listener(database)
+        listener.last_use = time.time()
+        channel, content = listener.messages.get_next(channels, last_message)
+        if content:
+            return cls.create_response(channel, content)
+
+        future = listener.loop.create_future()
+        for channel in channels:
+            listener.waiters[channel].add(future)
+        try:
+            await asyncio.wait_for(future, _long_polling_timeout)
+        except asyncio.TimeoutError:
+            return cls.create_response(None, None)
+        finally:
+            for channel in channels:
+                waiters = listener.waiters.get(channel)
+                if waiters is not None:
+                    waiters.discard(future)
+                    if not waiters:
+                        del listener.waiters[channel]
+        listener.last_use = time.time()
+        return cls.create_response(
+            *listener.messages.get_next(channels, last_message))
+
+
 if config.get('bus', 'class'):
     Bus = resolve(config.get('bus', 'class'))
 else:
@@ -236,12 +430,7 @@ def subscribe(request, database_name):
             'private, max-age=%s' % _web_cache_timeout)
         return response
     user = request.authorization.get('userid')
-    channels = request.parsed_data.get('channels', [])
-    if user is None:
-        raise BadRequest
-
-    channels = set(filter(lambda c: not c.startswith('user:'), channels))
-    channels.add('user:%s' % user)
+    channels = user_channels(user, request.parsed_data.get('channels', []))
 
     last_message = request.parsed_data.get('last_message')
 
@@ -255,6 +444,15 @@ def subscribe(request, database_name):
         content_type='application/json')
 
 
+def user_channels(user, channels):
+    "Return the channels the user may subscribe to"
+    if user is None:
+        raise BadRequest
+    channels = set(filter(lambda c: not c.startswith('user:'), channels))
+    channels.add('user:%s' % user)
+    return channels
+
+
 def notify(title, body=None, priority=1, user=None, client=None):
     if user is None:
         if client is None:
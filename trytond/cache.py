@@ -124,6 +124,11 @@ class BaseCache(object):
     def sync_since(self, value):
         raise NotImplementedError
 
+    @classmethod
+    def generation(cls, dbname):
+        "Return a value which changes when any cache of dbname is cleared"
+        return None
+
     @classmethod
     def commit(cls, transaction):
         raise NotImplementedError
@@ -146,6 +151,7 @@ class MemoryCache(BaseCache):
     _default_lower = Transaction.monotonic_time()
     _listener = {}
     _listener_lock = defaultdict(threading.Lock)
+    _generation = defaultdict(int)
     _table = 'ir_cache'
     _channel = _table
 
@@ -211,6 +217,7 @@ class MemoryCache(BaseCache):
 
     def _clear(self, dbname, timestamp=None):
         logger.debug("clearing cache '%s' of '%s'", self._name, dbname)
+        MemoryCache._generation[dbname] += 1
         self._timestamp[dbname] = timestamp
         self._database_cache[dbname] = self._database_cache.default_factory()
         self._transaction_lower[dbname] = max(
@@ -261,6 +268,10 @@ class MemoryCache(BaseCache):
     def sync_since(self, value):
         return self._clean_last > value
 
+    @classmethod
+    def generation(cls, dbname):
+        return cls._generation[dbname]
+
     @classmethod
     def commit(cls, transaction):
         table = Table(cls._table)
@@ -334,6 +345,7 @@ class MemoryCache(BaseCache):
             finally:
                 database.put_connection(conn)
             listener.join()
+        cls._generation.pop(dbname, None)
         for inst in cls._instances.values():
             inst._timestamp.pop(dbname, None)
             inst._database_cache.pop(dbname, None)
@@ -378,6 +390,7 @@ class MemoryCache(BaseCache):
                     notification = conn.notifies.pop()
                     if notification.payload == 'refresh pool':
                         Pool(dbname).refresh(_get_modules(cursor))
+                        MemoryCache._generation[dbname] += 1
                     elif notification.payload:
                         reset = json.loads(notification.payload)
                         for name in reset:
@@ -65,6 +65,8 @@ def get_parser_worker():
         help="number of processes to use")
     parser.add_argument("--max", dest='maxtasksperchild', type=int,
         help="number of tasks a worker process before being replaced")
+    parser.add_argument("--preload", dest='preload', action='store_true',
+        help="initialize the pools before forking the worker processes")
     parser.add_argument("-t", "--timeout", dest='timeout', default=60,
         type=int, help="maximum timeout when waiting notification")
     return parser
@@ -74,6 +76,8 @@ def get_parser_cron():
     parser = get_parser_daemon()
     parser.add_argument("-1", "--once", dest='once', action='store_true',
         help="run pending tasks and halt")
+    parser.add_argument("-n", dest='threads', type=int, default=1,
+        help="number of threads running crons per database")
     parser.add_argument("--check", dest='check', action='store_true',
         help="Checks the existence of canary file for all given databases."
         "The exit status will be 0 if ok, else 1")
@@ -143,6 +147,54 @@ def get_parser_stat():
     return parser
 
 
+def get_parser_bench():
+    parser = get_base_parser()
+    parser.add_argument("-v", "--verbose", action='count',
+        dest="verbose", default=0, help="enable verbose mode")
+    parser.add_argument("--logconf", dest="logconf", metavar='FILE',
+        help="logging configuration file (ConfigParser format)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    queue = subparsers.add_parser('queue', help="benchmark the task queue",
+        epilog='The database must have the ir module activated. '
+        'The benchmark creates and removes tasks of the "bench" queue.')
+    queue.add_argument("-d", "--database", dest="database_name",
+        required=True, metavar='DATABASE', help="specify the database name")
+    queue.add_argument("--tasks", dest='tasks', type=int, default=1000,
+        help="number of tasks to enqueue")
+    queue.add_argument("--size", dest='size', type=int, default=1,
+        help="number of instances per task")
+    queue.add_argument("-n", dest='processes', type=int, nargs='+',
+        default=[1], metavar='PROCESSES',
+        help="numbers of worker processes to compare")
+    queue.add_argument("--preload", dest='preload', action='store_true',
+        help="initialize the pools before forking the worker processes")
+    queue.add_argument("-t", "--timeout", dest='timeout', type=int,
+        default=600, help="maximum seconds to wait for the tasks")
+
+    jsonrpc = subparsers.add_parser('jsonrpc',
+        help="benchmark the encoding of JSON-RPC responses")
+    jsonrpc.add_argument("--rows", dest='rows', type=int, default=5000,
+        help="number of records read")
+    jsonrpc.add_argument("--repeat", dest='repeat', type=int, default=10,
+        help="number of encodings to measure")
+
+    bus = subparsers.add_parser('bus',
+        help="benchmark the subscriptions to the bus messages")
+    bus.add_argument("--subscribers", dest='subscribers', type=int,
+        nargs='+', default=[10, 100, 1000],
+        help="numbers of subscribers to compare")
+    bus.add_argument("--rate", dest='rate', type=int, nargs='+',
+        default=[10, 100, 1000],
+        help="numbers of messages per second to compare")
+    bus.add_argument("--timeout", dest='timeout', type=int,
+        help="number of seconds the messages are kept "
+        "(default: bus cache_timeout)")
+    bus.add_argument("--repeat", dest='repeat', type=int, default=1000,
+        help="number of subscriptions to measure")
+    return parser
+
+
 def config_log(options):
     log_level = os.environ.get('LOG_LEVEL', None)
     if options.logconf:
@@ -57,6 +57,8 @@ class TrytonConfigParser(configparser.ConfigParser):
                 os.path.join(os.path.expanduser('~'), 'www')))
         self.set('web', 'num_proxies', '0')
         self.set('web', 'cache_timeout', str(60 * 60 * 12))
+        self.set('web', 'compression_threshold', str(1024))
+        self.set('web', 'binary_url_timeout', str(5 * 60))
         self.add_section('database')
         self.set('database', 'uri',
             os.environ.get('TRYTOND_DATABASE_URI', 'sqlite://'))
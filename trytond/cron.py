@@ -34,8 +34,10 @@ def run(options):
     threads = {}
     while True:
         for db_name in options.database_names:
-            thread = threads.get(db_name)
-            if thread and thread.is_alive():
+            # Each thread claims the due crons not run by the others
+            running = [t for t in threads.get(db_name, []) if t.is_alive()]
+            threads[db_name] = running
+            if len(running) >= options.threads:
                 logger.info(
                     'skip "%s" as previous cron still running', db_name)
                 continue
@@ -45,15 +47,17 @@ def run(options):
                 with Transaction().start(db_name, 0, readonly=True):
                     pool.init()
             Cron = pool.get('ir.cron')
-            thread = threading.Thread(
-                    target=Cron.run,
-                    args=(db_name,), kwargs={})
-            logger.info('start thread for "%s"', db_name)
-            thread.start()
-            threads[db_name] = thread
+            for _ in range(options.threads - len(running)):
+                thread = threading.Thread(
+                        target=Cron.run,
+                        args=(db_name,), kwargs={})
+                logger.info('start thread for "%s"', db_name)
+                thread.start()
+                running.append(thread)
             Path(f'/tmp/cron_canary_{db_name}').touch()
         if options.once:
             break
         time.sleep(60)
-    for thread in threads.values():
-        thread.join()
+    for running in threads.values():
+        for thread in running:
+            thread.join()
@@ -16,6 +16,10 @@ class FileStore(object):
         with open(filename, 'rb') as fp:
             return fp.read()
 
+    def open(self, id, prefix=''):
+        filename = self._filename(id, prefix)
+        return open(filename, 'rb')
+
     def getmany(self, ids, prefix=''):
         return [self.get(id, prefix) for id in ids]
 
@@ -160,7 +160,7 @@ class ActionKeyword(ModelSQL, ModelView):
     def __setup__(cls):
         super(ActionKeyword, cls).__setup__()
         cls.__rpc__.update({
-                'get_keyword': RPC(cache=dict(days=1)),
+                'get_keyword': RPC(cache=dict(days=1, etag=True)),
                 })
 
     @classmethod
@@ -3,6 +3,7 @@
 import datetime
 import logging
 import time
+from datetime import timedelta
 
 from dateutil.relativedelta import relativedelta
 
@@ -74,7 +75,19 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
             ('ir.trigger|trigger_time', "Run On Time Triggers"),
             ('ir.queue|clean', "Clean Task Queue"),
             ('ir.error|clean', "Clean Errors"),
+            ('ir.session|clean', "Clean Sessions"),
             ], "Method", required=True)
+    queue_batch = fields.Integer(
+        "Queue Batch",
+        domain=['OR',
+            ('queue_batch', '=', None),
+            ('queue_batch', '>', 0),
+            ],
+        help="The number of records per task "
+        "when the method pushes its work to the queue.\n"
+        "Leave empty to use the default.")
+    last_call = fields.DateTime("Last Call", readonly=True)
+    last_duration = fields.TimeDelta("Last Duration", readonly=True)
 
     @classmethod
     def __setup__(cls):
@@ -99,6 +112,16 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
         # Migration from 5.0: remove required on next_call
         table_h.not_null_action('next_call', 'remove')
 
+    @classmethod
+    def copy(cls, crons, default=None):
+        if default is None:
+            default = {}
+        else:
+            default = default.copy()
+        default.setdefault('last_call')
+        default.setdefault('last_duration')
+        return super().copy(crons, default=default)
+
     def get_timezone(self, name):
         return tz.SERVER.key
 
@@ -143,10 +166,28 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
     @ModelView.button
     def run_once(cls, crons):
         pool = Pool()
+        transaction = Transaction()
         for cron in crons:
             model, method = cron.method.split('|')
             Model = pool.get(model)
-            getattr(Model, method)()
+            context = {}
+            if cron.queue_batch:
+                context['queue_batch'] = cron.queue_batch
+            with transaction.set_context(context):
+                getattr(Model, method)()
+
+    @classmethod
+    def claim(cls, now):
+        "Lock and return a due cron which is not run by another process"
+        crons = cls.search(['OR',
+                ('next_call', '<=', now),
+                ('next_call', '=', None),
+                ],
+            order=[('next_call', 'ASC NULLS FIRST'), ('id', 'ASC')],
+            limit=1, lock='skip_locked')
+        if crons:
+            cron, = crons
+            return cron
 
     @classmethod
     def run(cls, db_name):
@@ -154,24 +195,38 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
         logger.info('cron started for "%s"', db_name)
         now = datetime.datetime.now()
         retry = config.getint('database', 'retry')
-        with transaction.start(db_name, 0, context={'_skip_warnings': True}):
-            pool = Pool()
-            Error = pool.get('ir.error')
-            cls.lock()
-            crons = cls.search(['OR',
-                    ('next_call', '<=', now),
-                    ('next_call', '=', None),
-                    ])
-
-            for cron in crons:
+        while True:
+            # Claim each cron in its own transaction to release its lock once
+            # it is done and to see the crons done by the other processes
+            with Transaction().start(
+                    db_name, 0, context={'_skip_warnings': True}) as claim:
+                pool = Pool()
+                Error = pool.get('ir.error')
+                for count in range(retry, -1, -1):
+                    if count != retry:
+                        time.sleep(0.02 * (retry - count))
+                    try:
+                        cron = cls.claim(now)
+                        break
+                    except backend.DatabaseOperationalError:
+                        # The lock fails on a cron updated by another process
+                        # after the start of the transaction
+                        if count:
+                            claim.rollback()
+                            continue
+                        raise
+                if not cron:
+                    break
                 name = '<Cron %s@%s %s>' % (cron.id, db_name, cron.method)
                 logger.info("%s started", name)
+                last_call = datetime.datetime.now()
+                start = time.monotonic()
                 for count in range(retry, -1, -1):
                     if count != retry:
                         time.sleep(0.02 * (retry - count))
                     try:
                         with processing(name), \
-                                transaction.new_transaction() as cron_trans:
+                                claim.new_transaction() as cron_trans:
                             cron.run_once()
                             cron_trans.commit()
                     except Exception as e:
@@ -184,8 +239,12 @@ class Cron(DeactivableMixin, ModelSQL, ModelView):
                         else:
                             logger.critical('%s failed', name, exc_info=True)
                     cron.next_call = cron.compute_next_call(now)
+                    cron.last_call = last_call
+                    cron.last_duration = timedelta(
+                        seconds=time.monotonic() - start)
                     cron.save()
                     break
+                logger.info("%s done in %s", name, cron.last_duration)
         while transaction.tasks:
             task_id = transaction.tasks.pop()
             run_task(db_name, task_id)
@@ -1,20 +1,31 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import datetime
+import hashlib
+import random
 
 from sql import Literal, Null, With
-from sql.aggregate import Min
+from sql.aggregate import Count, Min
+from sql.conditionals import Coalesce
 from sql.functions import CurrentTimestamp, Extract
+from sql.operators import Equal
 
+from trytond import backend
 from trytond.config import config
-from trytond.model import ModelSQL, fields
+from trytond.model import Exclude, ModelSQL, fields
+from trytond.model.exceptions import SQLConstraintError
+from trytond.model.fields.dict import dumps
 from trytond.pool import Pool
-from trytond.tools import grouped_slice
+from trytond.tools import grouped_slice, reduce_ids
 from trytond.transaction import Transaction
 
 has_worker = config.getboolean('queue', 'worker', default=False)
 clean_days = config.getint('queue', 'clean_days', default=30)
 batch_size = config.getint('queue', 'batch_size', default=20)
+coalesce_size = config.getint('queue', 'coalesce', default=0)
+retry_attempts = config.getint('queue', 'retry_attempts', default=5)
+retry_delay = config.getint('queue', 'retry_delay', default=60)
+retry_max_delay = config.getint('queue', 'retry_max_delay', default=3600)
 
 
 class Queue(ModelSQL):
@@ -25,13 +36,31 @@ class Queue(ModelSQL):
     data = fields.Dict(None, "Data")
 
     enqueued_at = fields.Timestamp("Enqueued at", required=True)
-    dequeued_at = fields.Timestamp("Dequeued at")
+    dequeued_at = fields.Timestamp("Dequeued at", select=True)
     finished_at = fields.Timestamp("Finished at")
+    failed_at = fields.Timestamp("Failed at",
+        help="When the task was given up.")
 
     scheduled_at = fields.Timestamp("Scheduled at",
         help="When the task can start.")
     expected_at = fields.Timestamp("Expected at",
         help="When the task should be done.")
+    dedup_key = fields.Char("Deduplication Key", readonly=True,
+        help="The pending tasks with the same key are merged.")
+    attempts = fields.Integer("Attempts", readonly=True,
+        help="The number of failed runs.")
+    last_error = fields.Text("Last Error", readonly=True)
+
+    @classmethod
+    def __setup__(cls):
+        super().__setup__()
+        t = cls.__table__()
+        cls._sql_constraints += [
+            ('dedup_key_exclude',
+                Exclude(t, (t.dedup_key, Equal),
+                    where=(t.dequeued_at == Null) & (t.dedup_key != Null)),
+                'ir.msg_queue_dedup_key_unique'),
+            ]
 
     @classmethod
     def __register__(cls, module_name):
@@ -39,18 +68,29 @@ class Queue(ModelSQL):
         super().__register__(module_name)
         table_h = cls.__table_handler__(module_name)
 
-        # Add index for candidates
+        # Migration from 6.4: index only pending tasks as candidates
         table_h.index_action([
                 queue.scheduled_at.nulls_first,
                 queue.expected_at.nulls_first,
                 queue.dequeued_at,
                 queue.name,
-                ], action='add')
+                ], action='remove')
+
+        # Add index for candidates
+        table_h.index_action([
+                queue.scheduled_at.nulls_first,
+                queue.expected_at.nulls_first,
+                queue.name,
+                ], action='add', where=queue.dequeued_at == Null)
 
     @classmethod
     def default_enqueued_at(cls):
         return datetime.datetime.now()
 
+    @classmethod
+    def default_attempts(cls):
+        return 0
+
     @classmethod
     def copy(cls, records, default=None):
         if default is None:
@@ -60,28 +100,83 @@ class Queue(ModelSQL):
         default.setdefault('enqueued_at')
         default.setdefault('dequeued_at')
         default.setdefault('finished_at')
+        default.setdefault('failed_at')
+        default.setdefault('dedup_key')
+        default.setdefault('attempts')
+        default.setdefault('last_error')
         return super(Queue, cls).copy(records, default=default)
 
     @classmethod
-    def push(cls, name, data, scheduled_at=None, expected_at=None):
+    def dedup(cls, name, data):
+        "Return the deduplication key of the task"
+        instances = data['instances']
+        if not isinstance(instances, int):
+            instances = sorted(set(instances))
+        return hashlib.sha256(dumps([
+                    name, data['model'], data['method'], data['user'],
+                    data['context'], instances, data['args'], data['kwargs'],
+                    ]).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def push(cls, name, data, scheduled_at=None, expected_at=None,
+            dedup_key=None):
         transaction = Transaction()
         database = transaction.database
         cursor = transaction.connection.cursor()
         with transaction.set_user(0):
-            record, = cls.create([{
-                        'name': name,
-                        'data': data,
-                        'scheduled_at': scheduled_at,
-                        'expected_at': expected_at,
-                        }])
+            if dedup_key:
+                tasks = cls.search([
+                        ('dedup_key', '=', dedup_key),
+                        ('dequeued_at', '=', None),
+                        ], limit=1, lock='wait')
+                if tasks:
+                    task, = tasks
+                    task._merge(data, scheduled_at, expected_at)
+                    return task.id
+            try:
+                record, = cls.create([{
+                            'name': name,
+                            'data': data,
+                            'scheduled_at': scheduled_at,
+                            'expected_at': expected_at,
+                            'dedup_key': dedup_key,
+                            }])
+            except SQLConstraintError as exception:
+                if not dedup_key:
+                    raise
+                # A concurrent transaction pushed the same key, so retry the
+                # transaction to merge into its task
+                raise backend.DatabaseOperationalError(
+                    'concurrent push of %s' % dedup_key) from exception
         if database.has_channel():
             cursor.execute('NOTIFY "%s"', (cls.__name__,))
         if not has_worker:
             transaction.tasks.append(record.id)
         return record.id
 
+    def _merge(self, data, scheduled_at=None, expected_at=None):
+        "Merge the pushed task into this pending one"
+        def earliest(date1, date2):
+            # None means as soon as possible
+            if date1 is None or date2 is None:
+                return None
+            return min(date1, date2)
+
+        # The key ensures the data are the same
+        self.scheduled_at = earliest(self.scheduled_at, scheduled_at)
+        self.expected_at = earliest(self.expected_at, expected_at)
+        self.save()
+
     @classmethod
-    def pull(cls, database, connection, name=None):
+    def _name_clause(cls, table, name=None, exclude=None):
+        clause = (table.name == name) if name else Literal(True)
+        if exclude:
+            clause &= ~table.name.in_(list(exclude))
+        return clause
+
+    @classmethod
+    def pull(cls, database, connection, name=None, limit=1, exclude=None):
+        "Dequeue up to limit tasks and return their ids and the next timeout"
         cursor = connection.cursor()
         queue = cls.__table__()
         queue_c = cls.__table__()
@@ -92,21 +187,21 @@ class Queue(ModelSQL):
                 queue_c.id,
                 queue_c.scheduled_at,
                 queue_c.expected_at,
-                where=((queue_c.name == name) if name else Literal(True))
+                where=cls._name_clause(queue_c, name, exclude)
                 & (queue_c.dequeued_at == Null),
                 order_by=[
                     queue_c.scheduled_at.nulls_first,
                     queue_c.expected_at.nulls_first]))
         selected = queue_s.select(
             queue_s.id,
-            where=((queue_s.name == name) if name else Literal(True))
+            where=cls._name_clause(queue_s, name, exclude)
             & (queue_s.dequeued_at == Null)
             & ((queue_s.scheduled_at <= CurrentTimestamp())
                 | (queue_s.scheduled_at == Null)),
             order_by=[
                 queue_s.scheduled_at.nulls_first,
                 queue_s.expected_at.nulls_first],
-            limit=1)
+            limit=limit)
         if database.has_select_for():
             For = database.get_select_for_skip_locked()
             selected.for_ = For('UPDATE')
@@ -117,7 +212,7 @@ class Queue(ModelSQL):
                     ),
                 where=candidates.scheduled_at >= CurrentTimestamp()))
 
-        task_id, seconds = None, None
+        task_ids, seconds = [], None
         if database.has_returning():
             query = queue.update([queue.dequeued_at], [CurrentTimestamp()],
                 where=queue.id.in_(selected),
@@ -125,37 +220,69 @@ class Queue(ModelSQL):
                 returning=[
                     queue.id, next_timeout.select(next_timeout.seconds)])
             cursor.execute(*query)
-            row = cursor.fetchone()
-            if row:
-                task_id, seconds = row
+            for task_id, seconds in cursor:
+                task_ids.append(task_id)
         else:
             query = queue.select(queue.id,
                 where=queue.id.in_(selected),
                 with_=[candidates])
             cursor.execute(*query)
-            row = cursor.fetchone()
-            if row:
-                task_id, = row
+            task_ids = [i for i, in cursor]
+            if task_ids:
                 query = queue.update([queue.dequeued_at], [CurrentTimestamp()],
-                    where=queue.id == task_id)
+                    where=reduce_ids(queue.id, task_ids))
                 cursor.execute(*query)
-            query = next_timeout.select(next_timeout.seconds)
+            query = next_timeout.select(next_timeout.seconds,
+                with_=[candidates, next_timeout])
             cursor.execute(*query)
             row = cursor.fetchone()
             if row:
                 seconds, = row
 
-        if not task_id and database.has_channel():
+        if not task_ids and database.has_channel():
             cursor.execute('LISTEN "%s"', (cls.__name__,))
-        return task_id, seconds
+        return task_ids, seconds
 
-    def run(self):
+    @classmethod
+    def statistics(cls, connection):
+        "Return the number of ready tasks and the longest wait per name"
+        cursor = connection.cursor()
+        queue = cls.__table__()
+        now = datetime.datetime.now()
+        cursor.execute(*queue.select(
+                queue.name,
+                Count(Literal('*')),
+                Min(Coalesce(queue.scheduled_at, queue.enqueued_at)),
+                where=(queue.dequeued_at == Null)
+                & ((queue.scheduled_at <= CurrentTimestamp())
+                    | (queue.scheduled_at == Null)),
+                group_by=[queue.name]))
+        statistics = {}
+        for name, depth, oldest in cursor:
+            if isinstance(oldest, str):
+                oldest = datetime.datetime.fromisoformat(oldest)
+            statistics[name] = {
+                'depth': depth,
+                'wait': max((now - oldest).total_seconds(), 0),
+                }
+        return statistics
+
+    def run(self, others=None):
+        "Run the task and the others coalesced with it"
         transaction = Transaction()
         Model = Pool().get(self.data['model'])
+        instances = self.data['instances']
+        if others:
+            instances = list(instances)
+            seen = set(instances)
+            for other in others:
+                for instance in other.data['instances']:
+                    if instance not in seen:
+                        instances.append(instance)
+                        seen.add(instance)
         with transaction.set_user(self.data['user']), \
                 transaction.set_context(
                     self.data['context'], _skip_warnings=True):
-            instances = self.data['instances']
             # Ensure record ids still exist
             if isinstance(instances, int):
                 with transaction.set_context(active_test=False):
@@ -177,21 +304,114 @@ class Queue(ModelSQL):
             if instances is not None:
                 getattr(Model, self.data['method'])(
                     instances, *self.data['args'], **self.data['kwargs'])
-        if not self.dequeued_at:
-            self.dequeued_at = datetime.datetime.now()
-        self.finished_at = datetime.datetime.now()
+        tasks = [self] + list(others or [])
+        for task in tasks:
+            if not task.dequeued_at:
+                task.dequeued_at = datetime.datetime.now()
+            task.finished_at = datetime.datetime.now()
+        self.__class__.save(tasks)
+
+    @property
+    def _coalesce_key(self):
+        if isinstance(self.data['instances'], int):
+            return None
+        return (self.name, {
+                k: v for k, v in self.data.items() if k != 'instances'})
+
+    def coalesce(self, size=None):
+        "Claim up to size pending tasks which can be run with this one"
+        cls = self.__class__
+        if size is None:
+            size = coalesce_size
+        key = self._coalesce_key
+        if not size or key is None:
+            return []
+        now = datetime.datetime.now()
+        domain = [
+            ('name', '=', self.name),
+            ('dequeued_at', '=', None),
+            ['OR',
+                ('scheduled_at', '=', None),
+                ('scheduled_at', '<=', now),
+                ],
+            ]
+        tasks = cls.search(domain + [
+                ('id', '!=', self.id),
+                ('data.model', '=', self.data['model']),
+                ('data.method', '=', self.data['method']),
+                ], order=[('id', 'ASC')], limit=size)
+        return cls.claim(
+            [t for t in tasks if t._coalesce_key == key], domain)
+
+    @classmethod
+    def claim(cls, tasks, domain=None):
+        "Dequeue the tasks which are still pending and not locked"
+        if domain is None:
+            domain = [('dequeued_at', '=', None)]
+        tasks = cls.lock(tasks, skip_locked=True)
+        if tasks:
+            # Other workers may have dequeued them before the lock
+            tasks = cls.search(domain + [
+                    ('id', 'in', [t.id for t in tasks]),
+                    ], order=[('id', 'ASC')])
+            cls.write(tasks, {'dequeued_at': datetime.datetime.now()})
+        return tasks
+
+    @property
+    def backoff(self):
+        "The delay before the next attempt"
+        delay = min(
+            retry_delay * 2 ** max(self.attempts - 1, 0), retry_max_delay)
+        return datetime.timedelta(seconds=delay * random.uniform(0.5, 1))
+
+    def fail(self, error, retry=True):
+        "Record the failure and return if the task will be retried"
+        now = datetime.datetime.now()
+        self.attempts = (self.attempts or 0) + 1
+        self.last_error = error
+        retry = retry and self.attempts <= retry_attempts
+        if retry:
+            self.dequeued_at = None
+            self.scheduled_at = now + self.backoff
+            # Another pending task may have been pushed with the same key
+            self.dedup_key = None
+            if not has_worker:
+                Transaction().tasks.append(self.id)
+        else:
+            self.failed_at = now
         self.save()
+        return retry
+
+    @classmethod
+    def requeue(cls, tasks):
+        "Push back the tasks as new ones"
+        cls.write(tasks, {
+                'dequeued_at': None,
+                'finished_at': None,
+                'failed_at': None,
+                'scheduled_at': None,
+                'attempts': 0,
+                'last_error': None,
+                'dedup_key': None,
+                })
+        transaction = Transaction()
+        if transaction.database.has_channel():
+            transaction.connection.cursor().execute(
+                'NOTIFY "%s"', (cls.__name__,))
+        if not has_worker:
+            transaction.tasks.extend(t.id for t in tasks)
 
     @classmethod
     def clean(cls, date=None):
         if date is None:
             date = (
                 datetime.datetime.now() - datetime.timedelta(days=clean_days))
-        tasks = cls.search(['OR',
-                ('dequeued_at', '<', date),
-                ('finished_at', '<', date),
-                ])
-        cls.delete(tasks)
+        cursor = Transaction().connection.cursor()
+        queue = cls.__table__()
+        # A finished task is always dequeued before
+        # and the failed tasks are kept to be requeued
+        cursor.execute(*queue.delete(
+                where=(queue.dequeued_at < date) & (queue.failed_at == Null)))
 
     @classmethod
     def caller(cls, model):
@@ -223,6 +443,7 @@ class _Method(object):
             scheduled_at = now + scheduled_at
         expected_at = context.pop('queue_expected_at', None)
         queue_batch = context.pop('queue_batch', None)
+        queue_dedup = context.pop('queue_dedup', False)
         context.pop('_check_access', None)
         context.pop('language', None)
         if expected_at is not None:
@@ -242,9 +463,14 @@ class _Method(object):
                 'args': args,
                 'kwargs': kwargs,
                 }
+            if queue_dedup:
+                dedup_key = self.__queue.dedup(name, data)
+            else:
+                dedup_key = None
             return self.__queue.push(
                 name, data,
-                scheduled_at=scheduled_at, expected_at=expected_at)
+                scheduled_at=scheduled_at, expected_at=expected_at,
+                dedup_key=dedup_key)
 
         if isinstance(instances, list):
             if has_worker and queue_batch:
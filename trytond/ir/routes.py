@@ -4,6 +4,8 @@ import csv
 import datetime as dt
 import io
 import json
+import mimetypes
+import time
 from numbers import Number
 
 try:
@@ -14,13 +16,16 @@ except ImportError:
 from werkzeug.exceptions import abort
 from werkzeug.utils import redirect
 from werkzeug.wrappers import Response
+from werkzeug.wsgi import wrap_file
 
 from trytond.config import config
+from trytond.filestore import filestore
 from trytond.i18n import gettext
 from trytond.protocols.jsonrpc import JSONDecoder
 from trytond.protocols.wrappers import with_pool, with_transaction
 from trytond.tools import slugify
 from trytond.transaction import Transaction
+from trytond.url import check_binary_url
 from trytond.wsgi import app
 
 SOURCE = config.get(
@@ -283,6 +288,70 @@ def data(request, pool, model):
         return response
 
 
+@app.route('/<database_name>/binary/<model>/<field>/<int:record>',
+    methods={'GET'})
+@with_pool
+@with_transaction(context=dict(active_test=False))
+def binary(request, pool, model, field, record):
+    try:
+        expires = int(request.args.get('e', 0))
+    except ValueError:
+        abort(HTTPStatus.BAD_REQUEST)
+    if not check_binary_url(
+            pool.database_name, model, field, record, expires,
+            request.args.get('s', '')):
+        abort(HTTPStatus.FORBIDDEN)
+    try:
+        Model = pool.get(model)
+        binary_field = Model._fields[field]
+    except KeyError:
+        abort(HTTPStatus.NOT_FOUND)
+    try:
+        record, = Model.search([('id', '=', record)])
+    except ValueError:
+        abort(HTTPStatus.NOT_FOUND)
+
+    file_id = None
+    if getattr(binary_field, 'file_id', None):
+        file_id = getattr(record, binary_field.file_id)
+    if file_id:
+        prefix = binary_field.store_prefix
+        if prefix is None:
+            prefix = pool.database_name
+        try:
+            size = filestore.size(file_id, prefix=prefix)
+            file = filestore.open(file_id, prefix=prefix)
+        except (IOError, OSError):
+            abort(HTTPStatus.NOT_FOUND)
+    else:
+        data = getattr(record, field)
+        if not data:
+            abort(HTTPStatus.NOT_FOUND)
+        size = len(data)
+        file = io.BytesIO(data)
+
+    filename = None
+    if getattr(binary_field, 'filename', None):
+        filename = getattr(record, binary_field.filename)
+    mimetype = None
+    if filename:
+        mimetype, _ = mimetypes.guess_type(filename)
+    response = Response(
+        wrap_file(request.environ, file),
+        mimetype=mimetype or 'application/octet-stream',
+        direct_passthrough=True)
+    response.content_length = size
+    response.accept_ranges = 'bytes'
+    if filename:
+        response.headers.add(
+            'Content-Disposition', 'attachment',
+            filename=filename.encode('latin-1', 'ignore'))
+    response.headers['Cache-Control'] = (
+        'max-age=%s, private' % max(expires - int(time.time()), 0))
+    return response.make_conditional(
+        request, accept_ranges=True, complete_length=size)
+
+
 @app.route('/avatar/<base64:database_name>/<uuid>', methods={'GET'})
 @with_pool
 @with_transaction()
@@ -8,6 +8,8 @@ from trytond.cache import Cache
 from trytond.config import config
 from trytond.model import ModelSQL, fields
 
+check_cache = config.getint('session', 'check_cache', default=60)
+
 
 class Session(ModelSQL):
     "Session"
@@ -16,6 +18,8 @@ class Session(ModelSQL):
 
     key = fields.Char('Key', required=True, select=True)
     _session_last_reset = Cache('ir_session.session_timeout', context=False)
+    _session_valid = Cache(
+        'ir_session.check', duration=check_cache, context=False)
 
     @classmethod
     def __setup__(cls):
@@ -66,32 +70,43 @@ class Session(ModelSQL):
     @classmethod
     def check(cls, user, key, domain=None):
         """
-        Check user key against max_age and delete old one.
+        Check user key against max_age and delete it if expired.
         Return True if key is still valid, False if the key is expired and None
         if the key does not exist.
         """
+        cache = check_cache and not domain
         now = datetime.datetime.now()
+        if cache:
+            expire = cls._session_valid.get((user, key))
+            if expire and now < expire:
+                return True
         timeout = datetime.timedelta(
             seconds=config.getint('session', 'max_age'))
         sessions = cls.search([
                 ('create_uid', '=', user),
+                ('key', '=', key),
                 domain or [],
-                ])
-        find, last_reset = None, None
-        to_delete = []
-        for session in sessions:
-            if abs(session.create_date - now) < timeout:
-                if session.key == key:
-                    find = True
-                    last_reset = session.write_date or session.create_date
-            else:
-                if find is None and session.key == key:
-                    find = False
-                to_delete.append(session)
-        cls.delete(to_delete)
-        if find:
-            cls._session_last_reset.set(key, last_reset)
-        return find
+                ], limit=1)
+        if not sessions:
+            return None
+        session, = sessions
+        if abs(session.create_date - now) >= timeout:
+            cls.delete([session])
+            return False
+        if cache:
+            # Do not keep the key valid beyond its max_age
+            cls._session_valid.set((user, key), min(
+                    session.create_date + timeout,
+                    now + datetime.timedelta(seconds=check_cache)))
+        cls._session_last_reset.set(
+            key, session.write_date or session.create_date)
+        return True
+
+    @classmethod
+    def check_expire(cls, user, key):
+        "Return until when the checked key is valid without checking it again"
+        if check_cache:
+            return cls._session_valid.get((user, key))
 
     @classmethod
     def check_timeout(cls, user, key, domain=None):
@@ -115,7 +130,7 @@ class Session(ModelSQL):
 
     @classmethod
     def reset(cls, key, domain=None):
-        "Reset key session timestamp"
+        "Reset key session timestamp and return the timestamp of the session"
         now = datetime.datetime.now()
         timeout = datetime.timedelta(
             seconds=config.getint('session', 'timeout'))
@@ -135,6 +150,18 @@ class Session(ModelSQL):
                     domain or [],
                     ])
             cls.write(sessions, {})
+            last_reset = max(
+                (s.write_date for s in cls.browse(sessions)), default=None)
+        return last_reset
+
+    @classmethod
+    def clean(cls, date=None):
+        "Delete the sessions older than max_age"
+        if date is None:
+            date = datetime.datetime.now() - datetime.timedelta(
+                seconds=config.getint('session', 'max_age'))
+        sessions = cls.search([('create_date', '<', date)])
+        cls.delete(sessions)
 
     @classmethod
     def clear(cls, users, domain=None):
@@ -154,6 +181,12 @@ class Session(ModelSQL):
             values.setdefault('key', cls.default_key())
         return super(Session, cls).create(vlist)
 
+    @classmethod
+    def delete(cls, sessions):
+        super().delete(sessions)
+        # The processes are notified on commit
+        cls._session_valid.clear()
+
 
 class SessionWizard(ModelSQL):
     "Session Wizard"
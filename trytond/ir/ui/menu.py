@@ -134,9 +134,9 @@ class UIMenu(
 
     @classmethod
     def search(cls, domain, offset=0, limit=None, order=None, count=False,
-            query=False):
+            query=False, *, lock=None):
         menus = super(UIMenu, cls).search(domain, offset=offset, limit=limit,
-                order=order, count=False, query=query)
+                order=order, count=False, query=query, lock=lock)
         if query:
             return menus
 
@@ -5,10 +5,18 @@ from sql import Column, Null
 from trytond.filestore import filestore
 from trytond.tools import cached_property, grouped_slice, reduce_ids
 from trytond.transaction import Transaction
+from trytond.url import binary_url
 
 from .field import Field
 
 
+def _size(value):
+    "Return the size of the value unless it is already read as a size"
+    if isinstance(value, int):
+        return value
+    return len(value)
+
+
 class Binary(Field):
     '''
     Define a binary field (``bytes``).
@@ -52,10 +60,16 @@ class Binary(Field):
         res = {}
         converter = self.cast
         default = None
-        format_ = Transaction().context.get(
-            '%s.%s' % (model.__name__, name), '')
-        if format_ == 'size':
-            converter = len
+        key = '%s.%s' % (model.__name__, name)
+        format_ = Transaction().context.get(key, '')
+        if format_ == 'url':
+            with transaction.set_context({key: 'size'}):
+                sizes = self.get(ids, model, name, values=values)
+            return {
+                id: binary_url(model.__name__, name, id) if size else None
+                for id, size in sizes.items()}
+        elif format_ == 'size':
+            converter = _size
             default = 0
 
         if self.file_id:
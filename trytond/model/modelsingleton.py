@@ -90,9 +90,14 @@ class ModelSingleton(ModelStorage):
         return records
 
     @classmethod
-    def search(cls, domain, offset=0, limit=None, order=None, count=False):
+    def search(cls, domain, offset=0, limit=None, order=None, count=False,
+            *, lock=None):
+        kwargs = {}
+        if lock is not None:
+            # Only ModelSQL supports lock
+            kwargs['lock'] = lock
         res = super(ModelSingleton, cls).search(domain, offset=offset,
-                limit=limit, order=order, count=count)
+                limit=limit, order=order, count=count, **kwargs)
         if not res and not domain:
             if count:
                 return 1
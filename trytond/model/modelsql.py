@@ -6,11 +6,12 @@ from functools import wraps
 from itertools import chain, groupby, islice, product, repeat
 
 from sql import (
-    Asc, Column, Desc, Expression, For, Literal, Null, NullsFirst, NullsLast,
-    Table, Union, With)
-from sql.aggregate import Count, Max
+    Asc, Cast, Column, Desc, Expression, For, Literal, Null, NullsFirst,
+    NullsLast, Table, Union, Window, With)
+from sql.aggregate import Count, Max, Sum
 from sql.conditionals import Coalesce
-from sql.functions import CurrentTimestamp, Extract, Substring
+from sql.functions import (
+    CurrentTimestamp, Extract, OctetLength, RowNumber, Substring)
 from sql.operators import And, Concat, Equal, Operator, Or
 
 from trytond import backend
@@ -31,6 +32,10 @@ from .modelstorage import (
     ValidationError, is_leaf)
 from .modelview import ModelView
 
+_history_mode = config.get('database', 'history', default='statement')
+_tree_rebuild_size = config.getint(
+    'database', 'tree_rebuild_size', default=1000)
+
 
 class ForeignKeyError(ValidationError):
     pass
@@ -318,7 +323,7 @@ class ModelSQL(ModelStorage):
                             | (Column(sql_table, field.right) == Null),
                             limit=1))
                     if cursor.fetchone():
-                        cls._rebuild_tree(field_name, None, 0)
+                        cls._rebuild_mptt(field_name)
 
         for ident, constraint, _ in cls._sql_constraints:
             table.add_constraint(ident, constraint)
@@ -348,6 +353,21 @@ class ModelSQL(ModelStorage):
                 if not field.sql_type():
                     continue
                 history_table.add_column(field_name, field._sql_type)
+            if not callable(cls.table_query):
+                table = cls.__table_handler__()
+                columns, update_columns = cls._history_trigger_columns()
+                table.history_trigger_action(
+                    columns, update_columns,
+                    action='add' if _history_mode == 'trigger' else 'remove')
+
+    @classmethod
+    def _history_trigger_columns(cls):
+        "Return the columns copied and the columns updated by the trigger"
+        columns = sorted(n for n, f in cls._fields.items() if f.sql_type())
+        # The fields stored with a setter are updated after the write
+        update_columns = ['write_date'] + [n for n in columns
+            if hasattr(cls._fields[n], 'set')]
+        return columns, update_columns
 
     @classmethod
     def __raise_integrity_error(
@@ -426,6 +446,7 @@ class ModelSQL(ModelStorage):
         cursor = Transaction().connection.cursor()
 
         ModelAccess.check(cls.__name__, 'read')
+        cls._flush_history()
 
         table = cls.__table_history__()
         user = User.__table__()
@@ -452,10 +473,21 @@ class ModelSQL(ModelStorage):
 
     @classmethod
     def _insert_history(cls, ids, deleted=False):
-        transaction = Transaction()
-        cursor = transaction.connection.cursor()
         if not cls._history:
             return
+        if not deleted:
+            if _history_mode == 'trigger':
+                return
+            elif _history_mode == 'buffer':
+                transaction = Transaction()
+                transaction.history_records[cls.__name__].update(ids)
+                return
+        cls.__insert_history(ids, deleted=deleted)
+
+    @classmethod
+    def __insert_history(cls, ids, deleted=False):
+        transaction = Transaction()
+        cursor = transaction.connection.cursor()
         user = transaction.user
         table = cls.__table__()
         history = cls.__table_history__()
@@ -489,10 +521,19 @@ class ModelSQL(ModelStorage):
                         cursor.execute(*history.insert(hcolumns,
                                 [[id_, CurrentTimestamp(), user]]))
 
+    @classmethod
+    def _flush_history(cls):
+        "Insert the history of the records buffered by the transaction"
+        transaction = Transaction()
+        ids = transaction.history_records.pop(cls.__name__, None)
+        if ids:
+            cls.__insert_history(ids)
+
     @classmethod
     def _restore_history(cls, ids, datetime, _before=False):
         if not cls._history:
             return
+        cls._flush_history()
         transaction = Transaction()
         cursor = transaction.connection.cursor()
         table = cls.__table__()
@@ -730,11 +771,14 @@ class ModelSQL(ModelStorage):
 
         cls._insert_history(new_ids)
 
-        cls.__check_domain_rule(new_ids, 'create')
         records = cls.browse(new_ids)
-        for sub_records in grouped_slice(
-                records, record_cache_size(transaction)):
-            cls._validate(sub_records)
+        if transaction.context.get('_defer_validation'):
+            cls._defer_validation(new_ids, 'create')
+        else:
+            cls.__check_domain_rule(new_ids, 'create')
+            for sub_records in grouped_slice(
+                    records, record_cache_size(transaction)):
+                cls._validate(sub_records)
 
         cls.trigger_create(records)
         return records
@@ -783,10 +827,11 @@ class ModelSQL(ModelStorage):
         history_order = None
         history_clause = None
         history_limit = None
+        history_window = None
         if (cls._history
                 and transaction.context.get('_datetime')
                 and not callable(cls.table_query)):
-            in_max = 1
+            transaction.flush_history()
             table = cls.__table_history__()
             column = Coalesce(table.write_date, table.create_date)
             if Transaction().context.get('_datetime_exclude', False):
@@ -794,15 +839,29 @@ class ModelSQL(ModelStorage):
             else:
                 history_clause = (column <= Transaction().context['_datetime'])
             history_order = (column.desc, Column(table, '__id').desc)
-            history_limit = 1
+            if transaction.database.has_window_functions():
+                # Fetch the last revision of all the ids in a single query
+                history_window = Window([table.id], order_by=history_order)
+                history_order = None
+            else:
+                in_max = 1
+                history_limit = 1
 
         columns = {}
         for f in all_fields:
             field = cls._fields.get(f)
             if field and field.sql_type():
-                columns[f] = field.sql_column(table).as_(f)
+                column = field.sql_column(table)
+                sql_type = field.sql_type().base
+                if (isinstance(field, fields.Binary)
+                        and transaction.context.get(
+                            '%s.%s' % (cls.__name__, f)) in {'size', 'url'}):
+                    # Do not fetch the content to compute its size
+                    column = OctetLength(column)
+                    sql_type = fields.Integer('size').sql_type().base
+                columns[f] = column.as_(f)
                 if backend.name == 'sqlite':
-                    columns[f].output_name += ' [%s]' % field.sql_type().base
+                    columns[f].output_name += ' [%s]' % sql_type
             elif f in {'_write', '_delete'}:
                 if not callable(cls.table_query):
                     rule_domain = Rule.domain_get(
@@ -853,8 +912,18 @@ class ModelSQL(ModelStorage):
                     where &= history_clause
                 if domain:
                     where &= dom_exp
-                cursor.execute(*from_.select(*columns.values(), where=where,
-                        order_by=history_order, limit=history_limit))
+                if history_window:
+                    query = from_.select(*columns.values(),
+                        RowNumber(window=history_window).as_('__rank'),
+                        where=where)
+                    query = query.select(*(
+                            Column(query, c.output_name).as_(c.output_name)
+                            for c in columns.values()),
+                        where=Column(query, '__rank') == 1)
+                else:
+                    query = from_.select(*columns.values(), where=where,
+                        order_by=history_order, limit=history_limit)
+                cursor.execute(*query)
                 fetchall = list(cursor_dict(cursor))
                 if not len(fetchall) == len({}.fromkeys(sub_ids)):
                     cls.__check_domain_rule(
@@ -1164,10 +1233,13 @@ class ModelSQL(ModelStorage):
 
         cls._insert_history(all_ids)
 
-        cls.__check_domain_rule(all_ids, 'write')
-        for sub_records in grouped_slice(
-                all_records, record_cache_size(transaction)):
-            cls._validate(sub_records, field_names=all_field_names)
+        if transaction.context.get('_defer_validation'):
+            cls._defer_validation(all_ids, 'write', all_field_names)
+        else:
+            cls.__check_domain_rule(all_ids, 'write')
+            for sub_records in grouped_slice(
+                    all_records, record_cache_size(transaction)):
+                cls._validate(sub_records, field_names=all_field_names)
 
         cls.trigger_write(trigger_eligibles)
 
@@ -1196,6 +1268,8 @@ class ModelSQL(ModelStorage):
 
         cls.__check_timestamp(ids)
         cls.__check_domain_rule(ids, 'delete')
+        # The buffered history must be inserted before the rows are deleted
+        cls._flush_history()
 
         tree_ids = {}
         for fname in cls._mptt_fields:
@@ -1308,16 +1382,16 @@ class ModelSQL(ModelStorage):
         transaction = Transaction()
         in_max = transaction.database.IN_MAX
         history_clause = None
-        limit = None
+        distinct = False
         if (mode == 'read'
                 and cls._history
                 and transaction.context.get('_datetime')
                 and not callable(cls.table_query)):
-            in_max = 1
             table = cls.__table_history__()
             column = Coalesce(table.write_date, table.create_date)
             history_clause = (column <= Transaction().context['_datetime'])
-            limit = 1
+            # Any revision is enough to test the existence
+            distinct = True
         cursor = transaction.connection.cursor()
         assert mode in Rule.modes
 
@@ -1336,13 +1410,13 @@ class ModelSQL(ModelStorage):
                 if domain:
                     where &= dom_exp
                 cursor.execute(
-                    *from_.select(table.id, where=where, limit=limit))
+                    *from_.select(table.id, where=where, distinct=distinct))
                 rowcount = cursor.rowcount
                 if rowcount == -1 or rowcount is None:
                     rowcount = len(cursor.fetchall())
                 if rowcount != len(sub_ids):
-                    cursor.execute(
-                        *from_.select(table.id, where=where, limit=limit))
+                    cursor.execute(*from_.select(
+                            table.id, where=where, distinct=distinct))
                     result.extend(
                         sub_ids.difference([x for x, in cursor]))
             return result
@@ -1378,6 +1452,50 @@ class ModelSQL(ModelStorage):
                 msg = gettext(nodomain, ids=ids, model=model)
             raise AccessError(msg)
 
+    @classmethod
+    def _defer_validation(cls, ids, mode, field_names=None):
+        "Store ids to validate and check for mode when validation is flushed"
+        transaction = Transaction()
+        context = transaction.context
+        key = (cls.__name__, transaction.user, freeze(context))
+        _, records = transaction.deferred_records.setdefault(
+            key, (context, {}))
+        if field_names is not None:
+            field_names = frozenset(field_names)
+        for id_ in ids:
+            modes, names = records.get(id_, ((), frozenset()))
+            if mode not in modes:
+                modes = modes + (mode,)
+            if names is None or field_names is None:
+                names = None
+            elif not names:
+                names = field_names
+            elif not field_names <= names:
+                names = names | field_names
+            records[id_] = (modes, names)
+
+    @classmethod
+    def _validate_deferred(cls, records):
+        "Validate and check rules of records deferred by _defer_validation"
+        transaction = Transaction()
+        delete_records = transaction.delete_records[cls.__name__]
+        mode_ids = defaultdict(list)
+        field_names_ids = defaultdict(list)
+        for id_, (modes, field_names) in records.items():
+            if id_ in delete_records:
+                continue
+            for mode in modes:
+                mode_ids[mode].append(id_)
+            field_names_ids[field_names].append(id_)
+
+        for mode in ['create', 'write']:
+            if mode_ids[mode]:
+                cls.__check_domain_rule(mode_ids[mode], mode)
+        for field_names, ids in field_names_ids.items():
+            for sub_records in grouped_slice(
+                    cls.browse(ids), record_cache_size(transaction)):
+                cls._validate(sub_records, field_names=field_names)
+
     @classmethod
     def __search_query(cls, domain, count, query, order):
         pool = Pool()
@@ -1516,13 +1634,19 @@ class ModelSQL(ModelStorage):
 
     @classmethod
     def search(cls, domain, offset=0, limit=None, order=None, count=False,
-            query=False):
+            query=False, *, lock=None):
         transaction = Transaction()
+        database = transaction.database
         cursor = transaction.connection.cursor()
 
         super(ModelSQL, cls).search(
             domain, offset=offset, limit=limit, order=order, count=count)
 
+        if lock not in {None, 'wait', 'nowait', 'skip_locked'}:
+            raise ValueError("Invalid lock mode: %r" % lock)
+        if count and lock:
+            raise ValueError("Can not lock when counting")
+
         if order is None or order is False:
             order = cls._order
         tables, expression = cls.__search_query(domain, count, query, order)
@@ -1549,6 +1673,13 @@ class ModelSQL(ModelStorage):
         select = table.select(
             *columns, where=expression, limit=limit, offset=offset,
             order_by=order_by)
+        if lock:
+            if database.has_select_for():
+                # Lock only the rows of the main table as the joined
+                # tables may be on the nullable side of an outer join
+                select.for_ = cls._lock_for(lock, main_table)
+            else:
+                database.lock(transaction.connection, cls._table)
 
         if query:
             return select
@@ -1642,6 +1773,8 @@ class ModelSQL(ModelStorage):
         transaction = Transaction()
         domain = cls._search_domain_active(domain, active_test=active_test)
 
+        if cls._history and transaction.context.get('_datetime'):
+            transaction.flush_history()
         if tables is None:
             tables = {}
         if None not in tables:
@@ -1745,6 +1878,9 @@ class ModelSQL(ModelStorage):
 
         for field_name, ids in zip(field_names, list_ids):
             field = cls._fields[field_name]
+            if len(ids) > _tree_rebuild_size:
+                cls._rebuild_path(field_name)
+                continue
             parent_column = Column(table, field_name)
             parent_path_column = Column(parent, field.path)
             path_column = Column(table, field.path)
@@ -1769,12 +1905,85 @@ class ModelSQL(ModelStorage):
                     'You can not update fields: "%s", "%s"' %
                     (field.left, field.right))
 
-            if len(ids) < max(cls.count() / 4, 4):
+            if (len(ids) < max(cls.count() / 4, 4)
+                    and len(ids) <= _tree_rebuild_size):
                 for id_ in ids:
                     cls._update_tree(id_, field_name,
                         field.left, field.right)
             else:
-                cls._rebuild_tree(field_name, None, 0)
+                cls._rebuild_mptt(field_name)
+
+    @classmethod
+    def _rebuild_tree_bulk(cls, field_name):
+        "Rebuild path, left and right values for the tree with set queries."
+        field = cls._fields[field_name]
+        if field.path:
+            cls._rebuild_path(field_name)
+        if field.left and field.right:
+            cls._rebuild_mptt(field_name)
+
+    @classmethod
+    def _rebuild_mptt(cls, field_name):
+        "Rebuild left, right values for the tree."
+        transaction = Transaction()
+        database = transaction.database
+        if not database.has_window_functions():
+            cls._rebuild_tree(field_name, None, 0)
+            return
+        cursor = transaction.connection.cursor()
+        field = cls._fields[field_name]
+        table = cls.__table__()
+        node = cls.__table__()
+        parent = Column(node, field_name)
+        integer = database.sql_type('INTEGER').base
+
+        # The nodes descending from a root, so a cycle does not recurse forever
+        # and is left to the recursion check
+        reachable = With('id', recursive=True)
+        reachable.query = Union(
+            node.select(node.id, where=parent == Null),
+            node.join(reachable, condition=parent == reachable.id
+                ).select(node.id),
+            all_=True)
+        # Pairs of all the nodes with each of their ancestors and themselves
+        closure = With('id', 'ancestor', recursive=True)
+        closure.query = Union(
+            reachable.select(reachable.id, reachable.id),
+            node.join(closure, condition=node.id == closure.ancestor
+                ).select(closure.id, parent, where=parent != Null),
+            all_=True)
+        # The size of the sub-tree and the size of the previous siblings
+        size = With('id', 'parent', 'size')
+        size.query = (node
+            .join(closure, condition=node.id == closure.ancestor)
+            .select(node.id, parent, Count(closure.id),
+                group_by=[node.id, parent]))
+        previous = With('id', 'parent', 'size', 'previous')
+        previous.query = size.select(
+            size.id, size.parent,
+            Cast(size.size, integer),
+            Cast(Sum(size.size, window=Window(
+                        [size.parent], order_by=[size.id.asc]))
+                - size.size, integer))
+        tree = With('id', 'left_', 'right_', recursive=True)
+        tree.query = Union(
+            previous.select(
+                previous.id,
+                previous.previous * 2 + 1,
+                (previous.previous + previous.size) * 2,
+                where=previous.parent == Null),
+            previous.join(tree, condition=previous.parent == tree.id
+                ).select(
+                previous.id,
+                tree.left_ + previous.previous * 2 + 1,
+                tree.left_ + (previous.previous + previous.size) * 2),
+            all_=True)
+        query = table.update(
+            [Column(table, field.left), Column(table, field.right)],
+            [tree.left_, tree.right_],
+            from_=[tree], where=table.id == tree.id,
+            with_=[reachable, closure, size, previous, tree])
+        cursor.execute(*query)
 
     @classmethod
     def _rebuild_tree(cls, parent, parent_id, left):
@@ -1911,21 +2120,53 @@ class ModelSQL(ModelStorage):
                         raise SQLConstraintError(gettext(error))
 
     @dualmethod
-    def lock(cls, records=None):
+    def lock(cls, records=None, nowait=True, skip_locked=False):
         transaction = Transaction()
         database = transaction.database
         connection = transaction.connection
         table = cls.__table__()
 
         if records is not None and database.has_select_for():
+            if skip_locked:
+                mode = 'skip_locked'
+            elif nowait:
+                mode = 'nowait'
+            else:
+                mode = 'wait'
+            locked = set()
             for sub_records in grouped_slice(records):
                 where = reduce_ids(table.id, sub_records)
                 query = table.select(
-                    Literal(1), where=where, for_=For('UPDATE', nowait=True))
+                    table.id, where=where, for_=cls._lock_for(mode))
                 with connection.cursor() as cursor:
                     cursor.execute(*query)
+                    locked.update(i for i, in cursor)
+            return [r for r in records if r.id in locked]
         else:
             database.lock(connection, cls._table)
+            if records is not None:
+                return list(records)
+
+    @classmethod
+    def _lock_for(cls, mode, *tables):
+        "Return the FOR UPDATE clause for the lock mode on the tables"
+        assert mode in {'wait', 'nowait', 'skip_locked'}, mode
+        tables = [_ForTable(t) for t in tables]
+        if mode == 'skip_locked':
+            database = Transaction().database
+            return database.get_select_for_skip_locked()('UPDATE', *tables)
+        return For('UPDATE', *tables, nowait=mode == 'nowait')
+
+
+class _ForTable(object):
+    "Refer to a table by its alias in a FOR clause"
+    __slots__ = ('table',)
+
+    def __init__(self, table):
+        self.table = table
+
+    def __str__(self):
+        return '"%s"' % self.table.alias
 
 
 def convert_from(table, tables):
@@ -48,8 +48,9 @@ class ModelView(Model):
     @classmethod
     def __setup__(cls):
         super(ModelView, cls).__setup__()
-        cls.__rpc__['fields_view_get'] = RPC(cache=dict(days=1))
-        cls.__rpc__['view_toolbar_get'] = RPC(cache=dict(days=1))
+        cls.__rpc__['fields_view_get'] = RPC(cache=dict(days=1, etag=True))
+        cls.__rpc__['view_toolbar_get'] = RPC(
+            cache=dict(days=1, etag=True))
         cls.__rpc__['on_change'] = RPC(instantiate=0)
         cls.__rpc__['on_change_with'] = RPC(instantiate=0)
         cls.__rpc__['on_change_notify'] = RPC(instantiate=0)
@@ -4,7 +4,9 @@
 import http.client
 import logging
 import pydoc
+import threading
 import time
+from contextlib import contextmanager
 
 try:
     from http import HTTPStatus
@@ -13,10 +15,11 @@ except ImportError:
 import traceback
 
 from sql import Table
-from werkzeug.exceptions import abort
+from werkzeug.exceptions import HTTPException, abort
 from werkzeug.wrappers import Response
 
 from trytond import __version__, backend, security
+from trytond.cache import Cache, LRUDict
 from trytond.config import config, get_hostname
 from trytond.error_handling import error_wrap
 from trytond.exceptions import (
@@ -92,8 +95,18 @@ def log_exception(method, *args, **kwargs):
         method(elem)
 
 
+# The log sequence number of the last write of the sessions
+_session_lsn = LRUDict(1024)
+_session_lsn_lock = threading.Lock()
+# The header to carry the log sequence number between the client and the
+# processes
+LSN_HEADER = 'X-Tryton-LSN'
+
+
 @app.route('/<string:database_name>/', methods=['POST'])
 def rpc(request, database_name):
+    if request.rpc_batch is not None:
+        return batch(request, database_name)
     methods = {
         'common.db.login': login,
         'common.db.logout': logout,
@@ -192,6 +205,118 @@ def list_method(request, pool):
     return methods
 
 
+@app.auth_required
+@with_pool
+def batch(request, pool):
+    "Dispatch the calls of the request and concatenate their responses"
+    database_name = pool.database_name
+    user = request.user_id
+    responses = []
+    transaction, timeout, lsn = None, None, None
+    try:
+        for call in request.rpc_batch:
+            # Share a transaction between the consecutive readonly calls
+            # with the same timeout
+            rpc_ = _get_rpc(call, pool)
+            shared = rpc_ is not None and rpc_.readonly
+            if transaction and (not shared or rpc_.timeout != timeout):
+                transaction.stop()
+                transaction = None
+            if shared and not transaction:
+                timeout = rpc_.timeout
+                transaction = Transaction().start(
+                    database_name, user, readonly=True, timeout=timeout,
+                    context={
+                        '_request': request.context,
+                        '_replica_lsn': _replica_lsn(
+                            request, database_name, user),
+                        })
+            call.rpc_transaction = transaction
+            try:
+                data = rpc(call, database_name)
+            except HTTPException as e:
+                data = e
+            except Exception as e:
+                data = app.handle_exception(call, e)
+                if transaction:
+                    # Start again from a clean state
+                    transaction.rollback()
+            if not isinstance(data, Response):
+                data = app.make_response(call, data)
+            responses.append(data.iter_encoded())
+            if LSN_HEADER in data.headers:
+                lsn = max(lsn or 0, int(data.headers[LSN_HEADER]))
+    finally:
+        if transaction:
+            transaction.stop()
+    if request.authorization.type == 'session':
+        security.reset(
+            database_name, request.authorization.get('session'),
+            context={'_request': request.context})
+    response = Response(
+        _join_responses(responses), content_type='application/json')
+    if lsn:
+        response.headers[LSN_HEADER] = str(lsn)
+    return response
+
+
+def _join_responses(responses):
+    "Yield the chunks of the JSON list of the responses"
+    yield b'['
+    for i, chunks in enumerate(responses):
+        if i:
+            yield b','
+        yield from chunks
+    yield b']'
+
+
+def _get_rpc(request, pool):
+    "Return the RPC of the called method or None"
+    try:
+        obj, method = get_object_method(request, pool)
+        return obj.__rpc__.get(method)
+    except Exception:
+        return None
+
+
+def _session_key(request, database_name, user):
+    session = None
+    if request.authorization.type == 'session':
+        session = request.authorization.get('session')
+    return (database_name, user, session)
+
+
+def _replica_lsn(request, database_name, user):
+    "Return the log sequence number a replica must have replayed for the call"
+    with _session_lsn_lock:
+        lsn = _session_lsn.get(_session_key(request, database_name, user))
+    try:
+        # The client sends back the last received number
+        lsn = max(lsn or 0, int(request.headers.get(LSN_HEADER, '')))
+    except ValueError:
+        pass
+    return lsn or None
+
+
+@contextmanager
+def _start_transaction(request, pool, user, rpc):
+    "Start the transaction of the call unless it is shared by the batch"
+    if request.rpc_transaction and rpc.readonly:
+        yield request.rpc_transaction
+    else:
+        context = None
+        if rpc.readonly:
+            # Read on a replica only what the session has written
+            context = {
+                '_replica_lsn': _replica_lsn(
+                    request, pool.database_name, user),
+                }
+        with Transaction().start(pool.database_name, user,
+                readonly=rpc.readonly, timeout=rpc.timeout,
+                context=context) as transaction:
+            yield transaction
+
+
 def get_object_method(request, pool):
     method = request.rpc_method
     type, _ = method.split('.', 1)
@@ -268,10 +393,25 @@ def _dispatch(request, pool, *args, **kwargs):
             'party': request.authorization.get('party_id'),
             }
 
+    etag_key = generation = None
+    if rpc.readonly and rpc.cache and rpc.cache.etag:
+        # The generation must be taken before computing the result
+        etag_key = (pool.database_name, user, request.rpc_method,
+            repr((args, kwargs)))
+        generation = Cache.generation(pool.database_name)
+        etag = rpc.cache.get_etag(etag_key, generation)
+        if etag and etag in request.if_none_match:
+            logger.debug('Not modified: %s', etag)
+            if session and request.reset_session:
+                context = {'_request': request.context}
+                security.reset(pool.database_name, session, context=context)
+            return _not_modified(rpc, etag)
+
+    lsn = None
     retry = config.getint('database', 'retry')
     for count in range(retry, -1, -1):
-        with Transaction().start(pool.database_name, user,
-                readonly=rpc.readonly, timeout=rpc.timeout) as transaction:
+        with _start_transaction(
+                request, pool, user, rpc) as transaction:
             try:
                 c_args, c_kwargs, transaction.context, transaction.timestamp \
                     = rpc.convert(obj, *args, **kwargs)
@@ -297,7 +437,9 @@ def _dispatch(request, pool, *args, **kwargs):
                 logger.debug(log_message, *log_args, exc_info=True)
                 raise TimeoutException from exception
             except backend.DatabaseOperationalError:
-                if count and not rpc.readonly:
+                # The readonly calls are retried for the conflicts with the
+                # recovery of a replica unless the transaction is shared
+                if count and not (rpc.readonly and request.rpc_transaction):
                     transaction.rollback()
                     continue
                 logger.error(log_message, *log_args, exc_info=True)
@@ -329,10 +471,16 @@ def _dispatch(request, pool, *args, **kwargs):
                 raise
             # Need to commit to unlock SQLite database
             transaction.commit()
+            if not rpc.readonly:
+                lsn = transaction.database.current_lsn(transaction.connection)
+                if lsn:
+                    with _session_lsn_lock:
+                        _session_lsn[_session_key(
+                                request, pool.database_name, user)] = lsn
         while transaction.tasks:
             task_id = transaction.tasks.pop()
             run_task(pool, task_id)
-        if session:
+        if session and request.reset_session:
             context = {'_request': request.context}
             security.reset(pool.database_name, session, context=context)
 
@@ -357,7 +505,23 @@ def _dispatch(request, pool, *args, **kwargs):
             else:
                 slow_logger.debug(slow_msg, *slow_args)
 
+        if etag_key:
+            etag = rpc.cache.set_etag(etag_key, generation, result)
+            if etag in request.if_none_match:
+                return _not_modified(rpc, etag)
         response = app.make_response(request, result)
+        if lsn:
+            response.headers[LSN_HEADER] = str(lsn)
         if rpc.readonly and rpc.cache:
             response.headers.extend(rpc.cache.headers())
+            if etag_key:
+                response.set_etag(etag)
         return response
+
+
+def _not_modified(rpc, etag):
+    "Return the response to a call of which the result is not modified"
+    response = Response(status=HTTPStatus.NOT_MODIFIED)
+    response.headers.extend(rpc.cache.headers())
+    response.set_etag(etag)
+    return response
@@ -3,20 +3,31 @@
 import base64
 import datetime
 import json
+import math
 from decimal import Decimal
+from itertools import chain
 
 from werkzeug.exceptions import (
-    BadRequest, Conflict, Forbidden, InternalServerError, Locked,
-    TooManyRequests)
+    BadRequest, Conflict, Forbidden, HTTPException, InternalServerError,
+    Locked, TooManyRequests)
+from werkzeug.datastructures import ETags
 from werkzeug.wrappers import Response
 
 from trytond.exceptions import (
     ConcurrencyException, LoginException, MissingDependenciesException,
     RateLimitException, TrytonException, UserWarning)
 from trytond.protocols.wrappers import Request
-from trytond.tools import cached_property
+from trytond.tools import cached_property, grouped_slice
 from trytond.opentelemetry import OPENTELEMETRY_ENABLED
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# The size of the response encoded before sending the headers
+BUFFER_SIZE = 64 * 1024
+
 
 class JSONDecoder(object):
 
@@ -118,6 +129,71 @@ JSONEncoder.register(Decimal,
         })
 
 
+_encoder = JSONEncoder(separators=(',', ':'))
+
+
+def _default(obj):
+    try:
+        marshaller = JSONEncoder.serializers[type(obj)]
+    except KeyError:
+        raise TypeError(
+            "Object of type %s is not JSON serializable"
+            % type(obj).__name__)
+    return marshaller(obj)
+
+
+def _non_finite(value):
+    "Return True if value contains NaN or infinite floats"
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    elif isinstance(value, dict):
+        return any(map(_non_finite, value.values()))
+    elif isinstance(value, (list, tuple)):
+        return any(map(_non_finite, value))
+    return False
+
+
+def dumps(value):
+    "Return the JSON encoding of value as bytes"
+    if orjson is not None:
+        try:
+            data = orjson.dumps(value, default=_default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME
+                | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Use the standard encoder for the values orjson can not encode
+            # like integers bigger than 64-bit
+            pass
+        else:
+            # orjson encodes NaN and infinite floats as null
+            if b'null' not in data or not _non_finite(value):
+                return data
+    return _encoder.encode(value).encode('utf-8')
+
+
+def iterdumps(value, chunk_size=1000, depth=2):
+    "Yield the JSON encoding of value by chunks of bytes"
+    if (depth and isinstance(value, dict)
+            and all(isinstance(k, str) for k in value)):
+        yield b'{'
+        for i, (key, item) in enumerate(value.items()):
+            if i:
+                yield b','
+            yield dumps(key) + b':'
+            yield from iterdumps(item, chunk_size, depth - 1)
+        yield b'}'
+    elif isinstance(value, (list, tuple)) and len(value) > chunk_size:
+        yield b'['
+        for i, sub_value in enumerate(grouped_slice(value, chunk_size)):
+            if i:
+                yield b','
+            # Remove the brackets of the encoded slice
+            yield dumps(list(sub_value))[1:-1]
+        yield b']'
+    else:
+        yield dumps(value)
+
+
 class JSONRequest(Request):
     parsed_content_type = 'json'
 
@@ -143,6 +219,8 @@ class JSONRequest(Request):
                     self.decoded_data.decode(
                         self.charset, self.encoding_errors),
                     object_hook=JSONDecoder())
+            except HTTPException:
+                raise
             except Exception:
                 raise BadRequest('Unable to read JSON request')
         else:
@@ -162,6 +240,48 @@ class JSONRequest(Request):
         except Exception:
             pass
 
+    @cached_property
+    def rpc_batch(self):
+        try:
+            parsed_data = self.parsed_data
+        except BadRequest:
+            return
+        if isinstance(parsed_data, list):
+            if not parsed_data:
+                raise BadRequest('Empty JSON batch request')
+            return [JSONCall(self, data) for data in parsed_data]
+
+
+class JSONCall:
+    "A call of a JSON-RPC batch request"
+    rpc_batch = None
+    rpc_transaction = None
+    reset_session = False
+    # The calls can not be answered as not modified
+    if_none_match = ETags()
+
+    def __init__(self, request, data):
+        self.request = request
+        self.parsed_data = data
+
+    def __getattr__(self, name):
+        return getattr(self.request, name)
+
+    def __repr__(self):
+        return '<%s %s %s>' % (
+            self.__class__.__name__, self.request, self.rpc_method)
+
+    @property
+    def rpc_method(self):
+        if isinstance(self.parsed_data, dict):
+            return self.parsed_data.get('method')
+
+    @property
+    def rpc_params(self):
+        if isinstance(self.parsed_data, dict):
+            return self.parsed_data.get('params', [])
+        raise BadRequest('Not a JSON call')
+
 
 class JSONProtocol:
     content_type = 'json'
@@ -176,7 +296,21 @@ class JSONProtocol:
             parsed_data = request.parsed_data
         except BadRequest:
             parsed_data = {}
-        if (isinstance(request, JSONRequest)
+        if isinstance(request, JSONCall):
+            if not isinstance(parsed_data, dict):
+                parsed_data = {}
+            response = {'id': parsed_data.get('id')}
+            if 'jsonrpc' in parsed_data:
+                response['jsonrpc'] = parsed_data['jsonrpc']
+            if isinstance(data, HTTPException):
+                response['error'] = (data.name, data.description)
+            elif isinstance(data, TrytonException):
+                response['error'] = data.args
+            elif isinstance(data, Exception):
+                response['error'] = (str(data), data.__format_traceback__)
+            else:
+                response['result'] = data
+        elif (isinstance(request, JSONRequest)
                 and set(parsed_data.keys()) == {'id', 'method', 'params'}):
             response = {'id': parsed_data.get('id', 0)}
 
@@ -209,6 +343,21 @@ class JSONProtocol:
             elif isinstance(data, Exception):
                 return InternalServerError(data)
             response = data
-        return Response(json.dumps(
-                response, cls=JSONEncoder, separators=(',', ':')),
-            content_type='application/json')
+        chunks = iterdumps(response)
+        body, size = [], 0
+        try:
+            # Encode the beginning before sending the headers to report the
+            # encoding errors of the responses which are not streamed
+            for chunk in chunks:
+                body.append(chunk)
+                size += len(chunk)
+                if size >= BUFFER_SIZE:
+                    body = chain(body, chunks)
+                    break
+        except (TypeError, ValueError) as exception:
+            if response is data:
+                return InternalServerError(exception)
+            response.pop('result', None)
+            response['error'] = (str(exception), '')
+            body = [dumps(response)]
+        return Response(body, content_type='application/json')
@@ -30,6 +30,8 @@ logger = logging.getLogger(__name__)
 class Request(_Request):
 
     view_args = None
+    # The maximum size of the decoded data
+    max_size = None
 
     def __repr__(self):
         args = []
@@ -52,11 +54,24 @@ class Request(_Request):
         return "<%s %s>" % (
             self.__class__.__name__, " ".join(filter(None, args)))
 
-    @property
+    @cached_property
     def decoded_data(self):
         if self.content_encoding == 'gzip':
             zipfile = gzip.GzipFile(fileobj=BytesIO(self.data), mode='rb')
-            return zipfile.read()
+            max_size = self.max_size
+            if max_size is None:
+                # Do not decompress more than any request may contain
+                sizes = [
+                    config.getint('request', 'max_size'),
+                    config.getint('request', 'max_size_authenticated')]
+                max_size = 0 if not all(sizes) else max(sizes)
+            try:
+                data = zipfile.read(max_size + 1 if max_size else -1)
+            except (OSError, EOFError):
+                abort(HTTPStatus.BAD_REQUEST)
+            if max_size and len(data) > max_size:
+                abort(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+            return data
         else:
             return self.data
 
@@ -72,6 +87,15 @@ class Request(_Request):
     def rpc_params(self):
         return
 
+    @property
+    def rpc_batch(self):
+        return
+
+    # The readonly transaction shared by the calls of a batch
+    rpc_transaction = None
+    # If the timestamp of the session is reset after the call
+    reset_session = True
+
     @cached_property
     def authorization(self):
         authorization = super(Request, self).authorization
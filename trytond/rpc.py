@@ -2,7 +2,11 @@
 # this repository contains the full copyright notices and license terms.
 import copy
 import datetime as dt
+import hashlib
+import threading
 
+from trytond.cache import LRUDict
+from trytond.config import config
 from trytond.transaction import Transaction
 
 __all__ = ['RPC']
@@ -88,12 +92,42 @@ class RPC(object):
 
 
 class RPCCache:
-    __slots__ = ('duration',)
+    '''Define the client cache of RPC result
 
-    def __init__(self, days=0, seconds=0):
+    duration: The time the client may keep the result
+    etag: If the result is validated with an ETag
+    '''
+    __slots__ = ('duration', 'etag')
+    _etags = LRUDict(config.getint('cache', 'etag', default=1024))
+    _etags_lock = threading.Lock()
+
+    def __init__(self, days=0, seconds=0, etag=False):
         self.duration = dt.timedelta(days=days, seconds=seconds)
+        self.etag = etag
 
     def headers(self):
         return {
             'X-Tryton-Cache': int(self.duration.total_seconds()),
             }
+
+    @classmethod
+    def get_etag(cls, key, generation):
+        "Return the ETag of the call if it is still valid for the generation"
+        if generation is None:
+            return
+        try:
+            with cls._etags_lock:
+                etag, etag_generation = cls._etags[key]
+        except KeyError:
+            return
+        if etag_generation == generation:
+            return etag
+
+    @classmethod
+    def set_etag(cls, key, generation, result):
+        "Compute and store the ETag of the call from its result"
+        etag = hashlib.sha256(repr(result).encode('utf-8')).hexdigest()
+        if generation is not None:
+            with cls._etags_lock:
+                cls._etags[key] = (etag, generation)
+        return etag
@@ -1,8 +1,11 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import datetime
 import logging
+import threading
 
 from trytond import backend
+from trytond.cache import Cache, LRUDict
 from trytond.config import config
 from trytond.exceptions import LoginException, RateLimitException
 from trytond.pool import Pool
@@ -10,6 +13,12 @@ from trytond.transaction import Transaction
 
 logger = logging.getLogger(__name__)
 
+# The validated and reset sessions of the process checked before starting a
+# transaction
+_sessions = LRUDict(1024)
+_sessions_reset = LRUDict(1024)
+_sessions_lock = threading.Lock()
+
 
 def _get_pool(dbname):
     database_list = Pool.database_list()
@@ -76,13 +85,35 @@ def logout(dbname, user, session, context=None):
             user, _get_remote_addr(context), dbname)
 
 
+def _check_cached(dbname, user, session):
+    "Return True if the session was validated and no cache was cleared since"
+    with _sessions_lock:
+        expire, generation = _sessions.get(
+            (dbname, user, session), (None, None))
+    return bool(expire
+        and datetime.datetime.now() < expire
+        and generation == Cache.generation(dbname))
+
+
 def check(dbname, user, session, context=None):
+    if _check_cached(dbname, user, session):
+        logger.debug("session cached for '%s' from '%s' on database '%s'",
+            user, _get_remote_addr(context), dbname)
+        return user
     for count in range(config.getint('database', 'retry'), -1, -1):
         with Transaction().start(dbname, user, context=context) as transaction:
+            # Read before the check to not cache a session removed meanwhile
+            generation = Cache.generation(dbname)
             pool = _get_pool(dbname)
             Session = pool.get('ir.session')
             try:
                 find = Session.check(user, session)
+                if find:
+                    expire = Session.check_expire(user, session)
+                    if expire and generation is not None:
+                        with _sessions_lock:
+                            _sessions[dbname, user, session] = (
+                                expire, generation)
                 break
             except backend.DatabaseOperationalError:
                 if count:
@@ -138,10 +169,25 @@ def check_timeout(dbname, user, session, context=None):
 
 
 def reset(dbname, session, context):
+    if not config.getboolean('session', 'reset', default=True):
+        return
+    # Session.reset does not write more often than a tenth of the timeout
+    now = datetime.datetime.now()
+    reset_timeout = datetime.timedelta(
+        seconds=config.getint('session', 'timeout') // 10)
+    with _sessions_lock:
+        last_reset = _sessions_reset.get((dbname, session))
+    if last_reset and now - reset_timeout < last_reset:
+        return
     try:
         with Transaction().start(dbname, 0, context=context, autocommit=True):
             pool = _get_pool(dbname)
             Session = pool.get('ir.session')
-            Session.reset(session)
+            last_reset = Session.reset(session)
     except backend.DatabaseOperationalError:
         logger.debug('Reset session failed', exc_info=True)
+    else:
+        if last_reset:
+            # Wait from the stored timestamp to not delay it more
+            with _sessions_lock:
+                _sessions_reset[dbname, session] = last_reset
@@ -11,6 +11,7 @@ from collections import namedtuple
 from contextlib import contextmanager
 
 status = dict()
+metrics = dict()
 logger = logging.getLogger(__name__)
 address = 'trytond-stat.socket'
 
@@ -45,6 +46,7 @@ def log():
         'id': '%s@%s' % (os.getpid(), platform.node()),
         'status': msg,
         'caches': list(Cache.stats()),
+        'metrics': metrics,
         }
 
 
@@ -221,6 +221,12 @@ class ModelLock(ModelSQL):
     __name__ = 'test.modelsql.lock'
 
 
+class ModelDeferredValidation(ModelSQL):
+    "Model to test deferred validation"
+    __name__ = 'test.modelsql.deferred_validation'
+    name = fields.Char("Name", required=True)
+
+
 def register(module):
     Pool.register(
         ModelSQLRead,
@@ -244,4 +250,5 @@ def register(module):
         ModelUnique,
         ModelExclude,
         ModelLock,
+        ModelDeferredValidation,
         module=module, type_='model')
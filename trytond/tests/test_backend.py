@@ -2,12 +2,18 @@
 # this repository contains the full copyright notices and license terms.
 import datetime as dt
 import math
+import threading
+import time
 import unittest
+from unittest.mock import patch
 
 from sql import Literal, Select, functions
 from sql.functions import CurrentTimestamp, DateTrunc, ToChar
 
-from trytond.tests.test_tryton import activate_module, with_transaction
+from trytond import backend, status
+from trytond.backend.pool import ConnectionPool, PoolError, PoolTimeoutError
+from trytond.tests.test_tryton import (
+    DB_NAME, activate_module, with_transaction)
 from trytond.transaction import Transaction
 
 
@@ -171,3 +177,267 @@ class BackendTestCase(unittest.TestCase):
                     cursor.execute(*Select([DateTrunc(type_, date)]))
                     value, = cursor.fetchone()
                     self.assertEqual(str(value), str(result))
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    "Test ConnectionPool"
+
+    def pool(self, **kwargs):
+        return ConnectionPool(FakeConnection, **kwargs)
+
+    def test_reuse(self):
+        "Test connection is reused"
+        pool = self.pool()
+
+        connection = pool.getconn()
+        pool.putconn(connection)
+
+        self.assertIs(pool.getconn(), connection)
+
+    def test_minconn(self):
+        "Test minimal connections are opened"
+        pool = self.pool(minconn=2)
+
+        self.assertEqual(pool.metrics['size'], 2)
+        self.assertEqual(pool.metrics['used'], 0)
+
+    def test_timeout(self):
+        "Test waiting a connection times out"
+        pool = self.pool(maxconn=1, timeout=0.01)
+        pool.getconn()
+
+        with self.assertRaises(PoolTimeoutError):
+            pool.getconn()
+        self.assertEqual(pool.metrics['waiting'], 0)
+
+    def test_fifo(self):
+        "Test waiting threads are served in arrival order"
+        pool = self.pool(maxconn=1, timeout=5)
+        connection = pool.getconn()
+        served = []
+
+        def get(name):
+            connection = pool.getconn()
+            served.append((name, connection))
+            pool.putconn(connection)
+
+        threads = []
+        for name in range(3):
+            thread = threading.Thread(target=get, args=(name,))
+            thread.start()
+            threads.append(thread)
+            while pool.metrics['waiting'] <= name:
+                time.sleep(0.001)
+        pool.putconn(connection)
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual([n for n, _ in served], [0, 1, 2])
+        self.assertTrue(all(c is connection for _, c in served))
+
+    def test_waiter_creates_on_discard(self):
+        "Test waiting thread gets a new connection when one is discarded"
+        pool = self.pool(maxconn=1, timeout=5)
+        connection = pool.getconn()
+        result = []
+        thread = threading.Thread(target=lambda: result.append(pool.getconn()))
+        thread.start()
+        while not pool.metrics['waiting']:
+            time.sleep(0.001)
+
+        pool.putconn(connection, close=True)
+        thread.join()
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(result[0], connection)
+        self.assertEqual(pool.metrics['size'], 1)
+
+    def test_lifetime(self):
+        "Test expired connection is replaced"
+        pool = self.pool(lifetime=0)
+        connection = pool.getconn()
+        pool.putconn(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertIsNot(pool.getconn(), connection)
+        self.assertEqual(pool.metrics['size'], 1)
+
+    def test_check(self):
+        "Test unhealthy connection is replaced"
+        def check(connection):
+            raise Exception("unhealthy")
+        pool = self.pool(check=check, check_interval=0)
+        connection = pool.getconn()
+        pool.putconn(connection)
+
+        self.assertIsNot(pool.getconn(), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.metrics['size'], 1)
+
+    def test_reset(self):
+        "Test connection failing reset is discarded"
+        def reset(connection):
+            raise Exception("lost")
+        pool = self.pool(reset=reset)
+        connection = pool.getconn()
+
+        pool.putconn(connection)
+
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.metrics['size'], 0)
+
+    def test_putconn_unknown(self):
+        "Test putting back an unknown connection"
+        pool = self.pool()
+
+        with self.assertRaises(PoolError):
+            pool.putconn(FakeConnection())
+
+    def test_metrics(self):
+        "Test metrics"
+        pool = self.pool()
+        connection = pool.getconn()
+        pool.getconn()
+
+        self.assertEqual(pool.metrics['size'], 2)
+        self.assertEqual(pool.metrics['used'], 2)
+        self.assertEqual(pool.metrics['wait']['count'], 2)
+        self.assertEqual(pool.metrics['checkout']['count'], 0)
+
+        pool.putconn(connection)
+
+        self.assertEqual(pool.metrics['used'], 1)
+        self.assertEqual(pool.metrics['checkout']['count'], 1)
+        self.assertEqual(
+            sum(pool.metrics['checkout']['buckets'].values()), 1)
+
+    def test_closeall(self):
+        "Test closing the pool"
+        pool = self.pool()
+        idle, used = pool.getconn(), pool.getconn()
+        pool.putconn(idle)
+
+        pool.closeall()
+
+        self.assertTrue(idle.closed)
+        self.assertFalse(used.closed)
+        with self.assertRaises(PoolError):
+            pool.getconn()
+        pool.putconn(used)
+        self.assertTrue(used.closed)
+        self.assertEqual(pool.metrics['size'], 0)
+
+    def test_closeall_waiting(self):
+        "Test closing the pool fails the waiting threads"
+        pool = self.pool(maxconn=1, timeout=5)
+        connection = pool.getconn()
+        errors = []
+
+        def get():
+            try:
+                pool.getconn()
+            except PoolError as exception:
+                errors.append(exception)
+        thread = threading.Thread(target=get)
+        thread.start()
+        while not pool.metrics['waiting']:
+            time.sleep(0.001)
+
+        pool.closeall()
+        thread.join()
+
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(pool.metrics['waiting'], 0)
+        pool.putconn(connection, close=True)
+        self.assertEqual(pool.metrics['size'], 0)
+
+
+@unittest.skipUnless(backend.name == 'postgresql',
+    "The connection pool of PostgreSQL is tested only with PostgreSQL")
+class PostgreSQLConnectionPoolTestCase(unittest.TestCase):
+    "Test the connection pool of PostgreSQL"
+
+    @classmethod
+    def setUpClass(cls):
+        activate_module('tests')
+
+    def pool(self):
+        from trytond.backend.postgresql import database
+        pool = database.connection_pool(
+            'test', database.Database._connection_params(DB_NAME), 0)
+        self.addCleanup(pool.closeall)
+        self.addCleanup(status.metrics.pop, 'pool test', None)
+        return pool
+
+    def test_connection_pool(self):
+        "Test connection pool"
+        pool = self.pool()
+
+        connection = pool.getconn()
+        cursor = connection.cursor()
+        cursor.execute('SELECT 1')
+        pool.putconn(connection)
+
+        self.assertIs(status.metrics['pool test'], pool.metrics)
+        self.assertEqual(pool.metrics['size'], 1)
+        self.assertIs(pool.getconn(), connection)
+
+    def test_reset_connection(self):
+        "Test connection put back in transaction is rolled back"
+        from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+        pool = self.pool()
+        connection = pool.getconn()
+        cursor = connection.cursor()
+        cursor.execute('SELECT 1')
+
+        pool.putconn(connection)
+
+        self.assertEqual(
+            connection.get_transaction_status(), TRANSACTION_STATUS_IDLE)
+
+    def test_reset_connection_closed(self):
+        "Test closed connection put back is discarded"
+        pool = self.pool()
+        connection = pool.getconn()
+        connection.close()
+
+        pool.putconn(connection)
+
+        self.assertEqual(pool.metrics['size'], 0)
+
+    def test_check_connection(self):
+        "Test idle connection is checked"
+        pool = self.pool()
+        pool.check_interval = 0
+        connection = pool.getconn()
+        pool.putconn(connection)
+
+        with patch.object(pool, '_check', wraps=pool._check) as check:
+            self.assertIs(pool.getconn(), connection)
+        check.assert_called_once_with(connection)
+
+    def test_external_pooler_readonly(self):
+        "Test readonly transaction with external pooler"
+        from trytond.backend.postgresql import database
+        db = backend.Database(DB_NAME).connect()
+
+        with patch.object(database, '_external_pooler', True):
+            connection = db.get_connection(readonly=True)
+            try:
+                cursor = connection.cursor()
+                cursor.execute('SHOW transaction_read_only')
+                value, = cursor.fetchone()
+                self.assertFalse(db.has_channel())
+            finally:
+                db.put_connection(connection)
+
+        self.assertEqual(value, 'on')
@@ -1,12 +1,16 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
+import asyncio
+import json
 import os
 import time
 import unittest
 from unittest.mock import patch
 
 from trytond import backend, bus
-from trytond.bus import Bus, _MessageQueue, notify
+from trytond.asgi import application
+from trytond.bus import (
+    AsyncLongPollingBus, Bus, _AsyncListener, _MessageQueue, notify)
 from trytond.tests.test_tryton import (
     DB_NAME, activate_module, with_transaction)
 from trytond.transaction import Transaction
@@ -73,6 +77,274 @@ class MessageQueueTestCase(unittest.TestCase):
 
         self.assertEqual(content, {'message_id': 10})
 
+    def test_get_next_last(self):
+        "Testing get_next when requesting the last message"
+        with patch('time.time', self._time):
+            mq = _MessageQueue(5)
+            for x in range(3):
+                mq.append('channel', {'message_id': x})
+            channel, content = mq.get_next({'channel'}, 2)
+
+        self.assertEqual((channel, content), (None, None))
+
+    def test_get_next_other_channel(self):
+        "Testing get_next when requesting a message of another channel"
+        with patch('time.time', self._time):
+            mq = _MessageQueue(5)
+            for x in range(4):
+                mq.append('odd' if x % 2 else 'even', {'message_id': x})
+            channel, content = mq.get_next({'odd'}, 2)
+
+        self.assertEqual(content, {'message_id': 1})
+
+    def test_get_next_across_channels(self):
+        "Testing get_next follows the arrival order across channels"
+        with patch('time.time', self._time):
+            mq = _MessageQueue(10)
+            for x in range(6):
+                mq.append(['a', 'b', 'c'][x % 3], {'message_id': x})
+            contents = [mq.get_next({'a', 'c'}, x)[1] for x in [0, 2, 3]]
+
+        self.assertEqual(contents, [
+                {'message_id': 2}, {'message_id': 3}, {'message_id': 5}])
+
+    def test_expire(self):
+        "Testing expired messages are removed"
+        with patch('time.time', self._time):
+            mq = _MessageQueue(5)
+            for x in range(150):
+                mq.append('odd' if x % 2 else 'even', {'message_id': x})
+            mq.get_next({'odd'})
+
+        self.assertEqual(len(mq._order), 5)
+        self.assertEqual(set(mq._index), set(range(145, 150)))
+        self.assertEqual(
+            sum(len(b) for b in mq._channels.values()), 5)
+        self.assertLess(
+            sum(len(b.sequences) for b in mq._channels.values()), 150)
+
+    def test_expire_channel(self):
+        "Testing channels without message are removed"
+        with patch('time.time', self._time):
+            mq = _MessageQueue(5)
+            mq.append('old', {'message_id': 0})
+            for x in range(1, 10):
+                mq.append('channel', {'message_id': x})
+            mq.get_next({'channel'})
+
+        self.assertNotIn('old', mq._channels)
+
+
+class AsyncBusTestCase(unittest.IsolatedAsyncioTestCase):
+    "Test AsyncLongPollingBus"
+
+    def setUp(self):
+        super().setUp()
+        reset_polling_timeout = bus._long_polling_timeout
+        bus._long_polling_timeout = 0.1
+        self.addCleanup(
+            setattr, bus, '_long_polling_timeout', reset_polling_timeout)
+
+        async def start_listener(database, loop):
+            return _AsyncListener(database, loop)
+        patcher = patch.object(
+            AsyncLongPollingBus, '_start_listener', start_listener)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(AsyncLongPollingBus._listeners.clear)
+
+    async def listener(self):
+        return await AsyncLongPollingBus._get_listener('db')
+
+    async def test_subscribe_nothing(self):
+        "Test subscribe with nothing"
+        response = await AsyncLongPollingBus.subscribe('db', {'user:1'})
+
+        self.assertEqual(response, {'message': None, 'channel': None})
+
+    async def test_subscribe_message(self):
+        "Test subscribe receives a message"
+        listener = await self.listener()
+        asyncio.get_running_loop().call_soon(
+            listener.dispatch, 'user:1', {'message_id': 1})
+
+        response = await AsyncLongPollingBus.subscribe('db', {'user:1'})
+
+        self.assertEqual(
+            response, {'message': {'message_id': 1}, 'channel': 'user:1'})
+        self.assertFalse(listener.waiters)
+
+    async def test_subscribe_queued_message(self):
+        "Test subscribe receives a queued message"
+        listener = await self.listener()
+        listener.dispatch('user:1', {'message_id': 1})
+        listener.dispatch('user:1', {'message_id': 2})
+
+        response = await AsyncLongPollingBus.subscribe('db', {'user:1'}, 1)
+
+        self.assertEqual(
+            response, {'message': {'message_id': 2}, 'channel': 'user:1'})
+
+    async def test_subscribe_other_channel(self):
+        "Test subscribe ignores other channels"
+        listener = await self.listener()
+        asyncio.get_running_loop().call_soon(
+            listener.dispatch, 'user:2', {'message_id': 1})
+
+        response = await AsyncLongPollingBus.subscribe('db', {'user:1'})
+
+        self.assertEqual(response, {'message': None, 'channel': None})
+
+    async def test_subscribe_many(self):
+        "Test a message is dispatched to all subscribers"
+        listener = await self.listener()
+        subscriptions = [
+            asyncio.ensure_future(
+                AsyncLongPollingBus.subscribe('db', {'user:1', 'client:x'}))
+            for _ in range(100)]
+        await asyncio.sleep(0)
+        self.assertEqual(len(listener.waiters['user:1']), 100)
+
+        listener.dispatch('client:x', {'message_id': 1})
+        responses = await asyncio.gather(*subscriptions)
+
+        self.assertEqual(responses, [
+                {'message': {'message_id': 1}, 'channel': 'client:x'}] * 100)
+        self.assertFalse(listener.waiters)
+
+    async def test_listener_shared(self):
+        "Test the listener is shared by the subscriptions"
+        listener1, listener2 = await asyncio.gather(
+            self.listener(), self.listener())
+
+        self.assertIs(listener1, listener2)
+
+
+class ASGITestCase(unittest.IsolatedAsyncioTestCase):
+    "Test ASGI application"
+
+    def setUp(self):
+        super().setUp()
+        reset_allow_subscribe = bus._allow_subscribe
+        bus._allow_subscribe = True
+        self.addCleanup(
+            setattr, bus, '_allow_subscribe', reset_allow_subscribe)
+
+    async def call(self, path, method='POST', body=b'', headers=None):
+        messages = [{'type': 'http.request', 'body': body}]
+        sent = []
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            # The client stays connected
+            await asyncio.get_running_loop().create_future()
+
+        async def send(message):
+            sent.append(message)
+
+        await application({
+                'type': 'http',
+                'method': method,
+                'path': path,
+                'headers': headers or [],
+                }, receive, send)
+        start, body = sent
+        return start['status'], body['body']
+
+    async def test_not_found(self):
+        "Test unknown path"
+        status, _ = await self.call('/db/unknown')
+
+        self.assertEqual(status, 404)
+
+    async def test_method_not_allowed(self):
+        "Test GET on bus"
+        status, _ = await self.call('/db/bus', method='GET')
+
+        self.assertEqual(status, 405)
+
+    async def test_not_allowed_subscribe(self):
+        "Test subscribe not allowed"
+        bus._allow_subscribe = False
+
+        status, _ = await self.call('/db/bus')
+
+        self.assertEqual(status, 501)
+
+    async def test_unauthorized(self):
+        "Test subscribe without authentication"
+        status, _ = await self.call(
+            '/db/bus', body=json.dumps({'channels': []}).encode())
+
+        self.assertEqual(status, 401)
+
+    async def test_subscribe(self):
+        "Test subscribe"
+        async def subscribe(database, channels, last_message=None):
+            return AsyncLongPollingBus.create_response(
+                'user:1', {'database': database, 'channels': list(channels)})
+
+        with patch(
+                'trytond.protocols.jsonrpc.JSONRequest.user_id', 1), \
+                patch.object(AsyncLongPollingBus, 'subscribe', subscribe):
+            status, body = await self.call(
+                '/db/bus',
+                body=json.dumps({'channels': ['user:2']}).encode(),
+                headers=[
+                    (b'content-type', b'application/json'),
+                    (b'authorization', b'Session Zm9vOjE6YmFy'),
+                    ])
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {
+                'channel': 'user:1',
+                'message': {'database': 'db', 'channels': ['user:1']},
+                })
+
+    async def test_subscribe_disconnect(self):
+        "Test subscribe stops when the client disconnects"
+        cancelled = []
+
+        async def subscribe(database, channels, last_message=None):
+            try:
+                await asyncio.get_running_loop().create_future()
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        messages = [
+            {'type': 'http.request',
+                'body': json.dumps({'channels': []}).encode()},
+            {'type': 'http.disconnect'},
+            ]
+        sent = []
+
+        async def receive():
+            # Let the subscription start before disconnecting
+            await asyncio.sleep(0)
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        with patch(
+                'trytond.protocols.jsonrpc.JSONRequest.user_id', 1), \
+                patch.object(AsyncLongPollingBus, 'subscribe', subscribe):
+            await asyncio.wait_for(application({
+                        'type': 'http',
+                        'method': 'POST',
+                        'path': '/db/bus',
+                        'headers': [
+                            (b'content-type', b'application/json'),
+                            (b'authorization', b'Session Zm9vOjE6YmFy'),
+                            ],
+                        }, receive, send), 5)
+            await asyncio.sleep(0)
+
+        self.assertEqual(sent, [])
+        self.assertEqual(cancelled, [True])
+
 
 class BusTestCase(unittest.TestCase):
     "Test Bus"
@@ -125,6 +125,18 @@ class MemoryCacheTestCase(unittest.TestCase):
         self.wait_cache_sync(after=commit_time)
         self.assertEqual(cache.get('foo'), 'baz')
 
+    def test_memory_cache_generation(self):
+        "Test MemoryCache generation changes when cleared"
+        generation = MemoryCache.generation(DB_NAME)
+
+        with Transaction().start(DB_NAME, USER) as transaction:
+            cache.clear()
+            commit_time = dt.datetime.now()
+            transaction.commit()
+        self.wait_cache_sync(after=commit_time)
+
+        self.assertNotEqual(MemoryCache.generation(DB_NAME), generation)
+
     def test_memory_cache_nested_transactions(self):
         "Test MemoryCache with nested transactions"
         # Create entry in the cache table to trigger 2 updates
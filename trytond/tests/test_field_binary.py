@@ -29,6 +29,9 @@ class FieldBinaryTestCase(unittest.TestCase):
         config.set('database', 'path', dtemp)
         self.addCleanup(config.set, 'database', 'path', path)
         self.addCleanup(shutil.rmtree, dtemp)
+        secret = config.get('web', 'secret')
+        config.set('web', 'secret', 'test')
+        self.addCleanup(config.set, 'web', 'secret', secret or '')
 
     @with_transaction()
     def test_create(self):
@@ -160,6 +163,52 @@ class FieldBinaryTestCase(unittest.TestCase):
 
         self.assertEqual(binary.binary, len(b'bar'))
 
+    @with_transaction()
+    def test_read_url(self):
+        "Test read binary URL"
+        Binary = Pool().get('test.binary')
+        binary, empty = Binary.create([{
+                    'binary': cast(b'foo'),
+                    }, {
+                    'binary': None,
+                    }])
+
+        with Transaction().set_context({'test.binary.binary': 'url'}):
+            binary, empty = Binary.read([binary.id, empty.id], ['binary'])
+
+        self.assertIn(
+            '/binary/test.binary/binary/%d?' % binary['id'], binary['binary'])
+        self.assertIsNone(empty['binary'])
+
+    @with_transaction()
+    def test_read_url_without_secret(self):
+        "Test read binary URL without secret"
+        Binary = Pool().get('test.binary')
+        binary, = Binary.create([{
+                    'binary': cast(b'foo'),
+                    }])
+        config.set('web', 'secret', '')
+
+        with Transaction().set_context({'test.binary.binary': 'url'}):
+            with self.assertRaises(ValueError):
+                Binary.read([binary.id], ['binary'])
+
+    @with_transaction()
+    def test_read_url_filestorage(self):
+        "Test read binary URL with filestorage"
+        Binary = Pool().get('test.binary_filestorage')
+        binary, = Binary.create([{
+                    'binary': cast(b'foo'),
+                    }])
+
+        with Transaction().set_context(
+                {'test.binary_filestorage.binary': 'url'}):
+            binary = Binary(binary.id)
+
+        self.assertIn(
+            '/binary/test.binary_filestorage/binary/%d?' % binary.id,
+            binary.binary)
+
     @with_transaction()
     def test_write(self):
         "Test write binary"
@@ -2,6 +2,10 @@
 # this repository contains the full copyright notices and license terms.
 import datetime
 import unittest
+from unittest.mock import patch
+
+from sql import Literal
+from sql.aggregate import Count
 
 from trytond import backend
 from trytond.model.exceptions import AccessError
@@ -503,3 +507,166 @@ class HistoryTestCase(unittest.TestCase):
 
             self.assertEqual({r.value for r in records}, {1})
             self.assertEqual(len(records), n)
+
+    def _test_read_many(self):
+        pool = Pool()
+        History = pool.get('test.history')
+        transaction = Transaction()
+
+        histories = History.create([{'value': i} for i in range(10)])
+        transaction.commit()
+        first = max(h.create_date for h in History.browse(histories))
+
+        for history in histories:
+            history.value += 10
+        History.save(histories)
+        transaction.commit()
+
+        with Transaction().set_context(_datetime=first):
+            records = History.read([h.id for h in histories], ['value'])
+        self.assertEqual(
+            [r['value'] for r in records], list(range(10)))
+
+        with Transaction().set_context(_datetime=datetime.datetime.max):
+            records = History.read([h.id for h in histories], ['value'])
+        self.assertEqual(
+            [r['value'] for r in records], list(range(10, 20)))
+
+    @with_transaction()
+    def test_read_many(self):
+        "Test read history of many records"
+        self._test_read_many()
+
+    @with_transaction()
+    def test_read_many_no_window(self):
+        "Test read history of many records without window functions"
+        database = Transaction().database
+        with patch.object(
+                database, 'has_window_functions', return_value=False):
+            self._test_read_many()
+
+    def _history_count(self, Model, id_):
+        cursor = Transaction().connection.cursor()
+        history_table = Model.__table_history__()
+        cursor.execute(*history_table.select(
+                Count(Literal('*')), where=history_table.id == id_))
+        return cursor.fetchone()[0]
+
+    @with_transaction()
+    def test_history_buffer(self):
+        "Test history buffered until flush"
+        pool = Pool()
+        History = pool.get('test.history')
+        transaction = Transaction()
+
+        with patch('trytond.model.modelsql._history_mode', 'buffer'):
+            history = History(value=1)
+            history.save()
+            for history.value in range(2, 5):
+                history.save()
+
+            self.assertEqual(self._history_count(History, history.id), 0)
+
+            transaction.flush_history()
+
+        self.assertEqual(self._history_count(History, history.id), 1)
+        self.assertFalse(transaction.history_records)
+
+    @with_transaction()
+    def test_history_buffer_read(self):
+        "Test history buffer flushed before reading history"
+        pool = Pool()
+        History = pool.get('test.history')
+        transaction = Transaction()
+
+        with patch('trytond.model.modelsql._history_mode', 'buffer'):
+            history = History(value=1)
+            history.save()
+            history_id = history.id
+
+            with transaction.set_context(
+                    _datetime=datetime.datetime.max):
+                history = History(history_id)
+                self.assertEqual(history.value, 1)
+
+        self.assertEqual(self._history_count(History, history_id), 1)
+
+    @with_transaction()
+    def test_history_buffer_delete(self):
+        "Test history buffer flushed before delete"
+        pool = Pool()
+        History = pool.get('test.history')
+
+        with patch('trytond.model.modelsql._history_mode', 'buffer'):
+            history = History(value=1)
+            history.save()
+            history_id = history.id
+            History.delete([history])
+
+        # Created and deleted entries
+        self.assertEqual(self._history_count(History, history_id), 2)
+
+    @with_transaction()
+    def test_history_trigger(self):
+        "Test history filled by trigger"
+        pool = Pool()
+        History = pool.get('test.history')
+        table = History.__table_handler__()
+        columns, update_columns = History._history_trigger_columns()
+
+        table.history_trigger_action(columns, update_columns)
+        try:
+            with patch('trytond.model.modelsql._history_mode', 'trigger'):
+                history = History(value=1)
+                history.save()
+                history.value = 2
+                history.save()
+
+                self.assertEqual(
+                    self._history_count(History, history.id), 2)
+
+                with Transaction().set_context(
+                        _datetime=datetime.datetime.max):
+                    self.assertEqual(History(history.id).value, 2)
+        finally:
+            table.history_trigger_action(
+                columns, update_columns, action='remove')
+
+    @with_transaction()
+    def test_history_trigger_setter(self):
+        "Test history filled by trigger keeps one row per write"
+        pool = Pool()
+        History = pool.get('test.history')
+        table = History.__table_handler__()
+        history_table = History.__table_history__()
+        sql_table = History.__table__()
+        cursor = Transaction().connection.cursor()
+        columns, _ = History._history_trigger_columns()
+        # value is written like a setter field
+        update_columns = ['write_date', 'value']
+
+        table.history_trigger_action(columns, update_columns)
+        try:
+            with patch('trytond.model.modelsql._history_mode', 'trigger'):
+                history = History(value=1)
+                history.save()
+                history.value = 2
+                history.save()
+                cursor.execute(*sql_table.update(
+                        [sql_table.value], [3],
+                        where=sql_table.id == history.id))
+                cursor.execute(*sql_table.update(
+                        [sql_table.value], [sql_table.value],
+                        where=sql_table.id == history.id))
+
+                self.assertEqual(
+                    self._history_count(History, history.id), 2)
+                cursor.execute(*history_table.select(
+                        history_table.value,
+                        where=(history_table.id == history.id)
+                        & (history_table.write_date != None),  # noqa: E711
+                        ))
+                self.assertEqual(cursor.fetchall(), [(3,)])
+        finally:
+            table.history_trigger_action(
+                columns, update_columns, action='remove')
@@ -7,6 +7,7 @@ from unittest.mock import ANY, Mock, patch
 
 from dateutil.relativedelta import relativedelta
 
+from trytond import backend, security
 from trytond.config import config
 from trytond.pool import Pool
 from trytond.pyson import Eval, If, PYSONEncoder
@@ -33,6 +34,15 @@ class IrTestCase(ModuleTestCase):
                 ])
         self.assertEqual(record.name, "Language")
 
+    @with_transaction()
+    def test_menu_search_lock(self):
+        "Test searching menu with lock"
+        pool = Pool()
+        Menu = pool.get('ir.ui.menu')
+
+        self.assertEqual(
+            Menu.search([], lock='wait'), Menu.search([]))
+
     @with_transaction()
     def test_model_search_order(self):
         "Test searching and ordering on name of model"
@@ -385,6 +395,164 @@ class IrTestCase(ModuleTestCase):
                 'cc': ['fallback@example.com'],
                 })
 
+    @with_transaction()
+    def test_cron_claim(self):
+        "Test claim due crons"
+        pool = Pool()
+        Cron = pool.get('ir.cron')
+        now = datetime.datetime.now()
+        Cron.delete(Cron.search([]))
+        later, due, never = Cron.create([{
+                    'interval_number': 1,
+                    'interval_type': 'days',
+                    'method': 'ir.error|clean',
+                    'next_call': now + datetime.timedelta(hours=1),
+                    }, {
+                    'interval_number': 1,
+                    'interval_type': 'days',
+                    'method': 'ir.error|clean',
+                    'next_call': now - datetime.timedelta(hours=1),
+                    }, {
+                    'interval_number': 1,
+                    'interval_type': 'days',
+                    'method': 'ir.error|clean',
+                    'next_call': None,
+                    }])
+
+        self.assertEqual(Cron.claim(now), never)
+        never.next_call = now + datetime.timedelta(days=1)
+        never.save()
+        self.assertEqual(Cron.claim(now), due)
+        due.next_call = now + datetime.timedelta(days=1)
+        due.save()
+        self.assertIsNone(Cron.claim(now))
+
+    def test_cron_run_claim_retry(self):
+        "Test run retries to claim a cron on operational error"
+        pool = Pool(DB_NAME)
+        Cron = pool.get('ir.cron')
+
+        with patch.object(Cron, 'claim', side_effect=[
+                    backend.DatabaseOperationalError, None]) as claim:
+            Cron.run(DB_NAME)
+
+        self.assertEqual(claim.call_count, 2)
+
+    @with_transaction()
+    def test_cron_run_once_queue_batch(self):
+        "Test run cron with queue batch"
+        pool = Pool()
+        Cron = pool.get('ir.cron')
+        Error = pool.get('ir.error')
+        cron = Cron(
+            interval_number=1, interval_type='days', method='ir.error|clean',
+            queue_batch=10)
+        cron.save()
+
+        with patch.object(Error, 'clean') as clean:
+            clean.side_effect = lambda: self.assertEqual(
+                Transaction().context.get('queue_batch'), 10)
+            cron.run_once()
+
+        clean.assert_called_once_with()
+
+    @with_transaction()
+    def test_session_check(self):
+        "Test check session"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        user = Transaction().user
+        key = Session.new()
+
+        self.assertTrue(Session.check(user, key))
+        with patch.object(Session, 'search') as search:
+            self.assertTrue(Session.check(user, key))
+        search.assert_not_called()
+        self.assertIsNone(Session.check(user, 'foo'))
+
+    @with_transaction()
+    def test_session_check_removed(self):
+        "Test check removed session"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        user = Transaction().user
+        key = Session.new()
+        self.assertTrue(Session.check(user, key))
+
+        Session.remove(key)
+
+        self.assertIsNone(Session.check(user, key))
+
+    @with_transaction()
+    def test_session_check_expired(self):
+        "Test check expired session"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        user = Transaction().user
+        key = Session.new()
+
+        with patch.object(config, 'getint', return_value=0):
+            self.assertFalse(Session.check(user, key))
+        self.assertFalse(Session.search([('key', '=', key)]))
+
+    @with_transaction()
+    def test_session_check_expire(self):
+        "Test check session is not cached beyond max_age"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        user = Transaction().user
+        key = Session.new()
+        session, = Session.search([('key', '=', key)])
+
+        with patch.object(config, 'getint', return_value=10):
+            self.assertTrue(Session.check(user, key))
+
+        self.assertLessEqual(
+            Session.check_expire(user, key),
+            session.create_date + datetime.timedelta(seconds=10))
+
+    def test_security_check_cached(self):
+        "Test security check of cached session without transaction"
+        pool = Pool(DB_NAME)
+        Session = pool.get('ir.session')
+        with Transaction().start(DB_NAME, USER) as transaction:
+            key = Session.new()
+            transaction.commit()
+
+        self.assertEqual(security.check(DB_NAME, USER, key), USER)
+        with patch.object(Transaction, 'start') as start:
+            self.assertEqual(security.check(DB_NAME, USER, key), USER)
+        start.assert_not_called()
+
+        security.logout(DB_NAME, USER, key)
+        self.assertIsNone(security.check(DB_NAME, USER, key))
+
+    @with_transaction()
+    def test_session_reset(self):
+        "Test reset session returns the stored timestamp"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        key = Session.new()
+
+        last_reset = Session.reset(key)
+        session, = Session.search([('key', '=', key)])
+
+        self.assertEqual(last_reset, session.write_date)
+        self.assertEqual(Session.reset(key), last_reset)
+
+    @with_transaction()
+    def test_session_clean(self):
+        "Test clean sessions"
+        pool = Pool()
+        Session = pool.get('ir.session')
+        key = Session.new()
+
+        Session.clean(datetime.datetime.now() - datetime.timedelta(days=1))
+        self.assertTrue(Session.search([('key', '=', key)]))
+
+        Session.clean(datetime.datetime.now() + datetime.timedelta(days=1))
+        self.assertFalse(Session.search([('key', '=', key)]))
+
 
 class IrCronTestCase(unittest.TestCase):
     "Test ir.cron features"
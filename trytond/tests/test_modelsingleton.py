@@ -130,6 +130,15 @@ class ModelSingletonTestCase(unittest.TestCase):
         singletons = Singleton.search([('name', '=', 'bar')])
         self.assertEqual(singletons, [])
 
+    @with_transaction()
+    def test_search_lock(self):
+        "Test search with lock"
+        pool = Pool()
+        Singleton = pool.get('test.singleton')
+
+        singletons = Singleton.search([], lock='wait')
+        self.assertEqual(list(map(int, singletons)), [1])
+
     @with_transaction()
     def test_all_cache_cleared(self):
         "Test all cache cleared"
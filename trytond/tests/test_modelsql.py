@@ -396,6 +396,76 @@ class ModelSQLTestCase(unittest.TestCase):
                     call([records[1]], 'field', 2),
                     ])
 
+    @with_transaction()
+    def test_defer_validation(self):
+        "Test validation is deferred until flush"
+        pool = Pool()
+        Model = pool.get('test.modelsql.deferred_validation')
+        transaction = Transaction()
+
+        with transaction.set_context(_defer_validation=True):
+            record, = Model.create([{}])
+
+        with self.assertRaises(RequiredValidationError):
+            transaction.flush_validation()
+        self.assertFalse(transaction.deferred_records)
+
+    @with_transaction()
+    def test_defer_validation_fixed(self):
+        "Test deferred validation of record fixed before flush"
+        pool = Pool()
+        Model = pool.get('test.modelsql.deferred_validation')
+        transaction = Transaction()
+
+        with transaction.set_context(_defer_validation=True):
+            record, = Model.create([{}])
+            Model.write([record], {'name': "Foo"})
+
+        transaction.flush_validation()
+
+    @with_transaction()
+    def test_defer_validation_once(self):
+        "Test deferred validation runs once per record"
+        pool = Pool()
+        Model = pool.get('test.modelsql.deferred_validation')
+        transaction = Transaction()
+
+        records = Model.create([{'name': "Foo"}, {'name': "Bar"}])
+        with patch.object(Model, 'validate') as validate, \
+                transaction.set_context(_defer_validation=True):
+            for i in range(5):
+                Model.write(records, {'name': str(i)})
+            validate.assert_not_called()
+
+            transaction.flush_validation()
+            validate.assert_called_once_with(records)
+
+    @with_transaction()
+    def test_defer_validation_deleted(self):
+        "Test deferred validation skips deleted records"
+        pool = Pool()
+        Model = pool.get('test.modelsql.deferred_validation')
+        transaction = Transaction()
+
+        with transaction.set_context(_defer_validation=True):
+            record, = Model.create([{}])
+        Model.delete([record])
+
+        transaction.flush_validation()
+
+    @with_transaction()
+    def test_defer_validation_commit(self):
+        "Test deferred validation is flushed on commit"
+        pool = Pool()
+        Model = pool.get('test.modelsql.deferred_validation')
+        transaction = Transaction()
+
+        with transaction.set_context(_defer_validation=True):
+            Model.create([{}])
+
+        with self.assertRaises(RequiredValidationError):
+            transaction.commit()
+
     @with_transaction()
     def test_integrity_error_with_created_record(self):
         "Test integrity error with created record"
@@ -662,6 +732,85 @@ class ModelSQLTestCase(unittest.TestCase):
                 with self.assertRaises(backend.DatabaseOperationalError):
                     record.lock()
 
+    @unittest.skipIf(backend.name == 'sqlite',
+        'SQLite does not have lock at table level but on file')
+    @with_transaction()
+    def test_record_lock_skip_locked(self):
+        "Test record lock skipping locked records"
+        pool = Pool()
+        Model = pool.get('test.modelsql.lock')
+        transaction = Transaction()
+        record1_id, record2_id = [r.id for r in Model.create([{}, {}])]
+        transaction.commit()
+
+        with transaction.new_transaction():
+            self.assertEqual(
+                Model.lock([Model(record1_id)]), [Model(record1_id)])
+            with transaction.new_transaction():
+                records = Model.browse([record1_id, record2_id])
+                self.assertEqual(
+                    Model.lock(records, skip_locked=True),
+                    [Model(record2_id)])
+
+    @unittest.skipIf(backend.name == 'sqlite',
+        'SQLite does not have lock at table level but on file')
+    @with_transaction()
+    def test_search_lock_skip_locked(self):
+        "Test search locking and skipping locked records"
+        pool = Pool()
+        Model = pool.get('test.modelsql.lock')
+        transaction = Transaction()
+        record1_id, record2_id = [r.id for r in Model.create([{}, {}])]
+        transaction.commit()
+        domain = [('id', 'in', [record1_id, record2_id])]
+
+        with transaction.new_transaction():
+            record, = Model.search(
+                domain, order=[('id', 'ASC')], limit=1, lock='skip_locked')
+            self.assertEqual(record.id, record1_id)
+            with transaction.new_transaction():
+                record, = Model.search(
+                    domain, order=[('id', 'ASC')], limit=1,
+                    lock='skip_locked')
+                self.assertEqual(record.id, record2_id)
+
+                with self.assertRaises(backend.DatabaseOperationalError):
+                    Model.search(domain, lock='nowait')
+
+    @with_transaction()
+    def test_record_lock_result(self):
+        "Test record lock returns the locked records"
+        pool = Pool()
+        Model = pool.get('test.modelsql.lock')
+        records = Model.create([{}, {}])
+
+        self.assertEqual(Model.lock(records), records)
+        self.assertEqual(Model.lock(records, skip_locked=True), records)
+
+    @with_transaction()
+    def test_search_lock_query(self):
+        "Test search lock only the main table"
+        pool = Pool()
+        Model = pool.get('test.modelsql.search')
+        database = Transaction().database
+
+        with patch.object(database, 'has_select_for', return_value=True):
+            query = Model.search(
+                [], order=[('name', 'ASC')], lock='nowait', query=True)
+        sql, _ = tuple(query)
+        self.assertTrue(sql.endswith('FOR UPDATE OF "a" NOWAIT'), msg=sql)
+
+    @with_transaction()
+    def test_search_lock_invalid(self):
+        "Test search with invalid lock"
+        pool = Pool()
+        Model = pool.get('test.modelsql.search')
+
+        with self.assertRaises(ValueError):
+            Model.search([], lock='share')
+        with self.assertRaises(ValueError):
+            Model.search([], count=True, lock='nowait')
+
     @unittest.skipIf(backend.name == 'sqlite',
         'SQLite does not have lock at table level but on file')
     @with_transaction()
@@ -5,6 +5,7 @@ import sys
 import unittest
 from unittest.mock import patch
 
+from trytond.model.exceptions import RecursionError
 from trytond.pool import Pool
 from trytond.tests.test_tryton import activate_module, with_transaction
 from trytond.transaction import Transaction
@@ -95,3 +96,71 @@ class MPTTTestCase(TreeTestCaseMixin, unittest.TestCase):
                                     }])],
                     }])
         self.check_tree()
+
+    @with_transaction()
+    def test_rebuild_bulk(self):
+        "Test rebuild with set queries"
+        pool = Pool()
+        Mptt = pool.get('test.mptt')
+        table = Mptt.__table__()
+        cursor = Transaction().connection.cursor()
+
+        self.create()
+        cursor.execute(*table.update([table.left, table.right], [0, 0]))
+
+        Mptt._rebuild_tree_bulk('parent')
+
+        self.check_tree()
+
+    @with_transaction()
+    def test_rebuild_bulk_no_window(self):
+        "Test rebuild with set queries without window functions"
+        pool = Pool()
+        Mptt = pool.get('test.mptt')
+        database = Transaction().database
+
+        self.create()
+        with patch.object(
+                database, 'has_window_functions', return_value=False), \
+                patch.object(Mptt, '_rebuild_tree',
+                    wraps=Mptt._rebuild_tree) as rebuild:
+            Mptt._rebuild_tree_bulk('parent')
+            self.assertTrue(rebuild.called)
+
+        self.check_tree()
+
+    @with_transaction()
+    def test_update_many_rebuild(self):
+        "Test updating more nodes than the threshold rebuilds the tree"
+        pool = Pool()
+        Mptt = pool.get('test.mptt')
+
+        self.create()
+        records = Mptt.search([('parent', '!=', None)])
+        parent = Mptt(name="New Parent")
+        parent.save()
+        with patch('trytond.model.modelsql._tree_rebuild_size', 2), \
+                patch.object(Mptt, '_update_tree') as update, \
+                patch.object(Mptt, '_rebuild_mptt',
+                    wraps=Mptt._rebuild_mptt) as rebuild:
+            Mptt.write(records[:3], {'parent': parent.id})
+            self.assertFalse(update.called)
+            self.assertTrue(rebuild.called)
+
+        self.check_tree()
+
+    @with_transaction()
+    def test_update_cycle_rebuild(self):
+        "Test updating nodes into a cycle raises a recursion error"
+        pool = Pool()
+        Mptt = pool.get('test.mptt')
+
+        a, b, c, d = records = Mptt.create([
+                {'name': name} for name in ['a', 'b', 'c', 'd']])
+        Mptt.write([b, c, d], {'parent': a.id})
+
+        with patch.object(Mptt, '_rebuild_mptt',
+                    wraps=Mptt._rebuild_mptt) as rebuild, \
+                self.assertRaises(RecursionError):
+            Mptt.write(records, {'parent': a.id})
+        self.assertTrue(rebuild.called)
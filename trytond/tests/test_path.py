@@ -1,8 +1,10 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 import unittest
+from unittest.mock import patch
 
 from trytond.pool import Pool
+from trytond.tests.test_tryton import with_transaction
 from trytond.transaction import Transaction
 
 from .test_tree import TreeTestCaseMixin
@@ -32,3 +34,21 @@ class PathTestCase(TreeTestCaseMixin, unittest.TestCase):
         pool = Pool()
         Path = pool.get(self.model_name)
         Path._rebuild_path('parent')
+
+    @with_transaction()
+    def test_update_many_rebuild(self):
+        "Test updating more nodes than the threshold rebuilds the paths"
+        pool = Pool()
+        Path = pool.get(self.model_name)
+
+        self.create()
+        records = Path.search([('parent', '!=', None)])
+        parent = Path(name="New Parent")
+        parent.save()
+        with patch('trytond.model.modelsql._tree_rebuild_size', 2), \
+                patch.object(Path, '_rebuild_path',
+                    wraps=Path._rebuild_path) as rebuild:
+            Path.write(records[:3], {'parent': parent.id})
+            self.assertTrue(rebuild.called)
+
+        self.check_tree()
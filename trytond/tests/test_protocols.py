@@ -5,8 +5,11 @@ import datetime
 import json
 import unittest
 from decimal import Decimal
+from unittest.mock import patch
 
-from trytond.protocols.jsonrpc import JSONDecoder, JSONEncoder, JSONRequest
+from trytond.protocols import jsonrpc
+from trytond.protocols.jsonrpc import (
+    JSONDecoder, JSONEncoder, JSONProtocol, JSONRequest, dumps, iterdumps)
 from trytond.protocols.xmlrpc import XMLRequest, client
 from trytond.tools.immutabledict import ImmutableDict
 
@@ -67,11 +70,158 @@ class JSONTestCase(DumpsLoadsMixin, unittest.TestCase):
         self.assertEqual(req.rpc_method, 'method')
         self.assertEqual(req.rpc_params, ['foo', 'bar'])
 
+    def test_json_request_batch(self):
+        "Test JSON batch request"
+        req = JSONRequest.from_values(
+            data=b'[{"id": 1, "method": "method", "params": ["foo"]}, '
+            b'{"id": 2, "method": "other", "params": []}]',
+            content_type='text/json',
+            )
+        first, second = req.rpc_batch
+
+        self.assertIsNone(req.rpc_method)
+        self.assertEqual(first.rpc_method, 'method')
+        self.assertEqual(first.rpc_params, ['foo'])
+        self.assertEqual(second.rpc_method, 'other')
+        self.assertIsNone(first.rpc_batch)
+
+    def test_json_request_not_batch(self):
+        "Test JSON request is not a batch"
+        req = JSONRequest.from_values(
+            data=b'{"method": "method", "params": ["foo", "bar"]}',
+            content_type='text/json',
+            )
+
+        self.assertIsNone(req.rpc_batch)
+
     def dumps_loads(self, value):
         self.assertEqual(json.loads(
                 json.dumps(value, cls=JSONEncoder),
                 object_hook=JSONDecoder()), value)
 
+    def test_json_response_encoding_error(self):
+        "Test JSON response with a value that can not be encoded"
+        req = JSONRequest.from_values(
+            data=b'{"id": 1, "method": "method", "params": []}',
+            content_type='text/json',
+            )
+
+        response = JSONProtocol.response([object()], req)
+
+        self.assertEqual(response.status_code, 200)
+        result = json.loads(response.get_data())
+        self.assertEqual(result['id'], 1)
+        self.assertNotIn('result', result)
+        self.assertIn('object', result['error'][0])
+
+    def test_json_response_raw_encoding_error(self):
+        "Test raw JSON response with a value that can not be encoded"
+        req = JSONRequest.from_values(
+            data=b'{"foo": "bar"}',
+            content_type='text/json',
+            )
+
+        response = JSONProtocol.response([object()], req)
+
+        self.assertEqual(response.code, 500)
+
+    def test_json_response_streamed(self):
+        "Test large JSON response is streamed"
+        req = JSONRequest.from_values(
+            data=b'{"id": 1, "method": "method", "params": []}',
+            content_type='text/json',
+            )
+        result = [{'id': i, 'name': 'foo'} for i in range(10000)]
+
+        response = JSONProtocol.response(result, req)
+
+        self.assertTrue(response.is_streamed)
+        self.assertEqual(json.loads(response.get_data()), {
+                'id': 1,
+                'result': result,
+                })
+
+
+class JSONDumpsTestCase(DumpsLoadsMixin, unittest.TestCase):
+    "Test JSON dumps"
+
+    def dumps_loads(self, value):
+        self.assertEqual(json.loads(
+                dumps(value), object_hook=JSONDecoder()), value)
+
+    def test_same_encoding(self):
+        "Test same encoding as the JSON encoder"
+        value = {
+            'id': 1,
+            'result': [{
+                    'date': datetime.date(2020, 1, 1),
+                    'amount': Decimal('1.10'),
+                    'data': b'foo',
+                    }],
+            }
+        self.assertEqual(
+            dumps(value).decode('utf-8'),
+            json.dumps(value, cls=JSONEncoder, separators=(',', ':')))
+
+    def test_big_integer(self):
+        "Test integer bigger than 64-bit"
+        self.dumps_loads(2 ** 64)
+
+    def test_non_finite_float(self):
+        "Test non-finite floats have the same encoding as the JSON encoder"
+        for value in [float('nan'), float('inf'), float('-inf')]:
+            with self.subTest(value=value):
+                value = {'result': [None, {'value': value}]}
+                self.assertEqual(
+                    dumps(value).decode('utf-8'),
+                    json.dumps(value, cls=JSONEncoder, separators=(',', ':')))
+
+    def test_iterdumps(self):
+        "Test dumps by chunks"
+        value = {
+            'id': 1,
+            'result': [{'id': i, 'date': datetime.date.today()}
+                for i in range(10)],
+            }
+
+        chunks = list(iterdumps(value, chunk_size=3))
+
+        self.assertGreater(len(chunks), 4)
+        self.assertEqual(b''.join(chunks), dumps(value))
+
+    def test_iterdumps_small(self):
+        "Test dumps by chunks of small values"
+        for value in [None, 1, [], [1, 2], {}, {1: 'foo'}]:
+            with self.subTest(value=value):
+                self.assertEqual(
+                    b''.join(iterdumps(value, chunk_size=1)), dumps(value))
+
+
+@unittest.skipIf(jsonrpc.orjson is None, "orjson is not installed")
+class JSONDumpsOrjsonTestCase(unittest.TestCase):
+    "Test JSON dumps differences of orjson"
+
+    def test_non_ascii(self):
+        "Test non-ASCII characters are encoded as UTF-8"
+        self.assertEqual(dumps('\xe9t\xe9'), '"\xe9t\xe9"'.encode('utf-8'))
+        self.assertEqual(json.loads(dumps('\xe9t\xe9')), '\xe9t\xe9')
+
+    def test_float_exponent(self):
+        "Test float exponent is encoded without sign"
+        self.assertEqual(dumps(1e16), b'1e16')
+        self.assertEqual(json.loads(dumps(1e16)), 1e16)
+
+
+@unittest.skipIf(jsonrpc.orjson is None, "orjson is not installed")
+class JSONDumpsStandardTestCase(JSONDumpsTestCase):
+    "Test JSON dumps without orjson"
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(jsonrpc, 'orjson', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
 
 class XMLTestCase(DumpsLoadsMixin, unittest.TestCase):
     'Test XML'
@@ -0,0 +1,599 @@
+# This file is part of Tryton.  The COPYRIGHT file at the top level of
+# this repository contains the full copyright notices and license terms.
+import datetime as dt
+import unittest
+from unittest.mock import Mock, patch
+
+from trytond import backend
+from trytond.bench import percentiles
+from trytond.config import config
+from trytond.model.exceptions import SQLConstraintError
+from trytond.pool import Pool
+from trytond.tests.test_tryton import activate_module, with_transaction
+from trytond.transaction import Transaction
+from trytond.worker import Lane, Task, dispatch, get_lanes, run
+
+
+class QueueTestCase(unittest.TestCase):
+    "Test Queue"
+
+    @classmethod
+    def setUpClass(cls):
+        activate_module('ir')
+
+    def _push(self, name='default', instances=None, method='read',
+            context=None, **kwargs):
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        return Queue.push(name, {
+                'model': 'ir.lang',
+                'method': method,
+                'user': 0,
+                'context': context or {},
+                'instances': instances if instances is not None else [],
+                'args': [],
+                'kwargs': {},
+                }, **kwargs)
+
+    def _pull(self, name=None, limit=1, exclude=None):
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+        return Queue.pull(
+            transaction.database, transaction.connection,
+            name=name, limit=limit, exclude=exclude)
+
+    @with_transaction()
+    def test_pull(self):
+        "Test pull a task"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        task_id = self._push()
+
+        task_ids, _ = self._pull()
+
+        self.assertEqual(task_ids, [task_id])
+        self.assertTrue(Queue(task_id).dequeued_at)
+        self.assertEqual(self._pull(), ([], None))
+
+    @with_transaction()
+    def test_pull_batch(self):
+        "Test pull a batch of tasks"
+        task_ids = [self._push() for _ in range(5)]
+
+        first, _ = self._pull(limit=3)
+        second, _ = self._pull(limit=3)
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertEqual(sorted(first + second), sorted(task_ids))
+
+    @with_transaction()
+    def test_pull_name(self):
+        "Test pull tasks of a queue"
+        self._push(name='other')
+        task_id = self._push(name='test')
+
+        task_ids, _ = self._pull(name='test', limit=2)
+
+        self.assertEqual(task_ids, [task_id])
+
+    @with_transaction()
+    def test_pull_exclude(self):
+        "Test pull tasks excluding queues"
+        self._push(name='other')
+        task_id = self._push(name='test')
+
+        task_ids, _ = self._pull(limit=2, exclude={'other'})
+
+        self.assertEqual(task_ids, [task_id])
+
+    @with_transaction()
+    def test_statistics(self):
+        "Test statistics"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        for _ in range(3):
+            self._push(name='test')
+        self._push(name='other')
+        self._push(
+            name='scheduled',
+            scheduled_at=dt.datetime.now() + dt.timedelta(hours=1))
+        self._pull(name='other')
+
+        statistics = Queue.statistics(Transaction().connection)
+
+        self.assertEqual(list(statistics.keys()), ['test'])
+        self.assertEqual(statistics['test']['depth'], 3)
+        self.assertGreaterEqual(statistics['test']['wait'], 0)
+
+    @unittest.skipIf(backend.name == 'sqlite',
+        'SQLite does not compute the interval of timestamps')
+    @with_transaction()
+    def test_pull_scheduled(self):
+        "Test pull does not dequeue scheduled tasks"
+        self._push(
+            scheduled_at=dt.datetime.now() + dt.timedelta(hours=1))
+
+        task_ids, seconds = self._pull(limit=2)
+
+        self.assertEqual(task_ids, [])
+        self.assertIsNotNone(seconds)
+
+    @with_transaction()
+    def test_clean(self):
+        "Test clean processed tasks"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        now = dt.datetime.now()
+        old_id = self._push()
+        task_id = self._push()
+        pending_id = self._push()
+        Queue.write([Queue(old_id)], {
+                'dequeued_at': now - dt.timedelta(days=2),
+                'finished_at': now - dt.timedelta(days=1),
+                })
+        Queue.write([Queue(task_id)], {
+                'dequeued_at': now,
+                'finished_at': now,
+                })
+
+        Queue.clean(now - dt.timedelta(hours=1))
+
+        self.assertEqual(
+            sorted(t.id for t in Queue.search([])),
+            sorted([task_id, pending_id]))
+
+    @with_transaction()
+    def test_clean_failed(self):
+        "Test clean keeps failed tasks"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        now = dt.datetime.now()
+        task = Queue(self._push())
+        task.dequeued_at = now - dt.timedelta(days=2)
+        task.fail('error', retry=False)
+
+        Queue.clean(now - dt.timedelta(hours=1))
+
+        self.assertEqual(Queue.search([]), [task])
+
+    @with_transaction()
+    def test_fail_retry(self):
+        "Test fail reschedules the task with backoff"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        task = Queue(self._push())
+        self._pull()
+        delays = []
+
+        with patch('trytond.ir.queue_.retry_delay', 10), \
+                patch('trytond.ir.queue_.retry_max_delay', 30), \
+                patch('trytond.ir.queue_.retry_attempts', 3):
+            for attempt in range(3):
+                now = dt.datetime.now()
+                self.assertTrue(task.fail('error %s' % attempt))
+                delays.append((task.scheduled_at - now).total_seconds())
+                self.assertIsNone(task.dequeued_at)
+                task.dequeued_at = now
+
+            self.assertFalse(task.fail('error'))
+
+        for delay, maximum in zip(delays, [10, 20, 30]):
+            self.assertGreaterEqual(delay, maximum / 2 - 1)
+            self.assertLessEqual(delay, maximum)
+        self.assertEqual(task.attempts, 4)
+        self.assertEqual(task.last_error, 'error')
+        self.assertTrue(task.failed_at)
+
+    @with_transaction()
+    def test_fail_retry_without_worker(self):
+        "Test fail without worker runs again the task"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        transaction = Transaction()
+        task = Queue(self._push())
+        self._pull()
+        del transaction.tasks[:]
+
+        with patch('trytond.ir.queue_.has_worker', False):
+            self.assertTrue(task.fail('error'))
+        with patch('trytond.ir.queue_.has_worker', True):
+            self.assertTrue(task.fail('error'))
+
+        self.assertEqual(transaction.tasks, [task.id])
+        del transaction.tasks[:]
+
+    @with_transaction()
+    def test_fail_no_retry(self):
+        "Test fail without retry"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        task = Queue(self._push())
+        self._pull()
+
+        self.assertFalse(task.fail('error', retry=False))
+
+        self.assertEqual(task.attempts, 1)
+        self.assertTrue(task.dequeued_at)
+        self.assertTrue(task.failed_at)
+
+    @with_transaction()
+    def test_requeue(self):
+        "Test requeue failed tasks"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        tasks = [Queue(self._push()) for _ in range(2)]
+        self._pull(limit=2)
+        for task in tasks:
+            task.fail('error', retry=False)
+
+        Queue.requeue(tasks)
+
+        self.assertEqual(
+            sorted(self._pull(limit=2)[0]), sorted(t.id for t in tasks))
+        for task in tasks:
+            self.assertEqual(task.attempts, 0)
+            self.assertFalse(task.failed_at)
+            self.assertFalse(task.last_error)
+
+    @with_transaction()
+    def test_coalesce(self):
+        "Test coalesce similar tasks"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        task_id = self._push(instances=[1])
+        similar_ids = [self._push(instances=[i]) for i in [2, 1]]
+        self._push(instances=[3], method='write')
+        self._push(instances=[4], context={'foo': 'bar'})
+        self._push(instances=5)
+
+        task = Queue(task_id)
+        others = task.coalesce(10)
+
+        self.assertEqual([t.id for t in others], similar_ids)
+        self.assertTrue(all(t.dequeued_at for t in others))
+
+    @with_transaction()
+    def test_coalesce_size(self):
+        "Test coalesce a limited number of tasks"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        task_id = self._push(instances=[1])
+        for i in range(5):
+            self._push(instances=[i])
+
+        task = Queue(task_id)
+
+        self.assertEqual(len(task.coalesce(2)), 2)
+        self.assertEqual(task.coalesce(0), [])
+
+    @with_transaction()
+    def test_run_coalesced(self):
+        "Test run coalesced tasks"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        Lang = pool.get('ir.lang')
+        lang1, lang2 = Lang.search([], limit=2)
+        task = Queue(self._push(instances=[lang1.id]))
+        other = Queue(self._push(instances=[lang2.id, lang1.id]))
+
+        with patch.object(Lang, 'read') as read:
+            task.run([other])
+
+        read.assert_called_once_with([lang1, lang2])
+        self.assertTrue(task.finished_at)
+        self.assertTrue(other.finished_at)
+
+    @with_transaction()
+    def test_worker_run_coalesced_fail(self):
+        "Test worker runs alone the tasks of a failing coalesced batch"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        Lang = pool.get('ir.lang')
+        lang1, lang2 = Lang.search([], limit=2)
+        task = Queue(self._push(instances=[lang1.id]))
+        other = Queue(self._push(instances=[lang2.id]))
+
+        def read(records, *args, **kwargs):
+            if len(records) > 1:
+                raise ValueError
+        with patch.object(Queue, 'coalesce', return_value=[other]), \
+                patch.object(Lang, 'read', side_effect=read) as read:
+            others = run(Mock(), task)
+
+        read.assert_called_with([lang1])
+        self.assertEqual(others, [other.id])
+        task, other = Queue.browse([task.id, other.id])
+        self.assertTrue(task.finished_at)
+        self.assertTrue(other.dequeued_at)
+        self.assertFalse(other.finished_at)
+
+    @with_transaction()
+    def test_worker_run_operational_error(self):
+        "Test worker does not run alone on operational error"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        Lang = pool.get('ir.lang')
+        lang1, lang2 = Lang.search([], limit=2)
+        task = Queue(self._push(instances=[lang1.id]))
+        other = Queue(self._push(instances=[lang2.id]))
+        transaction = Mock()
+
+        with patch.object(Queue, 'coalesce', return_value=[other]), \
+                patch.object(Lang, 'read',
+                    side_effect=backend.DatabaseOperationalError), \
+                self.assertRaises(backend.DatabaseOperationalError):
+            run(transaction, task)
+        transaction.rollback.assert_not_called()
+
+    def _push_dedup(self, instances, user=0, context=None, **kwargs):
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        data = {
+            'model': 'ir.lang',
+            'method': 'read',
+            'user': user,
+            'context': context or {},
+            'instances': instances,
+            'args': [],
+            'kwargs': {},
+            }
+        return Queue.push(
+            'default', data, dedup_key=Queue.dedup('default', data), **kwargs)
+
+    @with_transaction()
+    def test_dedup(self):
+        "Test push duplicate tasks"
+        task_id = self._push_dedup([1, 2])
+
+        self.assertEqual(self._push_dedup([2, 1]), task_id)
+        self.assertNotEqual(self._push_dedup([1]), task_id)
+
+    @with_transaction()
+    def test_dedup_user_context(self):
+        "Test push duplicate tasks of other user or context"
+        task_id = self._push_dedup([1])
+
+        self.assertNotEqual(self._push_dedup([1], user=1), task_id)
+        self.assertNotEqual(
+            self._push_dedup([1], context={'language': 'fr'}), task_id)
+
+    @with_transaction()
+    def test_dedup_concurrent(self):
+        "Test push duplicate task concurrently is retried"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        self._push_dedup([1])
+
+        # Simulate a task pushed by a concurrent transaction
+        with patch.object(Queue, 'search', return_value=[]), \
+                self.assertRaises(backend.DatabaseOperationalError):
+            self._push_dedup([1])
+
+    @with_transaction()
+    def test_dedup_scheduled_at(self):
+        "Test push duplicate tasks keeps the earliest scheduled"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        now = dt.datetime.now()
+        later = now + dt.timedelta(hours=2)
+        earlier = now + dt.timedelta(hours=1)
+
+        task_id = self._push_dedup([1], scheduled_at=later)
+        self._push_dedup([1], scheduled_at=earlier)
+        self.assertEqual(Queue(task_id).scheduled_at, earlier)
+
+        self._push_dedup([1])
+        self.assertEqual(Queue(task_id).scheduled_at, None)
+
+    @with_transaction()
+    def test_dedup_dequeued(self):
+        "Test push duplicate of dequeued task"
+        task_id = self._push_dedup([1])
+        self._pull()
+
+        self.assertNotEqual(self._push_dedup([1]), task_id)
+
+    @with_transaction()
+    def test_dedup_unique(self):
+        "Test only one pending task per deduplication key"
+        pool = Pool()
+        Queue = pool.get('ir.queue')
+        task = Queue(self._push_dedup([1]))
+
+        with self.assertRaises(SQLConstraintError):
+            Queue.create([{
+                        'name': task.name,
+                        'data': task.data,
+                        'dedup_key': task.dedup_key,
+                        }])
+
+    @with_transaction()
+    def test_dedup_context(self):
+        "Test queue_dedup context"
+        pool = Pool()
+        Lang = pool.get('ir.lang')
+        lang, = Lang.search([], limit=1)
+
+        with Transaction().set_context(queue_dedup=True):
+            task_id = Lang.__queue__.read([lang])
+            self.assertEqual(Lang.__queue__.read([lang]), task_id)
+        self.assertNotEqual(Lang.__queue__.read([lang]), task_id)
+
+
+class WorkerLaneTestCase(unittest.TestCase):
+    "Test worker lanes"
+
+    def test_lane_free(self):
+        "Test free processes of lane"
+        lane = Lane('test', limit=2)
+
+        self.assertEqual(lane.free(4), 2)
+        lane.tasks.append(None)
+        self.assertEqual(lane.free(4), 1)
+        self.assertEqual(lane.free(0), 0)
+        lane.tasks.extend([None, None])
+        self.assertEqual(lane.free(4), 0)
+
+    def test_lane_free_unlimited(self):
+        "Test free processes of unlimited lane"
+        lane = Lane('test')
+
+        self.assertEqual(lane.free(4), 4)
+
+    def test_get_lanes(self):
+        "Test get lanes"
+        with patch.object(config, 'get', return_value=(
+                    'report -10 1\n\nemail 10 2\n')):
+            lanes = get_lanes()
+
+        self.assertEqual(
+            [(x.name, x.priority, x.limit) for x in lanes], [
+                ('email', 10, 2),
+                (None, 0, None),
+                ('report', -10, 1),
+                ])
+        self.assertEqual(lanes[1].exclude, {'email', 'report'})
+
+    def test_get_lanes_name(self):
+        "Test get lanes for a name"
+        with patch.object(config, 'get', return_value='email 10 2'):
+            lane, = get_lanes('email')
+            other, = get_lanes('other')
+
+        self.assertEqual((lane.name, lane.limit), ('email', 2))
+        self.assertEqual((other.name, other.limit), ('other', None))
+
+
+class WorkerTaskTestCase(unittest.TestCase):
+    "Test worker task"
+
+    def test_task_ready(self):
+        "Test task is ready once called back"
+        callback = Mock()
+        task = Task(callback)
+
+        self.assertFalse(task.ready())
+        task(None)
+
+        self.assertTrue(task.ready())
+        callback.assert_called_once_with(None)
+
+
+class BenchTestCase(unittest.TestCase):
+    "Test benchmark"
+
+    def test_percentiles(self):
+        "Test percentiles"
+        self.assertEqual(
+            percentiles(range(1, 101), [50, 90, 99, 100]), [50, 90, 99, 100])
+        self.assertEqual(percentiles([3, 1, 2], [50, 100]), [2, 3])
+        self.assertEqual(percentiles([], [50]), [0])
+
+
+class _Queue(object):
+    "Queue of the worker pulling from a list of task ids"
+
+    def __init__(self, task_ids, seconds=None):
+        self.task_ids = task_ids
+        self.seconds = seconds
+        self.due = 0
+        self.blocked = set()
+        self.pulls = 0
+
+    def pull(self, name=None, limit=1, exclude=None):
+        self.pulls += 1
+        task_ids, self.task_ids = self.task_ids[:limit], self.task_ids[limit:]
+        return task_ids, self.seconds
+
+    def run(self, task_id):
+        return Mock(ready=Mock(return_value=False))
+
+
+class WorkerDispatchTestCase(unittest.TestCase):
+    "Test worker dispatch"
+
+    def test_dispatch(self):
+        "Test dispatch pulls until the queue is empty"
+        queue = _Queue([1, 2])
+        lane = Lane()
+
+        timeout = dispatch([queue], [lane], 4, 60)
+
+        self.assertEqual(len(lane.tasks), 2)
+        self.assertFalse(queue.blocked)
+        self.assertAlmostEqual(timeout, 60, delta=1)
+
+    def test_dispatch_not_due(self):
+        "Test dispatch does not pull the queues not due"
+        queue = _Queue([1])
+        lane = Lane()
+        dispatch([queue], [lane], 4, 60)
+        queue.task_ids = [2]
+
+        dispatch([queue], [lane], 4, 60)
+
+        self.assertEqual(queue.pulls, 1)
+        self.assertEqual(len(lane.tasks), 1)
+
+    def test_dispatch_scheduled(self):
+        "Test dispatch waits until the next scheduled task"
+        queue = _Queue([], seconds=5)
+
+        timeout = dispatch([queue], [Lane()], 4, 60)
+
+        self.assertAlmostEqual(timeout, 5, delta=1)
+
+    def test_dispatch_busy(self):
+        "Test dispatch waits for a task to be done when busy"
+        queue = _Queue([1, 2, 3])
+        other = _Queue([])
+        lane = Lane()
+
+        timeout = dispatch([queue, other], [lane], 2, 60)
+
+        self.assertEqual(len(lane.tasks), 2)
+        self.assertTrue(queue.blocked)
+        self.assertAlmostEqual(timeout, 60, delta=1)
+
+        for task in lane.tasks:
+            task.ready.return_value = True
+        dispatch([queue, other], [lane], 2, 60)
+
+        self.assertEqual(queue.task_ids, [])
+        self.assertFalse(queue.blocked)
+        self.assertEqual(other.pulls, 1)
+
+    def test_dispatch_busy_lane_scheduled(self):
+        "Test dispatch waits for the scheduled task when a lane is busy"
+        class LaneQueue(_Queue):
+            def pull(self, name=None, limit=1, exclude=None):
+                self.pulls += 1
+                if name == 'report':
+                    return [], None
+                return [], 5
+        queue = LaneQueue([])
+        report, email = Lane('report', 10, 1), Lane('email')
+        report.tasks.append(Mock(ready=Mock(return_value=False)))
+
+        timeout = dispatch([queue], [report, email], 4, 60)
+
+        self.assertAlmostEqual(timeout, 5, delta=1)
+        self.assertEqual(queue.blocked, {report})
+
+        report.tasks[0].ready.return_value = True
+        dispatch([queue], [report, email], 4, 60)
+
+        self.assertEqual(queue.pulls, 3)
+        self.assertFalse(queue.blocked)
+
+    def test_dispatch_priority(self):
+        "Test dispatch fills the lanes by priority"
+        queue = _Queue([1, 2, 3])
+        high, low = Lane('high', 10, 1), Lane('low', 0)
+
+        dispatch([queue], [high, low], 2, 60)
+
+        self.assertEqual(len(high.tasks), 1)
+        self.assertEqual(len(low.tasks), 1)
@@ -2,13 +2,22 @@
 # repository contains the full copyright notices and license terms.
 
 import base64
+import gzip
 import json
+import shutil
+import tempfile
 import unittest
+import urllib.parse
+from unittest.mock import patch
 
 from werkzeug.test import Client
 from werkzeug.wrappers import Response
 
+from trytond import backend
+from trytond.config import config
+from trytond.model import ModelView
 from trytond.pool import Pool
+from trytond.protocols import dispatcher
 from trytond.tests.test_tryton import DB_NAME, activate_module, drop_db
 from trytond.transaction import Transaction
 from trytond.wsgi import app
@@ -195,3 +204,324 @@ class RoutesTestCase(unittest.TestCase):
         self.assertEqual(response_std.status_code, 200)
         self.assertEqual(response_locale.status_code, 200)
         self.assertNotEqual(response_std.data, response_locale.data)
+
+    def test_rpc_batch(self):
+        "Test POST batch of RPC"
+        c = Client(app, Response)
+        pool = Pool(DB_NAME)
+        with Transaction().start(DB_NAME, 0, readonly=True):
+            User = pool.get('res.user')
+            admin, = User.search([('login', '=', 'admin')])
+
+        response = c.post(
+            '/%s/' % DB_NAME, headers=self.auth_headers,
+            content_type='application/json', data=json.dumps([{
+                        'id': 1,
+                        'method': 'model.res.user.search',
+                        'params': [
+                            [('login', '=', 'admin')], 0, None, None, {}],
+                        }, {
+                        'id': 2,
+                        'method': 'model.res.user.unknown',
+                        'params': [{}],
+                        }, {
+                        'id': 3,
+                        'method': 'model.res.user.search',
+                        'params': [[('foo', '=', 'bar')], 0, None, None, {}],
+                        }, {
+                        'jsonrpc': '2.0',
+                        'id': 4,
+                        'method': 'model.res.user.read',
+                        'params': [[admin.id], ['login'], {}],
+                        }]))
+
+        self.assertEqual(response.status_code, 200)
+        search, unknown, invalid, read = json.loads(response.data)
+        self.assertEqual(search, {'id': 1, 'result': [admin.id]})
+        self.assertEqual(unknown['id'], 2)
+        self.assertEqual(unknown['error'][0], 'Forbidden')
+        self.assertEqual(invalid['id'], 3)
+        self.assertIn('error', invalid)
+        self.assertEqual(read, {
+                'jsonrpc': '2.0',
+                'id': 4,
+                'result': [{'id': admin.id, 'login': 'admin'}],
+                })
+
+    def test_rpc_compressed(self):
+        "Test POST compressed RPC"
+        c = Client(app, Response)
+        pool = Pool(DB_NAME)
+        with Transaction().start(DB_NAME, 0, readonly=True):
+            Model = pool.get('ir.model')
+            models = Model.search([])
+
+        headers = self.auth_headers.copy()
+        headers['Accept-Encoding'] = 'gzip'
+        headers['Content-Encoding'] = 'gzip'
+        response = c.post(
+            '/%s/' % DB_NAME, headers=headers,
+            content_type='application/json', data=gzip.compress(json.dumps({
+                        'id': 1,
+                        'method': 'model.ir.model.search_read',
+                        'params': [[], 0, None, None, ['model', 'name'], {}],
+                        }).encode()))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        result = json.loads(gzip.decompress(response.data))['result']
+        self.assertEqual(len(result), len(models))
+
+    def binary_url(self, data, name='test.txt'):
+        "Return the binary URL of an attachment with data"
+        path = config.get('database', 'path')
+        dtemp = tempfile.mkdtemp()
+        config.set('database', 'path', dtemp)
+        self.addCleanup(config.set, 'database', 'path', path)
+        self.addCleanup(shutil.rmtree, dtemp)
+        secret = config.get('web', 'secret')
+        config.set('web', 'secret', 'test')
+        self.addCleanup(config.set, 'web', 'secret', secret or '')
+
+        pool = Pool(DB_NAME)
+        with Transaction().start(DB_NAME, 0):
+            Attachment = pool.get('ir.attachment')
+            User = pool.get('res.user')
+            admin, = User.search([('login', '=', 'admin')])
+            attachment, = Attachment.create([{
+                        'name': name,
+                        'resource': str(admin),
+                        'data': data,
+                        }])
+            with Transaction().set_context({'ir.attachment.data': 'url'}):
+                attachment = Attachment(attachment.id)
+                url = attachment.data
+        url = urllib.parse.urlsplit(url)
+        return url.path, url.query
+
+    def test_binary(self):
+        "Test GET binary"
+        c = Client(app, Response)
+        path, query = self.binary_url(b'foo')
+
+        response = c.get(path, query_string=query)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'foo')
+        self.assertEqual(response.mimetype, 'text/plain')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+
+    def test_binary_range(self):
+        "Test GET binary range"
+        c = Client(app, Response)
+        path, query = self.binary_url(b'foobar')
+
+        response = c.get(
+            path, query_string=query, headers={'Range': 'bytes=3-'})
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, b'bar')
+        self.assertEqual(response.headers['Content-Range'], 'bytes 3-5/6')
+
+    def test_binary_invalid_signature(self):
+        "Test GET binary with invalid signature"
+        c = Client(app, Response)
+        path, query = self.binary_url(b'foo')
+        query = urllib.parse.parse_qs(query)
+        query['s'] = ['0' * 64]
+
+        response = c.get(path, query_string=query)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_binary_expired(self):
+        "Test GET binary expired"
+        c = Client(app, Response)
+        with patch.object(config, 'getint', return_value=-1):
+            path, query = self.binary_url(b'foo')
+
+        response = c.get(path, query_string=query)
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_rpc_not_modified(self):
+        "Test POST RPC not modified"
+        c = Client(app, Response)
+        data = json.dumps({
+                'id': 1,
+                'method': 'model.res.user.fields_view_get',
+                'params': [None, 'form', {}],
+                })
+
+        response = c.post(
+            '/%s/' % DB_NAME, headers=self.auth_headers,
+            content_type='application/json', data=data)
+        etag, _ = response.get_etag()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(etag)
+
+        headers = self.auth_headers.copy()
+        headers['If-None-Match'] = '"%s"' % etag
+        with patch('trytond.protocols.dispatcher._start_transaction') as start:
+            response = c.post(
+                '/%s/' % DB_NAME, headers=headers,
+                content_type='application/json', data=data)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_etag(), (etag, False))
+        self.assertEqual(response.data, b'')
+        start.assert_not_called()
+
+    def test_rpc_not_modified_session(self):
+        "Test POST RPC not modified with session without transaction"
+        c = Client(app, Response)
+        response = c.post(
+            '/%s/' % DB_NAME, content_type='application/json',
+            data=json.dumps({
+                    'id': 1,
+                    'method': 'common.db.login',
+                    'params': ['admin', {'password': 'password'}],
+                    }))
+        user_id, session = response.json['result']
+        headers = {
+            'Authorization': b'Session ' + base64.b64encode(
+                ('admin:%s:%s' % (user_id, session)).encode('utf-8')),
+            }
+        data = json.dumps({
+                'id': 1,
+                'method': 'model.res.user.fields_view_get',
+                'params': [None, 'form', {}],
+                })
+        response = c.post(
+            '/%s/' % DB_NAME, headers=headers,
+            content_type='application/json', data=data)
+        etag, _ = response.get_etag()
+
+        headers['If-None-Match'] = '"%s"' % etag
+        with patch.object(Transaction, 'start') as start:
+            response = c.post(
+                '/%s/' % DB_NAME, headers=headers,
+                content_type='application/json', data=data)
+
+        self.assertEqual(response.status_code, 304)
+        start.assert_not_called()
+
+    def test_rpc_not_modified_cleared(self):
+        "Test POST RPC not modified after cache cleared"
+        c = Client(app, Response)
+        data = json.dumps({
+                'id': 1,
+                'method': 'model.res.user.view_toolbar_get',
+                'params': [{}],
+                })
+
+        response = c.post(
+            '/%s/' % DB_NAME, headers=self.auth_headers,
+            content_type='application/json', data=data)
+        etag, _ = response.get_etag()
+        with Transaction().start(DB_NAME, 0) as transaction:
+            ModelView._view_toolbar_get_cache.clear()
+            transaction.commit()
+
+        headers = self.auth_headers.copy()
+        headers['If-None-Match'] = '"%s"' % etag
+        with patch('trytond.protocols.dispatcher._start_transaction',
+                wraps=dispatcher._start_transaction) as start:
+            response = c.post(
+                '/%s/' % DB_NAME, headers=headers,
+                content_type='application/json', data=data)
+
+        # The result is computed again but it is not modified
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.get_etag(), (etag, False))
+        start.assert_called_once()
+
+    def test_rpc_replica_lsn(self):
+        "Test readonly RPC after write requires the LSN"
+        c = Client(app, Response)
+
+        def call(method, params):
+            return c.post(
+                '/%s/' % DB_NAME, headers=self.auth_headers,
+                content_type='application/json', data=json.dumps({
+                        'id': 1,
+                        'method': method,
+                        'params': params,
+                        }))
+
+        with patch.object(backend.Database, 'current_lsn', return_value=42), \
+                patch.object(backend.Database, 'get_connection',
+                    autospec=True,
+                    side_effect=backend.Database.get_connection) \
+                as get_connection:
+            response = call('model.res.user.set_preferences', [{}, {}])
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers['X-Tryton-LSN'], '42')
+            response = call('model.res.user.get_preferences', [False, {}])
+            self.assertEqual(response.status_code, 200)
+
+        self.assertIn(
+            {'readonly': True, 'autocommit': False, 'statement_timeout': None,
+                'min_lsn': 42},
+            [c.kwargs for c in get_connection.call_args_list])
+
+    def test_rpc_replica_lsn_header(self):
+        "Test readonly RPC requires the LSN sent by the client"
+        c = Client(app, Response)
+        headers = self.auth_headers.copy()
+        headers['X-Tryton-LSN'] = str(2 ** 40)
+
+        with patch.object(backend.Database, 'get_connection',
+                autospec=True,
+                side_effect=backend.Database.get_connection) \
+                as get_connection:
+            response = c.post(
+                '/%s/' % DB_NAME, headers=headers,
+                content_type='application/json', data=json.dumps({
+                        'id': 1,
+                        'method': 'model.res.user.get_preferences',
+                        'params': [False, {}],
+                        }))
+            self.assertEqual(response.status_code, 200)
+
+        self.assertIn(
+            {'readonly': True, 'autocommit': False, 'statement_timeout': None,
+                'min_lsn': 2 ** 40},
+            [c.kwargs for c in get_connection.call_args_list])
+
+    def test_rpc_readonly_retry(self):
+        "Test readonly RPC is retried on operational error"
+        c = Client(app, Response)
+        pool = Pool(DB_NAME)
+        User = pool.get('res.user')
+        get_preferences = User.get_preferences.__func__
+
+        def fail_once(cls, *args, **kwargs):
+            if not calls:
+                calls.append(1)
+                raise backend.DatabaseOperationalError
+            return get_preferences(cls, *args, **kwargs)
+        calls = []
+
+        with patch.object(User, 'get_preferences', classmethod(fail_once)):
+            response = c.post(
+                '/%s/' % DB_NAME, headers=self.auth_headers,
+                content_type='application/json', data=json.dumps({
+                        'id': 1,
+                        'method': 'model.res.user.get_preferences',
+                        'params': [False, {}],
+                        }))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(calls, [1])
+
+    def test_rpc_batch_empty(self):
+        "Test POST empty batch of RPC"
+        c = Client(app, Response)
+
+        response = c.post(
+            '/%s/' % DB_NAME, headers=self.auth_headers,
+            content_type='application/json', data='[]')
+
+        self.assertEqual(response.status_code, 400)
@@ -3,7 +3,7 @@
 import unittest
 from unittest.mock import DEFAULT, Mock, call
 
-from trytond.rpc import RPC
+from trytond.rpc import RPC, RPCCache
 from trytond.tests.test_tryton import activate_module, with_transaction
 from trytond.transaction import Transaction
 
@@ -141,3 +141,36 @@ class RPCTestCase(unittest.TestCase):
         self.assertEqual(
             rpc_with_access.convert(None, {}),
             ([], {}, {'_check_access': True}, None))
+
+
+class RPCCacheTestCase(unittest.TestCase):
+    "Test RPCCache"
+
+    def test_headers(self):
+        "Test headers"
+        cache = RPCCache(days=1)
+
+        self.assertEqual(cache.headers(), {'X-Tryton-Cache': 24 * 60 * 60})
+
+    def test_etag(self):
+        "Test ETag"
+        etag = RPCCache.set_etag('test_etag', 1, {'foo': 'bar'})
+
+        self.assertEqual(RPCCache.get_etag('test_etag', 1), etag)
+        self.assertEqual(
+            RPCCache.set_etag('test_etag', 1, {'foo': 'bar'}), etag)
+        self.assertNotEqual(
+            RPCCache.set_etag('test_etag_other', 1, {'foo': 'baz'}), etag)
+
+    def test_etag_generation(self):
+        "Test ETag of other generation"
+        RPCCache.set_etag('test_etag_generation', 1, {'foo': 'bar'})
+
+        self.assertIsNone(RPCCache.get_etag('test_etag_generation', 2))
+
+    def test_etag_without_generation(self):
+        "Test ETag without generation"
+        RPCCache.set_etag('test_etag_without_generation', None, 'foo')
+
+        self.assertIsNone(
+            RPCCache.get_etag('test_etag_without_generation', None))
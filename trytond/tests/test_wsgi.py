@@ -1,12 +1,14 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
 
+import gzip
 import unittest
-from unittest.mock import Mock, sentinel
+from unittest.mock import Mock, patch, sentinel
 
 from werkzeug.test import Client
 from werkzeug.wrappers import Response
 
+from trytond.config import config
 from trytond.exceptions import TrytonException
 from trytond.wsgi import TrytondWSGI
 
@@ -110,3 +112,100 @@ class WSGIAppTestCase(unittest.TestCase):
 
         self.assertEqual(next(response.response), b'baz')
         self.assertEqual(response.status, "418 I'M A TEAPOT")
+
+
+class WSGICompressionTestCase(unittest.TestCase):
+    "Test WSGI response compression"
+
+    def setUp(self):
+        super().setUp()
+        self.app = app = TrytondWSGI()
+
+        @app.route('/data/<int:size>')
+        def _data(request, size):
+            return Response(b'a' * size)
+
+        @app.route('/stream/<int:size>')
+        def _stream(request, size):
+            return Response(b'a' for _ in range(size))
+
+        @app.route('/echo', methods=['POST'])
+        def _echo(request):
+            return Response(request.decoded_data)
+
+    def get(self, url, encoding='gzip'):
+        client = Client(self.app, Response)
+        return client.get(url, headers={'Accept-Encoding': encoding})
+
+    def test_compress(self):
+        "Test response above threshold is compressed"
+        response = self.get('/data/2000')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        self.assertEqual(gzip.decompress(response.data), b'a' * 2000)
+
+    def test_compress_below_threshold(self):
+        "Test response below threshold is not compressed"
+        response = self.get('/data/100')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, b'a' * 100)
+
+    def test_compress_not_accepted(self):
+        "Test response is not compressed without accepted encoding"
+        response = self.get('/data/2000', encoding='br')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, b'a' * 2000)
+
+    def test_compress_disabled(self):
+        "Test response is not compressed with threshold at zero"
+        with patch.object(config, 'getint', return_value=0):
+            response = self.get('/data/2000')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+
+    def test_compress_stream(self):
+        "Test streamed response is compressed"
+        response = self.get('/stream/2000')
+
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertNotIn('Content-Length', response.headers)
+        self.assertEqual(gzip.decompress(response.data), b'a' * 2000)
+
+    def test_compress_stream_below_threshold(self):
+        "Test streamed response below threshold is not compressed"
+        response = self.get('/stream/100')
+
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, b'a' * 100)
+
+    def test_request_gzip(self):
+        "Test request with gzip content"
+        client = Client(self.app, Response)
+
+        response = client.post('/echo', data=gzip.compress(b'foo'),
+            headers={'Content-Encoding': 'gzip'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'foo')
+
+    def test_request_gzip_too_large(self):
+        "Test request with gzip content larger than maximum size"
+        client = Client(self.app, Response)
+        data = b'a' * (config.getint('request', 'max_size') + 1)
+
+        response = client.post('/echo', data=gzip.compress(data),
+            headers={'Content-Encoding': 'gzip'})
+
+        self.assertEqual(response.status_code, 413)
+
+    def test_request_gzip_invalid(self):
+        "Test request with invalid gzip content"
+        client = Client(self.app, Response)
+
+        response = client.post('/echo', data=b'foo',
+            headers={'Content-Encoding': 'gzip'})
+
+        self.assertEqual(response.status_code, 400)
@@ -64,6 +64,8 @@ class Transaction(object):
     create_records = None
     delete_records = None
     trigger_records = None
+    deferred_records = None
+    history_records = None
     check_warnings = None
     timestamp = None
     started_at = None
@@ -125,7 +127,8 @@ class Transaction(object):
             database = backend.Database(database_name).connect()
         Flavor.set(backend.Database.flavor)
         self.connection = database.get_connection(readonly=readonly,
-            autocommit=autocommit, statement_timeout=timeout)
+            autocommit=autocommit, statement_timeout=timeout,
+            min_lsn=(context or {}).get('_replica_lsn'))
         self.user = user
         self.database = database
         self.readonly = readonly
@@ -134,6 +137,8 @@ class Transaction(object):
         self.create_records = defaultdict(set)
         self.delete_records = defaultdict(set)
         self.trigger_records = defaultdict(set)
+        self.deferred_records = {}
+        self.history_records = defaultdict(set)
         self.check_warnings = set()
         self.timestamp = {}
         self.counter = 0
@@ -186,6 +191,8 @@ class Transaction(object):
                     self.create_records = None
                     self.delete_records = None
                     self.trigger_records = None
+                    self.deferred_records = None
+                    self.history_records = None
                     self.timestamp = None
                     self._datamanagers = []
 
@@ -249,9 +256,31 @@ class Transaction(object):
         # the connection pool.
         self._sub_transactions_to_close.append(sub_transaction)
 
+    def flush_validation(self):
+        "Run the validations deferred with the _defer_validation context"
+        from trytond.pool import Pool
+        pool = Pool()
+        while self.deferred_records:
+            key = next(iter(self.deferred_records))
+            name, user, _ = key
+            context, records = self.deferred_records.pop(key)
+            Model = pool.get(name)
+            with self.reset_context(), self.set_user(user), \
+                    self.set_context(context):
+                Model._validate_deferred(records)
+
+    def flush_history(self):
+        "Insert the history of the records buffered"
+        from trytond.pool import Pool
+        pool = Pool()
+        for name in list(self.history_records):
+            pool.get(name)._flush_history()
+
     def commit(self):
         from trytond.cache import Cache
         try:
+            self.flush_validation()
+            self.flush_history()
             if self._datamanagers:
                 for datamanager in self._datamanagers:
                     datamanager.tpc_begin(self)
@@ -287,6 +316,10 @@ class Transaction(object):
         from trytond.cache import Cache
         for cache in self.cache.values():
             cache.clear()
+        if self.deferred_records:
+            self.deferred_records.clear()
+        if self.history_records:
+            self.history_records.clear()
         for sub_transaction in self._sub_transactions:
             sub_transaction.rollback()
         for datamanager in self._datamanagers:
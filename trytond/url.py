@@ -2,13 +2,17 @@
 # this repository contains the full copyright notices and license terms.
 
 import encodings.idna
+import hashlib
+import hmac
 import socket
+import time
 import urllib.parse
 
 from trytond.config import config
 from trytond.transaction import Transaction
 
-__all__ = ['URLMixin', 'is_secure', 'host', 'http_host']
+__all__ = ['URLMixin', 'is_secure', 'host', 'http_host',
+    'binary_url', 'check_binary_url']
 
 HOSTNAME = (config.get('web', 'hostname')
     or socket.getfqdn())
@@ -95,3 +99,36 @@ class URLMixin:
     __slots__ = ()
     __url__ = URLAccessor()
     __href__ = URLAccessor('http')
+
+
+def _binary_signature(database_name, model, name, id, expires):
+    secret = config.get('web', 'secret')
+    message = '/'.join(map(str, [database_name, model, name, id, expires]))
+    return hmac.new(
+        secret.encode('utf-8'), message.encode('utf-8'),
+        hashlib.sha256).hexdigest()
+
+
+def binary_url(model, name, id):
+    "Return the signed URL to download the binary value of the record"
+    # A secret per process would not be shared by the processes serving the
+    # URLs
+    if not config.get('web', 'secret'):
+        raise ValueError("binary URLs require a secret in the web section")
+    database_name = Transaction().database.name
+    expires = int(time.time()) + config.getint('web', 'binary_url_timeout')
+    local_part = urllib.parse.quote('%s/binary/%s/%s/%d' % (
+            database_name, model, name, id))
+    query = urllib.parse.urlencode({
+            'e': expires,
+            's': _binary_signature(database_name, model, name, id, expires),
+            })
+    return '%s/%s?%s' % (http_host(), local_part, query)
+
+
+def check_binary_url(database_name, model, name, id, expires, signature):
+    "Check the signature of the binary URL and that it is not expired"
+    if not config.get('web', 'secret') or expires < time.time():
+        return False
+    return hmac.compare_digest(
+        _binary_signature(database_name, model, name, id, expires), signature)
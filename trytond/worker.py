@@ -1,17 +1,18 @@
 # This file is part of Tryton.  The COPYRIGHT file at the top level of
 # this repository contains the full copyright notices and license terms.
-import datetime as dt
+import gc
 import logging
-import random
 import selectors
 import signal
+import socket
 import time
+import traceback
 from multiprocessing import Pool as MPool
-from multiprocessing import cpu_count
+from multiprocessing import cpu_count, get_context
 
 from sql import Flavor
 
-from trytond import backend
+from trytond import backend, status
 from trytond.config import config
 from trytond.exceptions import UserError, UserWarning
 from trytond.pool import Pool
@@ -23,22 +24,58 @@ logger = logging.getLogger(__name__)
 
 
 class Queue(object):
-    def __init__(self, database_name, mpool):
+    def __init__(self, database_name, mpool, callback=None):
         self.database = backend.Database(database_name).connect()
         self.connection = self.database.get_connection(autocommit=True)
         self.mpool = mpool
+        self.callback = callback
+        # The monotonic time at which the tasks must be pulled
+        self.due = 0
+        # The lanes which left tasks pending because they were busy
+        self.blocked = set()
 
-    def pull(self, name=None):
+    def pull(self, name=None, limit=1, exclude=None):
+        Queue = self.pool.get('ir.queue')
+        return Queue.pull(
+            self.database, self.connection, name=name, limit=limit,
+            exclude=exclude)
+
+    def statistics(self):
+        Queue = self.pool.get('ir.queue')
+        return Queue.statistics(self.connection)
+
+    @property
+    def pool(self):
         database_list = Pool.database_list()
         pool = Pool(self.database.name)
         if self.database.name not in database_list:
             with Transaction().start(self.database.name, 0, readonly=True):
                 pool.init()
-        Queue = pool.get('ir.queue')
-        return Queue.pull(self.database, self.connection, name=name)
+        return pool
 
     def run(self, task_id):
-        return self.mpool.apply_async(run_task, (self.database.name, task_id))
+        task = Task(self.callback)
+        self.mpool.apply_async(
+            run_task, (self.database.name, task_id),
+            callback=task, error_callback=task)
+        return task
+
+
+class Task(object):
+    "A task running in a process which is done when called back"
+
+    def __init__(self, callback=None):
+        self.done = False
+        self.callback = callback
+
+    def __call__(self, result):
+        # The pool calls back before the result is ready
+        self.done = True
+        if self.callback:
+            self.callback(result)
+
+    def ready(self):
+        return self.done
 
 
 class TaskList(list):
@@ -49,6 +86,103 @@ class TaskList(list):
         return self
 
 
+class Lane(object):
+    "The tasks of a queue name with a priority and a concurrency limit"
+
+    def __init__(self, name=None, priority=0, limit=None, exclude=None):
+        self.name = name
+        self.priority = priority
+        self.limit = limit
+        # The names served by the other lanes
+        self.exclude = exclude
+        self.tasks = TaskList()
+
+    def __str__(self):
+        return self.name or '*'
+
+    def free(self, processes):
+        "Return the number of tasks the lane can start"
+        if self.limit is not None:
+            processes = min(processes, self.limit - len(self.tasks))
+        return max(processes, 0)
+
+
+def get_lanes(name=None):
+    "Return the lanes configured in the queue section ordered by priority"
+    lanes = []
+    for line in config.get('queue', 'lanes', default='').splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        lane_name, *values = line.split()
+        priority = int(values[0]) if len(values) > 0 else 0
+        limit = int(values[1]) if len(values) > 1 else None
+        lanes.append(Lane(lane_name, priority, limit))
+    if name:
+        lanes = [lane for lane in lanes if lane.name == name] or [Lane(name)]
+    else:
+        lanes.append(Lane(exclude={lane.name for lane in lanes}))
+    return sorted(lanes, key=lambda lane: lane.priority, reverse=True)
+
+
+def update_metrics(queues, lanes):
+    "Store the running, depth and wait of the lanes in the status"
+    for queue in queues:
+        statistics = queue.statistics()
+        for lane in lanes:
+            if lane.name:
+                values = [statistics.get(lane.name)]
+            else:
+                values = [v for n, v in statistics.items()
+                    if n not in lane.exclude]
+            values = list(filter(None, values))
+            metric = {
+                'running': len(lane.tasks),
+                'depth': sum(v['depth'] for v in values),
+                'wait': max((v['wait'] for v in values), default=0),
+                }
+            status.metrics['queue %s@%s' % (lane, queue.database.name)] = (
+                metric)
+            logger.debug(
+                "lane %s@%s: %d running, %d pending, %ds waiting",
+                lane, queue.database.name,
+                metric['running'], metric['depth'], metric['wait'])
+
+
+def dispatch(queues, lanes, processes, timeout):
+    "Pull the tasks of the due queues and return the time to wait"
+    now = time.monotonic()
+    free = processes - sum(len(lane.tasks.filter()) for lane in lanes)
+    # Pull again the queues with a blocked lane which can start a task
+    due = [q for q in queues
+        if q.due <= now or any(lane.free(free) for lane in q.blocked)]
+    next_ = {}
+    for queue in due:
+        queue.blocked = set()
+    for lane in lanes:
+        for queue in due:
+            lane_free = lane.free(free)
+            if not lane_free:
+                # Pull again when a task is done
+                queue.blocked.add(lane)
+                continue
+            # Prefetch as many tasks as the lane can start
+            task_ids, seconds = queue.pull(
+                lane.name, limit=lane_free, exclude=lane.exclude)
+            if seconds is not None:
+                next_[queue] = min(seconds, next_.get(queue, seconds))
+            if task_ids:
+                lane.tasks.extend(queue.run(i) for i in task_ids)
+                free -= len(task_ids)
+                if len(task_ids) >= lane_free:
+                    queue.blocked.add(lane)
+    for queue in due:
+        # The blocked lanes do not delay the scheduled tasks of the others
+        queue.due = now + min(next_.get(queue) or timeout, timeout)
+    waiting = [q.due for q in queues]
+    return max(min(waiting, default=now + timeout) - now, 0)
+
+
 def work(options):
     Flavor.set(backend.Database.flavor)
     if not config.getboolean('queue', 'worker', default=False):
@@ -58,37 +192,64 @@ def work(options):
     except NotImplementedError:
         processes = 1
     logger.info("start %d workers", processes)
-    mpool = MPool(
-        processes, initializer, (options.database_names,),
-        options.maxtasksperchild)
-    queues = [Queue(name, mpool) for name in options.database_names]
+    if options.preload:
+        # Fork the processes from the initialized pools to share their pages
+        initializer(options.database_names, worker=False)
+        gc.collect()
+        gc.freeze()
+        mpool = get_context('fork').Pool(
+            processes, initializer, (options.database_names,),
+            options.maxtasksperchild)
+    else:
+        mpool = MPool(
+            processes, initializer, (options.database_names,),
+            options.maxtasksperchild)
+    # Wake up the loop when a task is done
+    waker, wakeup = socket.socketpair()
+    waker.setblocking(False)
+    wakeup.setblocking(False)
+
+    def done(result):
+        try:
+            wakeup.send(b'\0')
+        except OSError:
+            pass
 
-    tasks = TaskList()
-    timeout = options.timeout
+    queues = [Queue(name, mpool, done) for name in options.database_names]
+    lanes = get_lanes(options.name)
+
+    metrics_at = 0
     selector = selectors.DefaultSelector()
+    selector.register(waker, selectors.EVENT_READ)
     for queue in queues:
-        selector.register(queue.connection, selectors.EVENT_READ)
+        if queue.database.has_channel():
+            selector.register(queue.connection, selectors.EVENT_READ, queue)
     try:
         while True:
-            while len(tasks.filter()) >= processes:
-                time.sleep(0.1)
-            for queue in queues:
-                task_id, next_ = queue.pull(options.name)
-                timeout = min(
-                    next_ or options.timeout, timeout, options.timeout)
-                if task_id:
-                    tasks.append(queue.run(task_id))
-                    break
-            else:
-                for key, _ in selector.select(timeout=timeout):
-                    connection = key.fileobj
-                    connection.poll()
-                    while connection.notifies:
-                        connection.notifies.pop(0)
+            if time.monotonic() - metrics_at > options.timeout:
+                update_metrics(queues, lanes)
+                metrics_at = time.monotonic()
+            timeout = dispatch(queues, lanes, processes, options.timeout)
+            for key, _ in selector.select(timeout=timeout):
+                if key.fileobj is waker:
+                    try:
+                        while waker.recv(1024):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                connection, queue = key.fileobj, key.data
+                connection.poll()
+                if connection.notifies:
+                    queue.due = 0
+                while connection.notifies:
+                    connection.notifies.pop(0)
     except KeyboardInterrupt:
         mpool.close()
     finally:
         selector.close()
+        waker.close()
+        wakeup.close()
 
 
 def initializer(database_names, worker=True):
@@ -105,7 +266,35 @@ def initializer(database_names, worker=True):
     return pools
 
 
-def run_task(pool, task_id):
+def run(transaction, task, coalesce=True):
+    """Run the task coalesced with similar pending tasks if possible
+    and return the ids of the coalesced tasks to run alone"""
+    Queue = task.__class__
+    others = []
+    try:
+        if coalesce:
+            others = task.coalesce()
+        if others:
+            logger.info(
+                '<Task %s> coalesced with %s', task.id, [t.id for t in others])
+            task.run(others)
+            return []
+    except backend.DatabaseOperationalError:
+        raise
+    except Exception:
+        logger.info(
+            '<Task %s> coalesced failed, running alone', task.id,
+            exc_info=True)
+        transaction.rollback()
+        task = Queue(task.id)
+        # Keep the others claimed to not coalesce them again with the
+        # failing task
+        others = Queue.claim(Queue.browse([t.id for t in others]))
+    task.run()
+    return [t.id for t in others]
+
+
+def run_task(pool, task_id, coalesce=True):
     if not isinstance(pool, Pool):
         database_list = Pool.database_list()
         pool = Pool(pool)
@@ -117,6 +306,7 @@ def run_task(pool, task_id):
     name = '<Task %s@%s>' % (task_id, pool.database_name)
     logger.info('%s started', name)
     retry = config.getint('database', 'retry')
+    others = []
     try:
         for count in range(retry, -1, -1):
             if count != retry:
@@ -129,7 +319,7 @@ def run_task(pool, task_id):
                         # the task was rollbacked, nothing to do
                         break
                     with processing(name):
-                        task.run()
+                        others = run(transaction, task, coalesce=coalesce)
                     break
                 except backend.DatabaseOperationalError:
                     if count:
@@ -140,27 +330,34 @@ def run_task(pool, task_id):
                     Error.log(task, e)
                     raise
         logger.info('%s done', name)
+        for other_id in others:
+            run_task(pool, other_id, coalesce=False)
     except backend.DatabaseOperationalError:
         logger.info('%s failed, retrying', name, exc_info=True)
         if not config.getboolean('queue', 'worker', default=False):
             time.sleep(0.02 * retry)
-        try:
-            with Transaction().start(pool.database_name, 0) as transaction:
-                if not transaction.database.has_channel():
-                    logger.critical('%s failed', name, exc_info=True)
-                    return
-                task = Queue(task_id)
-                if task.scheduled_at and task.enqueued_at < task.scheduled_at:
-                    duration = (task.scheduled_at - task.enqueued_at) * 2
-                else:
-                    duration = dt.timedelta(seconds=2 * retry)
-                duration = max(duration, dt.timedelta(hours=1))
-                scheduled_at = dt.datetime.now() + duration * random.random()
-                Queue.push(task.name, task.data, scheduled_at=scheduled_at)
-        except Exception:
-            logger.critical(
-                'rescheduling %s failed', name, exc_info=True)
+        if not fail_task(pool, task_id, retry=True):
+            logger.critical('%s failed', name, exc_info=True)
     except (UserError, UserWarning):
         logger.info('%s failed', name)
+        fail_task(pool, task_id)
     except Exception:
         logger.critical('%s failed', name, exc_info=True)
+        fail_task(pool, task_id)
+
+
+def fail_task(pool, task_id, retry=False):
+    "Record the current exception on the task and return if it is retried"
+    Queue = pool.get('ir.queue')
+    error = traceback.format_exc()
+    try:
+        with Transaction().start(pool.database_name, 0) as transaction:
+            # Without channel, the workers are not notified of the retry
+            retry = retry and transaction.database.has_channel()
+            task = Queue(task_id)
+            return task.fail(error, retry=retry)
+    except Exception:
+        logger.critical(
+            'recording failure of <Task %s@%s> failed',
+            task_id, pool.database_name, exc_info=True)
+        return False
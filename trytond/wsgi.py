@@ -8,6 +8,8 @@ import posixpath
 import sys
 import traceback
 import urllib.parse
+import zlib
+from itertools import chain
 
 try:
     from http import HTTPStatus
@@ -38,6 +40,11 @@ except ImportError:
 
 import wrapt
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 from trytond.config import config
 from . import opentelemetry
 from trytond.protocols.jsonrpc import JSONProtocol
@@ -60,6 +67,19 @@ class Base64Converter(BaseConverter):
         return base64.urlsafe_b64encode(value.encode('utf-8')).decode('ascii')
 
 
+def _compress(chunks, encoding):
+    "Yield the chunks compressed with the encoding"
+    if encoding == 'zstd':
+        compressor = zstandard.ZstdCompressor().compressobj()
+    else:
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 class TrytondWSGI(object):
 
     def __init__(self):
@@ -105,11 +125,15 @@ class TrytondWSGI(object):
         else:
             max_size = size
         if max_size:
+            request.max_size = max_size
             content_length = request.content_length
             if content_length is None:
                 abort(http.client.LENGTH_REQUIRED)
             elif content_length > max_size:
                 abort(http.client.REQUEST_ENTITY_TOO_LARGE)
+            elif (request.content_encoding == 'gzip'
+                    and len(request.decoded_data) > max_size):
+                abort(http.client.REQUEST_ENTITY_TOO_LARGE)
 
     def dispatch_request(self, request):
         adapter = self.url_map.bind_to_environ(request.environ)
@@ -123,18 +147,22 @@ class TrytondWSGI(object):
                 "Exception when processing %s", request, exc_info=True)
             return e
         except Exception as e:
-            logger.debug(
-                "Exception when processing %s", request, exc_info=True)
-            tb_s = ''.join(traceback.format_exception(*sys.exc_info()))
-            for path in sys.path:
-                tb_s = tb_s.replace(path, '')
-            e.__format_traceback__ = tb_s
-            response = e
-            for error_handler in self.error_handlers:
-                rv = error_handler(self, request, e)
-                if isinstance(rv, Response):
-                    response = rv
-            return response
+            return self.handle_exception(request, e)
+
+    def handle_exception(self, request, e):
+        "Return the response to the exception being handled"
+        logger.debug(
+            "Exception when processing %s", request, exc_info=True)
+        tb_s = ''.join(traceback.format_exception(*sys.exc_info()))
+        for path in sys.path:
+            tb_s = tb_s.replace(path, '')
+        e.__format_traceback__ = tb_s
+        response = e
+        for error_handler in self.error_handlers:
+            rv = error_handler(self, request, e)
+            if isinstance(rv, Response):
+                response = rv
+        return response
 
     def make_response(self, request, data):
         for cls in self.protocols:
@@ -160,6 +188,44 @@ class TrytondWSGI(object):
                     response = Response(data)
         return response
 
+    def compress_response(self, request, response):
+        "Compress the response with the best encoding accepted by the client"
+        threshold = config.getint('web', 'compression_threshold')
+        if (not threshold
+                or request.method == 'HEAD'
+                or response.direct_passthrough
+                or response.status_code in {204, 206, 304}
+                or 'Content-Encoding' in response.headers):
+            return response
+        encodings = ['gzip']
+        if zstandard:
+            encodings.insert(0, 'zstd')
+        encoding = request.accept_encodings.best_match(encodings)
+        if not encoding:
+            return response
+        response.vary.add('Accept-Encoding')
+        if response.is_streamed:
+            # Keep streaming only when the body reaches the threshold
+            chunks, size = [], 0
+            iterator = response.iter_encoded()
+            for chunk in iterator:
+                chunks.append(chunk)
+                size += len(chunk)
+                if size >= threshold:
+                    break
+            else:
+                response.set_data(b''.join(chunks))
+                return response
+            response.response = _compress(chain(chunks, iterator), encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < threshold:
+                return response
+            response.set_data(b''.join(_compress([data], encoding)))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
     def wsgi_app(self, environ, start_response):
         for cls in self.protocols:
             if cls.content_type in environ.get('CONTENT_TYPE', ''):
@@ -190,9 +256,11 @@ class TrytondWSGI(object):
             else:
                 response = data
 
+        if isinstance(response, Response):
+            response = self.compress_response(request, response)
         if origin and isinstance(response, Response):
             response.headers['Access-Control-Allow-Origin'] = origin
-            response.headers['Vary'] = 'Origin'
+            response.vary.add('Origin')
             method = request.headers.get('Access-Control-Request-Method')
             if method:
                 response.headers['Access-Control-Allow-Methods'] = method